@@ -0,0 +1,173 @@
+"""
+Offline benchmark of the API endpoints and the batch path.
+
+Everything runs on localhost: the fake core from test/fake_core.py stands in
+for v2ray, a local check-host API answers ping checks, and a local 204
+endpoint is the probe target.
+
+Run: python bench/run.py [--concurrency 1,8,32] [--requests 64] [--core-delay 0.2]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+
+from main import app
+from tools import pinging
+from tools.aio import map_unordered
+from tools.breaker import host_breaker, server_breaker
+from tools.cache import ping_cache, v2ray_cache
+from tools.timeouts import server_timeouts
+from tools.v2ray_conf_test import check_v2ray_configs_async
+from test.fakes import FAKE_CORE, serve_204, serve_check_host, vless_link
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def summarize(name, concurrency, latencies, errors, elapsed, items=1):
+    """One result row; latencies in seconds, items = checks per request."""
+    ordered = sorted(latencies) or [0.0]
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "checks_per_s": round(len(latencies) * items / elapsed, 1),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 1),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+async def run_load(name, send, total, concurrency, items=1):
+    """Call send(i) total times with at most `concurrency` in flight."""
+    async def timed(i):
+        start = time.perf_counter()
+        ok = await send(i)
+        return ok, time.perf_counter() - start
+
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    async for _, (ok, latency) in map_unordered(timed, range(total), concurrency):
+        if ok:
+            latencies.append(latency)
+        else:
+            errors += 1
+    return summarize(name, concurrency, latencies, errors, time.perf_counter() - start, items)
+
+
+def scenarios(client, web_port, test_url, batch_size):
+    """name -> (send(i) returning success, checks per request)."""
+    def link():
+        # A fresh UUID per request keeps the result cache out of the numbers
+        return vless_link(web_port, uuid=str(uuid.uuid4()))
+
+    async def post(path, body):
+        r = await client.post(path, json=body)
+        return r.status_code == 200
+
+    async def ping(i):
+        return await post("/api/ping", {"host": f"host{i}-{uuid.uuid4().hex[:8]}.example", "max_age": 0})
+
+    async def v2ray(i):
+        return await post("/api/v2ray", {"config_link": link(), "test_url": test_url, "timeout": 5})
+
+    async def test_all(i):
+        return await post("/api/test-all", {"config_link": link(), "test_url": test_url, "timeout": 5,
+                                            "host": f"host{i}-{uuid.uuid4().hex[:8]}.example"})
+
+    async def batch_endpoint(i):
+        links = [link() for _ in range(batch_size)]
+        return await post("/api/v2ray/batch", {"config_links": links, "test_url": test_url, "timeout": 5})
+
+    async def batch_direct(i):
+        links = [link() for _ in range(batch_size)]
+        results = await check_v2ray_configs_async(links, test_url=test_url, timeout=5)
+        return all(r["success"] for r in results)
+
+    return {
+        "ping": (ping, 1),
+        "v2ray": (v2ray, 1),
+        "test-all": (test_all, 1),
+        "v2ray-batch": (batch_endpoint, batch_size),
+        "batch-direct": (batch_direct, batch_size),
+    }
+
+
+def reset_state():
+    """Forget what earlier runs learned, so every scenario starts from the same cold state."""
+    ping_cache.clear()
+    v2ray_cache.clear()
+    server_breaker.reset()
+    host_breaker.reset()
+    server_timeouts.clear()
+
+
+def print_table(rows):
+    columns = ["scenario", "concurrency", "requests", "errors", "rps", "checks_per_s",
+               "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+
+
+async def main(args):
+    web, test_url = serve_204()
+    check_host, check_host_url = serve_check_host()
+    pinging.CHECK_HOST_URL = check_host_url
+    # The local check-host has no quota; by default the limiter is off so pings measure the service, not it
+    rate = pinging.check_host_limiter.rate
+    pinging.check_host_limiter.rate = args.check_host_rate
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    os.environ["FAKE_CORE_START_DELAY"] = str(args.core_delay)
+
+    rows = []
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            available = scenarios(client, web.server_port, test_url, args.batch_size)
+            for name in args.scenarios.split(","):
+                send, items = available[name]
+                for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                    reset_state()
+                    row = await run_load(name, send, args.requests, concurrency, items)
+                    rows.append(row)
+                    print(json.dumps(row), file=sys.stderr)
+    finally:
+        pinging.check_host_limiter.rate = rate
+        del os.environ["V2RAY_PATH"]
+        del os.environ["FAKE_CORE_START_DELAY"]
+        check_host.shutdown()
+        web.shutdown()
+
+    print_table(rows)
+    if args.output:
+        with open(args.output, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark on localhost")
+    parser.add_argument("--scenarios", default="ping,v2ray,test-all,v2ray-batch,batch-direct")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="requests per scenario and level")
+    parser.add_argument("--batch-size", type=int, default=16, help="links per batch request")
+    parser.add_argument("--check-host-rate", type=float, default=0,
+                        help="check-host rate limit in requests/s (default 0: off)")
+    parser.add_argument("--core-delay", type=float, default=0.0, help="fake core startup delay in seconds")
+    parser.add_argument("--output", help="write one JSON row per line to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -1,59 +1,331 @@
 """FastAPI app for V2Ray and ping testing tools."""
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
 from urllib.parse import urlparse
 
-from tools.pinging import ping_from_iran
-from tools.v2ray_conf_test import check_v2ray_config
+from tools import http_client
+from tools.aio import map_unordered
+from tools.breaker import host_breaker, server_breaker
+from tools.bulk_ping import ping_hosts
+from tools.cache import (
+    cached_check_v2ray_config, cached_ping_from_iran, forget_host, forget_server, ping_cache, v2ray_cache
+)
+from tools.distributed import SHARD_SIZE, Coordinator
+from tools.pinging import PING_DEADLINE, check_host_limiter
+from tools.core_pool import CorePool
+from tools.history import HISTORY_DB, HistoryStore, get_history, use_history
+from tools.jobs import JobScheduler, QueueFull
+from tools.metrics import collect_timings, render as render_metrics
+from tools.ranking import history_hints, race_top_k
+from tools.subscription import subscription_links
+from tools.timeouts import server_timeouts
+from tools.throughput import (
+    DEFAULT_DOWNLOAD_URL, DEFAULT_UPLOAD_URL, MAX_BYTES, MAX_SECONDS, MAX_STREAMS, throughput_options
+)
+from tools.v2ray_conf_test import (
+    DEFAULT_TEST_URL, MAX_SAMPLES, check_v2ray_configs_async, config_fingerprint, find_v2ray_exe, parse_config_link,
+    use_warm_pool
+)
+
+
+# One batch runs in a single core with one inbound per link
+MAX_BATCH_LINKS = int(os.environ.get("V2RAY_MAX_BATCH", "1000"))
+
 
+@asynccontextmanager
+async def lifespan(app):
+    """Start the warm core pool when V2RAY_WARM_CORES is set, and the history store unless HISTORY_DB is empty."""
+    pool = None
+    store = None
+    history_db = os.environ.get("HISTORY_DB", HISTORY_DB)
+    if history_db:
+        store = await HistoryStore(history_db).start()
+        use_history(store)
+    warm_cores = int(os.environ.get("V2RAY_WARM_CORES", "0"))
+    v2ray_exe = find_v2ray_exe()
+    if warm_cores > 0 and v2ray_exe:
+        slots = int(os.environ.get("V2RAY_WARM_SLOTS", "8"))
+        pool = await CorePool(v2ray_exe, cores=warm_cores, slots_per_core=slots).start()
+        use_warm_pool(pool)
+    try:
+        yield
+    finally:
+        await scheduler.stop()
+        await http_client.close_client()
+        if pool:
+            use_warm_pool(None)
+            await pool.close()
+        if store:
+            use_history(None)
+            await store.close()
 
-app = FastAPI(title="V2Ray & Ping Testing API", version="1.0.0")
+
+app = FastAPI(title="V2Ray & Ping Testing API", version="1.0.0", lifespan=lifespan)
+scheduler = JobScheduler()
+coordinator = Coordinator()
 
 
 # Models
 class PingRequest(BaseModel):
     host: str
+    deadline: float = PING_DEADLINE
+    max_age: Optional[float] = None
+    force: bool = False
+    timings: bool = False
+
+
+class BulkPingRequest(BaseModel):
+    hosts: List[str]
+    deadline: float = PING_DEADLINE
+    max_age: Optional[float] = None
+    concurrency: int = Field(8, ge=1, le=64)
+    force: bool = False
+
+
+class ThroughputRequest(BaseModel):
+    download_bytes: int = Field(10_000_000, ge=0, le=MAX_BYTES)
+    upload_bytes: int = Field(0, ge=0, le=MAX_BYTES)
+    streams: int = Field(1, ge=1, le=MAX_STREAMS)
+    max_seconds: float = Field(10, gt=0, le=MAX_SECONDS)
+    url: str = DEFAULT_DOWNLOAD_URL
+    upload_url: str = DEFAULT_UPLOAD_URL
 
 
 class V2RayRequest(BaseModel):
     config_link: str
     timeout: int = 10
+    test_url: str = DEFAULT_TEST_URL
+    max_age: Optional[float] = None
+    preflight: bool = False
+    samples: int = Field(1, ge=1, le=MAX_SAMPLES)
+    throughput: Optional[ThroughputRequest] = None
+    force: bool = False
+    timings: bool = False
+
+
+class V2RayBatchRequest(BaseModel):
+    config_links: List[str] = Field(..., max_length=MAX_BATCH_LINKS)
+    timeout: int = 10
+    test_url: str = DEFAULT_TEST_URL
+    preflight: bool = False
+    samples: int = Field(1, ge=1, le=MAX_SAMPLES)
+    throughput: Optional[ThroughputRequest] = None
+    force: bool = False
+
+
+class RankRequest(BaseModel):
+    config_links: List[str]
+    k: int = Field(5, ge=1, le=1000)
+    threshold_ms: Optional[float] = None
+    concurrency: int = Field(8, ge=1, le=256)
+    timeout: int = 10
+    test_url: str = DEFAULT_TEST_URL
+    hints: Dict[str, float] = {}
+    use_history: bool = False
+
+
+class SubscriptionRequest(BaseModel):
+    url: Optional[str] = None
+    content: Optional[str] = None
+    path: Optional[str] = None
+    concurrency: int = Field(8, ge=1, le=256)
+    timeout: int = 10
+    test_url: str = DEFAULT_TEST_URL
+    max_age: Optional[float] = None
+    preflight: bool = False
+    samples: int = Field(1, ge=1, le=MAX_SAMPLES)
+    force: bool = False
+    format: Literal["ndjson", "sse"] = "ndjson"
+
+
+class JobRequest(BaseModel):
+    config_links: List[str] = []
+    hosts: List[str] = []
+    priority: int = 0
+    webhook: Optional[str] = None
+    timeout: int = 10
+    test_url: str = DEFAULT_TEST_URL
+    ping_deadline: float = PING_DEADLINE
+    max_age: Optional[float] = None
+    preflight: bool = False
+    samples: int = Field(1, ge=1, le=MAX_SAMPLES)
+    throughput: Optional[ThroughputRequest] = None
+    force: bool = False
 
 
 class TestAllRequest(BaseModel):
     config_link: str
     host: Optional[str] = None
     timeout: int = 10
+    test_url: str = DEFAULT_TEST_URL
+    ping_deadline: float = PING_DEADLINE
+    max_age: Optional[float] = None
+    preflight: bool = False
+    samples: int = Field(1, ge=1, le=MAX_SAMPLES)
+    force: bool = False
+    timings: bool = False
+
+
+class DistributedRequest(BaseModel):
+    config_links: List[str]
+    timeout: int = 10
+    test_url: str = DEFAULT_TEST_URL
+    preflight: bool = False
+    samples: int = Field(1, ge=1, le=MAX_SAMPLES)
+    throughput: Optional[ThroughputRequest] = None
+    force: bool = False
+    shard_size: int = Field(SHARD_SIZE, ge=1, le=1000)
+
+
+class LeaseRequest(BaseModel):
+    worker: str
+    wait: float = Field(0, ge=0, le=60)
+
+
+class ShardResults(BaseModel):
+    worker: str
+    shard_id: str
+    results: List[Dict]
+
+
+def throughput_of(request):
+    """Throughput options of a request, or None when it did not ask for a measurement."""
+    if request.throughput is None:
+        return None
+    try:
+        return throughput_options(**request.throughput.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def with_timings(response, timings, start):
+    """Attach the collected phase timings and the total handler time to a response."""
+    response["timings"] = {**timings, "total_ms": round((time.perf_counter() - start) * 1000, 1)}
+    return response
 
 
 # Endpoints
 @app.post("/api/ping")
-def ping(request: PingRequest):
+async def ping(request: PingRequest):
     """Check host from Iran nodes."""
-    result = ping_from_iran(request.host)
+    start = time.perf_counter()
+    with collect_timings() as timings:
+        result = await cached_ping_from_iran(
+            request.host, deadline=request.deadline, max_age=request.max_age, force=request.force
+        )
     
     if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
     
-    return {"success": True, "host": request.host, "nodes": result["data"]}
+    response = {"success": True, "host": request.host, "complete": result["complete"], "nodes": result["data"]}
+    return with_timings(response, timings, start) if request.timings else response
+
+
+@app.post("/api/ping/bulk")
+async def ping_bulk(request: BulkPingRequest):
+    """Check many hosts from Iran nodes with one shared result poller."""
+    results = await ping_hosts(
+        request.hosts, deadline=request.deadline, max_age=request.max_age, submit_concurrency=request.concurrency,
+        force=request.force
+    )
+    return {
+        "results": [
+            {
+                "host": host,
+                "success": "error" not in result,
+                "complete": result.get("complete", False),
+                "nodes": result.get("data", []),
+                "error": result.get("error"),
+            }
+            for host, result in results.items()
+        ]
+    }
 
 
 @app.post("/api/v2ray")
-def v2ray(request: V2RayRequest):
+async def v2ray(request: V2RayRequest):
     """Test V2Ray config."""
-    success, message, latency = check_v2ray_config(request.config_link, timeout=request.timeout)
+    throughput = throughput_of(request)
+    start = time.perf_counter()
+    with collect_timings() as timings:
+        result = await cached_check_v2ray_config(
+            request.config_link, test_url=request.test_url, timeout=request.timeout,
+            max_age=request.max_age, preflight=request.preflight, samples=request.samples,
+            throughput=throughput, force=request.force
+        )
+    
+    response = {**result, "config": request.config_link}
+    return with_timings(response, timings, start) if request.timings else response
+
+
+@app.post("/api/v2ray/batch")
+async def v2ray_batch(request: V2RayBatchRequest):
+    """Test many V2Ray configs inside one v2ray process."""
+    results = await check_v2ray_configs_async(
+        request.config_links, test_url=request.test_url, timeout=request.timeout, preflight=request.preflight,
+        samples=request.samples, throughput=throughput_of(request), force=request.force
+    )
     
     return {
-        "success": success,
-        "message": message,
-        "latency_ms": latency,
-        "config": request.config_link
+        "results": [{**result, "config": link} for link, result in zip(request.config_links, results)]
     }
 
 
+@app.post("/api/v2ray/rank")
+async def v2ray_rank(request: RankRequest):
+    """Find the K fastest working configs, stopping early once they are known."""
+    hints = await history_hints(request.config_links) if request.use_history else {}
+    return await race_top_k(
+        request.config_links, k=request.k, threshold_ms=request.threshold_ms,
+        concurrency=request.concurrency, test_url=request.test_url, timeout=request.timeout,
+        hints={**hints, **request.hints}
+    )
+
+
+@app.post("/api/subscription")
+async def subscription(request: SubscriptionRequest):
+    """Test every config of a subscription, streaming each result as it finishes."""
+    try:
+        links = subscription_links(url=request.url, content=request.content, path=request.path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def check(link):
+        return await cached_check_v2ray_config(
+            link, test_url=request.test_url, timeout=request.timeout,
+            max_age=request.max_age, preflight=request.preflight, samples=request.samples, force=request.force
+        )
+
+    def encode(record):
+        if request.format == "sse":
+            return f"data: {json.dumps(record)}\n\n"
+        return json.dumps(record) + "\n"
+
+    async def results():
+        tested = 0
+        try:
+            async for link, result in map_unordered(check, links, request.concurrency):
+                tested += 1
+                yield encode({**result, "config": link})
+        except Exception as e:
+            yield encode({"error": str(e)})
+        if request.format == "sse":
+            yield f"event: done\ndata: {json.dumps({'tested': tested})}\n\n"
+
+    media_type = "text/event-stream" if request.format == "sse" else "application/x-ndjson"
+    return StreamingResponse(results(), media_type=media_type)
+
+
 @app.post("/api/test-all")
-def test_all(request: TestAllRequest):
+async def test_all(request: TestAllRequest):
     """Test V2Ray and ping together."""
     # Extract host from config if not provided
     host = request.host
@@ -63,32 +335,248 @@ def test_all(request: TestAllRequest):
         if not host:
             raise HTTPException(status_code=400, detail="Cannot extract host from config")
     
-    # Test V2Ray
-    v2ray_success, v2ray_msg, v2ray_latency = check_v2ray_config(
-        request.config_link, 
-        timeout=request.timeout
-    )
-    
-    # Test Ping
-    ping_result = ping_from_iran(host)
+    # Test V2Ray and ping at the same time
+    start = time.perf_counter()
+    with collect_timings() as timings:
+        v2ray_result, ping_result = await asyncio.gather(
+            cached_check_v2ray_config(
+                request.config_link, test_url=request.test_url, timeout=request.timeout,
+                max_age=request.max_age, preflight=request.preflight, samples=request.samples, force=request.force
+            ),
+            cached_ping_from_iran(host, deadline=request.ping_deadline, max_age=request.max_age, force=request.force)
+        )
     
-    return {
-        "v2ray": {
-            "success": v2ray_success,
-            "message": v2ray_msg,
-            "latency_ms": v2ray_latency
-        },
+    response = {
+        "v2ray": v2ray_result,
         "ping": {
             "success": "error" not in ping_result,
             "host": host,
+            "complete": ping_result.get("complete", False),
             "nodes": ping_result.get("data", []),
             "error": ping_result.get("error")
         }
     }
+    return with_timings(response, timings, start) if request.timings else response
+
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(request: JobRequest):
+    """Queue V2Ray and ping checks and return a job id right away."""
+    options = {
+        "timeout": request.timeout,
+        "test_url": request.test_url,
+        "ping_deadline": request.ping_deadline,
+        "max_age": request.max_age,
+        "preflight": request.preflight,
+        "samples": request.samples,
+        "throughput": throughput_of(request),
+        "force": request.force,
+    }
+    try:
+        job = scheduler.submit(
+            request.config_links, request.hosts,
+            priority=request.priority, options=options, webhook=request.webhook
+        )
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    
+    return {"job_id": job.id, "status": job.status, "total": job.total}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=60)):
+    """Job status and results so far. Pass `wait` to long-poll until the job is done."""
+    job = scheduler.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    if wait and job.status != "done":
+        await scheduler.wait(job, wait)
+    return job.to_dict()
+
+
+@app.get("/api/jobs")
+async def job_stats():
+    """Queue depth and job counts by status."""
+    return scheduler.stats()
+
+
+@app.post("/api/distributed", status_code=202)
+async def create_distributed_run(request: DistributedRequest):
+    """Split config links into shards for the workers (`python -m tools worker`) and return a run id right away."""
+    options = {
+        "test_url": request.test_url,
+        "timeout": request.timeout,
+        "preflight": request.preflight,
+        "samples": request.samples,
+        "throughput": throughput_of(request),
+        "force": request.force,
+    }
+    try:
+        run = coordinator.submit(request.config_links, options, shard_size=request.shard_size)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"run_id": run.id, "status": run.status, "total": len(run.config_links), "shards": len(run.shards)}
+
+
+@app.get("/api/distributed/{run_id}")
+async def get_distributed_run(run_id: str, wait: float = Query(0, ge=0, le=60)):
+    """Run status and results so far. Pass `wait` to long-poll until every shard is done."""
+    run = coordinator.get(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if wait and run.status != "done":
+        await coordinator.wait(run, wait)
+    return run.to_dict()
+
+
+@app.get("/api/workers")
+async def worker_stats():
+    """Shard queue depth and the workers seen in the last minute."""
+    return coordinator.stats()
+
+
+@app.post("/api/workers/lease")
+async def lease_shard(request: LeaseRequest):
+    """Worker protocol: lease the next shard, long-polling up to `wait` seconds. 204 when there is no work."""
+    lease = await coordinator.lease(request.worker, request.wait)
+    if lease is None:
+        return Response(status_code=204)
+    return lease
+
+
+@app.post("/api/workers/results")
+async def complete_shard(request: ShardResults):
+    """Worker protocol: results of a leased shard, in the order of its config_links."""
+    try:
+        accepted = coordinator.complete(request.worker, request.shard_id, request.results)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Shard not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"accepted": accepted}
+
+
+@app.get("/api/cache")
+async def cache_stats():
+    """Hit/miss counters of the result caches."""
+    return {"ping": ping_cache.stats(), "v2ray": v2ray_cache.stats()}
+
+
+@app.get("/api/http-client")
+async def http_client_stats():
+    """Request, retry and connection reuse counters of the check-host client, plus its rate limiter."""
+    return {**http_client.stats(), "rate_limit": check_host_limiter.stats()}
+
+
+@app.get("/api/breakers")
+async def breaker_states(limit: int = Query(100, ge=1, le=10000)):
+    """Circuit breaker counters and the servers and hosts that are currently suspended."""
+    return {
+        name: {**breaker.stats(), "suspended": breaker.snapshot(limit)}
+        for name, breaker in (("v2ray", server_breaker), ("ping", host_breaker))
+    }
+
+
+@app.get("/api/breakers/{kind}")
+async def breaker_state(kind: Literal["v2ray", "ping"], key: str):
+    """Breaker state of one server (address:port) or ping host."""
+    breaker = server_breaker if kind == "v2ray" else host_breaker
+    return breaker.describe(key.strip().lower() if kind == "ping" else key)
+
+
+@app.delete("/api/breakers")
+async def reset_breakers(kind: Optional[Literal["v2ray", "ping"]] = None, key: Optional[str] = None):
+    """
+    Close breakers: one key of a kind, every key of a kind, or everything.
+
+    Cached results of the same keys are dropped too, so the next check really runs.
+    """
+    if key is not None and kind is None:
+        raise HTTPException(status_code=400, detail="key needs kind")
+    breakers = {"v2ray": (server_breaker, forget_server), "ping": (host_breaker, forget_host)}
+    if kind is not None:
+        breakers = {kind: breakers[kind]}
+    if key is not None and kind == "ping":
+        key = key.strip().lower()
+    return {
+        "reset": {name: breaker.reset(key) for name, (breaker, _) in breakers.items()},
+        "uncached": {name: forget(key) for name, (_, forget) in breakers.items()},
+    }
+
+
+@app.get("/api/timeouts")
+async def timeout_stats(server: Optional[str] = None):
+    """Adaptive timeout counters, or the latency estimate of one server (address:port)."""
+    if server is None:
+        return server_timeouts.stats()
+    estimate = server_timeouts.estimate(server)
+    if estimate is None:
+        raise HTTPException(status_code=404, detail="No estimate for this server")
+    return {"server": server, **estimate}
+
+
+def history_store():
+    store = get_history()
+    if store is None:
+        raise HTTPException(status_code=503, detail="History is disabled (HISTORY_DB is empty)")
+    return store
+
+
+def fingerprint_of(config_link):
+    outbound, failure = parse_config_link(config_link)
+    if failure:
+        raise HTTPException(status_code=400, detail=failure["message"])
+    return config_fingerprint(outbound)
+
+
+@app.get("/api/history/v2ray/latest")
+async def v2ray_latest(config_link: str):
+    """Most recent stored result for a config."""
+    fingerprint = fingerprint_of(config_link)
+    latest = await history_store().latest_v2ray(fingerprint)
+    if latest is None:
+        raise HTTPException(status_code=404, detail="Config never tested")
+    return latest
+
+
+@app.get("/api/history/v2ray/series")
+async def v2ray_series(config_link: str, window: float = Query(3600, gt=0)):
+    """Latency time series of a config over the last `window` seconds."""
+    fingerprint = fingerprint_of(config_link)
+    points = await history_store().v2ray_series(fingerprint, time.time() - window)
+    return {"fingerprint": fingerprint, "points": points}
+
+
+@app.get("/api/history/v2ray/best")
+async def v2ray_best(limit: int = Query(10, ge=1, le=1000), window: float = Query(3600, gt=0)):
+    """Fastest configs whose latest result in the last `window` seconds was a success."""
+    return {"configs": await history_store().best_v2ray(time.time() - window, limit)}
+
+
+@app.get("/api/history/ping/latest")
+async def ping_latest(host: str):
+    """Most recent stored ping result for a host."""
+    latest = await history_store().latest_ping(host.strip().lower())
+    if latest is None:
+        raise HTTPException(status_code=404, detail="Host never pinged")
+    return latest
+
+
+@app.get("/api/history")
+async def history_stats():
+    """Pending and written row counts of the history store."""
+    return history_store().stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Phase histograms, outcome counters and live gauges in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/health")
-def health():
+async def health():
     """Health check."""
     return {"status": "ok"}
 
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the v2ray binary used by the offline tests.
+Run: fake_core.py run -c config.json      (or -c stdin: to read the config from stdin)
+     fake_core.py api ado --server=127.0.0.1:PORT outbounds.json      (or stdin:)
+     fake_core.py api rmo --server=127.0.0.1:PORT TAG...
+
+Opens every SOCKS inbound in the config and routes it by inbound tag to an
+outbound. A vless outbound is "alive" when its vnext address accepts TCP
+connections; traffic is then relayed directly to the requested target.
+The dokodemo-door inbound tagged "api" accepts outbound add/remove commands,
+one JSON line per connection.
+
+FAKE_CORE_NOISE=N writes N log lines to each of stdout and stderr before
+starting, to exercise pipe draining.
+FAKE_CORE_START_DELAY=S waits S seconds before opening any inbound, like a
+slow real core.
+"""
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+config_lock = threading.Lock()
+
+
+def read_json(path):
+    """Load a JSON file, or stdin for "stdin:" like v2ray does."""
+    if path == "stdin:":
+        return json.load(sys.stdin)
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_config(args):
+    """Read the config passed with -c."""
+    return read_json(args[args.index("-c") + 1])
+
+
+def pick_outbound(config, inbound_tag):
+    """Resolve an inbound tag to its outbound through the routing rules."""
+    with config_lock:
+        outbounds = list(config.get("outbounds", []))
+    by_tag = {o.get("tag"): o for o in outbounds}
+    for rule in config.get("routing", {}).get("rules", []):
+        if inbound_tag in rule.get("inboundTag", []):
+            return by_tag.get(rule.get("outboundTag"))
+    return outbounds[0] if outbounds else None
+
+
+def server_alive(outbound):
+    """Check that the outbound's server accepts connections."""
+    if not outbound:
+        return False
+    if outbound.get("protocol") != "vless":
+        return True
+    server = outbound["settings"]["vnext"][0]
+    try:
+        socket.create_connection((server["address"], server["port"]), timeout=2).close()
+        return True
+    except OSError:
+        return False
+
+
+def recv_exact(conn, size):
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("client closed")
+        data += chunk
+    return data
+
+
+def relay(src, dst):
+    try:
+        while True:
+            data = src.recv(65536)
+            if not data:
+                break
+            dst.sendall(data)
+    except OSError:
+        pass
+    finally:
+        try:
+            dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+def handle_socks(conn, config, inbound_tag):
+    """Serve one SOCKS5 CONNECT request."""
+    try:
+        _, nmethods = recv_exact(conn, 2)
+        recv_exact(conn, nmethods)
+        conn.sendall(b"\x05\x00")
+
+        _, cmd, _, atyp = recv_exact(conn, 4)
+        if atyp == 1:
+            host = socket.inet_ntoa(recv_exact(conn, 4))
+        elif atyp == 3:
+            host = recv_exact(conn, recv_exact(conn, 1)[0]).decode()
+        else:
+            host = socket.inet_ntop(socket.AF_INET6, recv_exact(conn, 16))
+        port = struct.unpack("!H", recv_exact(conn, 2))[0]
+
+        outbound = pick_outbound(config, inbound_tag)
+        if cmd != 1 or not server_alive(outbound):
+            conn.sendall(b"\x05\x05\x00\x01\x00\x00\x00\x00\x00\x00")
+            return
+
+        target = socket.create_connection((host, port), timeout=5)
+        conn.sendall(b"\x05\x00\x00\x01\x00\x00\x00\x00\x00\x00")
+        threading.Thread(target=relay, args=(target, conn), daemon=True).start()
+        relay(conn, target)
+    except (OSError, ConnectionError):
+        pass
+
+
+def serve_inbound(config, inbound):
+    """Accept SOCKS clients on one inbound forever."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((inbound.get("listen", "127.0.0.1"), inbound["port"]))
+    server.listen(128)
+
+    def loop():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(
+                target=handle_socks, args=(conn, config, inbound.get("tag")), daemon=True
+            ).start()
+
+    threading.Thread(target=loop, daemon=True).start()
+
+
+def handle_api(conn, config):
+    """Apply one HandlerService command sent by `fake_core.py api`."""
+    with conn, conn.makefile("rw") as stream:
+        command = json.loads(stream.readline())
+        with config_lock:
+            if command["cmd"] == "ado":
+                config["outbounds"].extend(command["outbounds"])
+            elif command["cmd"] == "rmo":
+                config["outbounds"] = [
+                    o for o in config["outbounds"] if o.get("tag") not in command["tags"]
+                ]
+        stream.write("ok\n")
+
+
+def serve_api(config, inbound):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((inbound.get("listen", "127.0.0.1"), inbound["port"]))
+    server.listen(16)
+
+    def loop():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=handle_api, args=(conn, config), daemon=True).start()
+
+    threading.Thread(target=loop, daemon=True).start()
+
+
+def api_command(args):
+    """Client side of the control API, mirroring `v2ray api ado|rmo`."""
+    command, rest = args[0], args[1:]
+    server = next(a.split("=", 1)[1] for a in rest if a.startswith("--server="))
+    values = [a for a in rest if not a.startswith("--")]
+    if command == "ado":
+        message = {"cmd": "ado", "outbounds": read_json(values[0])["outbounds"]}
+    elif command == "rmo":
+        message = {"cmd": "rmo", "tags": values}
+    else:
+        print(f"unsupported api command: {command}", file=sys.stderr)
+        return 1
+
+    host, port = server.rsplit(":", 1)
+    with socket.create_connection((host, int(port)), timeout=5) as conn, conn.makefile("rw") as stream:
+        stream.write(json.dumps(message) + "\n")
+        stream.flush()
+        return 0 if stream.readline().strip() == "ok" else 1
+
+
+def main(args):
+    if args and args[0] == "api":
+        return api_command(args[1:])
+    if not args or args[0] != "run":
+        print(f"unsupported command: {args}", file=sys.stderr)
+        return 1
+
+    for i in range(int(os.environ.get("FAKE_CORE_NOISE", "0"))):
+        print(f"[Debug] noise line {i} " + "x" * 100, flush=True)
+        print(f"[Debug] noise line {i} " + "x" * 100, file=sys.stderr, flush=True)
+
+    time.sleep(float(os.environ.get("FAKE_CORE_START_DELAY", "0")))
+
+    config = load_config(args)
+    for inbound in config.get("inbounds", []):
+        if inbound.get("protocol") == "socks":
+            serve_inbound(config, inbound)
+        elif inbound.get("tag") == "api":
+            serve_api(config, inbound)
+
+    print("V2Ray 5.0.0 (fake core) started", flush=True)
+    threading.Event().wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,143 @@
+"""Local stand-ins used by the offline tests."""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_CORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_core.py")
+
+
+class _NoContentHandler(BaseHTTPRequestHandler):
+    """Answers every GET with 204, like generate_204."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 turns bursts of connects into SYN-retransmit stalls
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def serve(handler):
+    """Start a threaded HTTP server on a free port and return it."""
+    server = _Server(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serve_204():
+    """Start a local generate_204 endpoint. Returns (server, url)."""
+    server = serve(_NoContentHandler)
+    return server, f"http://127.0.0.1:{server.server_port}/generate_204"
+
+
+IRAN_NODES = {
+    "ir1.node.check-host.net": ["ir", "Iran", "Tehran", "185.1.1.1", "AS1"],
+    "ir2.node.check-host.net": ["ir", "Iran", "Shiraz", "185.2.2.2", "AS2"],
+    "de1.node.check-host.net": ["de", "Germany", "Frankfurt", "5.1.1.1", "AS3"],
+}
+
+
+def serve_check_host(delays=None, status=200, reply=None, broken_results=False):
+    """
+    Start a local check-host.net API. Returns (server, base_url).
+
+    delays maps node id -> seconds until that node reports; unlisted nodes answer at once.
+    reply is what every node reports (default: two OK pings and a timeout).
+    broken_results=True answers every check-result poll with a body that is not JSON.
+    The server counts .submitted checks and .polls, and keeps the node ids each
+    check named explicitly in .named_nodes.
+    """
+    delays = delays or {}
+    checks = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.startswith("/check-ping"):
+                if status != 200:
+                    return self.reply(status, {"error": "limit"})
+                request_id = uuid.uuid4().hex
+                checks[request_id] = time.monotonic()
+                server.submitted += 1
+                server.named_nodes.append(parse_qs(urlparse(self.path).query).get("node", []))
+                return self.reply(200, {"ok": 1, "request_id": request_id, "nodes": IRAN_NODES})
+
+            request_id = self.path.rsplit("/", 1)[-1]
+            server.polls += 1
+            if broken_results:
+                self.send_response(200)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                return self.wfile.write(b"<>")
+            elapsed = time.monotonic() - checks[request_id]
+            results = {}
+            for node_id in IRAN_NODES:
+                if elapsed < delays.get(node_id, 0):
+                    results[node_id] = None
+                else:
+                    results[node_id] = reply or [[["OK", 0.05, "10.0.0.1"], ["OK", 0.06], ["TIMEOUT", 3.0]]]
+            return self.reply(200, results)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = serve(Handler)
+    server.submitted = 0
+    server.named_nodes = []
+    server.polls = 0
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def closed_port():
+    """Return a local port that nothing listens on."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def free_port_range(count):
+    """Return (first, last) of `count` consecutive local ports that are free right now."""
+    while True:
+        first = closed_port()
+        if first + count - 1 > 65535:
+            continue
+        sockets = []
+        try:
+            for port in range(first, first + count):
+                s = socket.socket()
+                sockets.append(s)
+                s.bind(("127.0.0.1", port))
+        except OSError:
+            continue
+        finally:
+            for s in sockets:
+                s.close()
+        return first, first + count - 1
+
+
+def vless_link(port, host="127.0.0.1", uuid="12345678-1234-1234-1234-123456789abc"):
+    """Build a plain VLESS link pointing at host:port."""
+    return f"vless://{uuid}@{host}:{port}?encryption=none&security=none&type=tcp"
@@ -4,7 +4,9 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from fastapi.testclient import TestClient
-from main import app
+from main import MAX_BATCH_LINKS, app
+from tools import pinging
+from test.fakes import FAKE_CORE, serve_204, serve_check_host, vless_link
 
 client = TestClient(app)
 
@@ -70,6 +72,106 @@ def test_test_all_custom_host():
     print("  ✅ Test-all works - custom host")
 
 
+def test_v2ray_batch_endpoint():
+    """Test batch V2Ray endpoint"""
+    response = client.post("/api/v2ray/batch", json={
+        "config_links": [
+            "vless://test@example.com:443?encryption=none&security=none&type=tcp",
+            "vmess://unsupported",
+        ],
+        "timeout": 2
+    })
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == 2
+    assert results[1]["success"] is False
+    assert results[1]["config"] == "vmess://unsupported"
+    print(f"  ✅ V2Ray batch works - {[r['message'] for r in results]}")
+
+
+def test_v2ray_batch_too_large():
+    """Test that a batch over MAX_BATCH_LINKS is rejected before any core starts"""
+    response = client.post("/api/v2ray/batch", json={
+        "config_links": ["vmess://unsupported"] * (MAX_BATCH_LINKS + 1),
+    })
+    assert response.status_code == 422, f"Expected 422, got {response.status_code}"
+    print(f"  ✅ Batch of {MAX_BATCH_LINKS + 1} links rejected")
+
+
+def test_test_all_offline():
+    """Test combined endpoint against the fake core and fake check-host"""
+    web, url = serve_204()
+    check_host, check_host_url = serve_check_host()
+    pinging.CHECK_HOST_URL = check_host_url
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        response = client.post("/api/test-all", json={
+            "config_link": vless_link(web.server_port),
+            "test_url": url,
+            "timeout": 3
+        })
+    finally:
+        del os.environ["V2RAY_PATH"]
+        pinging.CHECK_HOST_URL = "https://check-host.net"
+        check_host.shutdown()
+        web.shutdown()
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["ping"]["success"] is True and data["ping"]["complete"] is True
+    assert data["ping"]["host"] == "127.0.0.1"
+    assert data["v2ray"]["success"] is True, data["v2ray"]
+    print(f"  ✅ Test-all offline - {data['v2ray']['message']}, {len(data['ping']['nodes'])} nodes")
+
+
+def test_cache_stats_endpoint():
+    """Test cache stats endpoint"""
+    response = client.get("/api/cache")
+    assert response.status_code == 200
+    data = response.json()
+    for name in ["ping", "v2ray"]:
+        for key in ["hits", "misses", "coalesced", "entries"]:
+            assert key in data[name], f"{name} stats should have '{key}'"
+    print(f"  ✅ Cache stats - {data['v2ray']}")
+
+
+def test_timings_and_metrics():
+    """Test the opt-in timings block and the /metrics endpoint"""
+    web, url = serve_204()
+    check_host, check_host_url = serve_check_host()
+    pinging.CHECK_HOST_URL = check_host_url
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        response = client.post("/api/test-all", json={
+            "config_link": vless_link(web.server_port),
+            "test_url": url,
+            "timeout": 3,
+            "max_age": 0,
+            "timings": True
+        })
+    finally:
+        del os.environ["V2RAY_PATH"]
+        pinging.CHECK_HOST_URL = "https://check-host.net"
+        check_host.shutdown()
+        web.shutdown()
+
+    assert response.status_code == 200
+    timings = response.json()["timings"]
+    for key in ["parse_ms", "config_write_ms", "spawn_ms", "ready_ms", "probe_ms", "teardown_ms"]:
+        assert key in timings["v2ray"], f"v2ray timings should have '{key}': {timings}"
+    for key in ["submit_ms", "wait_ms", "fetch_ms", "parse_ms"]:
+        assert key in timings["ping"], f"ping timings should have '{key}': {timings}"
+    assert timings["total_ms"] > 0
+
+    text = client.get("/metrics").text
+    assert 'v2ray_check_phase_seconds_count{phase="spawn"}' in text
+    assert 'ping_phase_seconds_bucket{phase="submit",le="+Inf"}' in text
+    assert 'check_results_total{kind="v2ray",outcome="success"}' in text
+    assert "v2ray_core_processes 0" in text, "No core should be left running"
+    assert 'checks_in_flight{kind="v2ray"} 0' in text
+    print(f"  ✅ Timings: {timings}")
+
+
 def run_all_tests():
     """Run all API tests"""
     tests = [
@@ -78,6 +180,11 @@ def run_all_tests():
         ("V2Ray Endpoint", test_v2ray_endpoint),
         ("Test All - Auto Host", test_test_all_endpoint),
         ("Test All - Custom Host", test_test_all_custom_host),
+        ("V2Ray Batch Endpoint", test_v2ray_batch_endpoint),
+        ("V2Ray Batch Too Large", test_v2ray_batch_too_large),
+        ("Test All - Offline", test_test_all_offline),
+        ("Cache Stats", test_cache_stats_endpoint),
+        ("Timings And Metrics", test_timings_and_metrics),
     ]
     
     print("\n" + "="*50)
@@ -0,0 +1,192 @@
+"""
+Tests for the circuit breakers that suspend failing servers and hosts.
+Run: python test/test_breaker.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from main import app
+from tools import pinging
+from tools.breaker import CircuitBreaker, host_breaker, server_breaker
+from tools.timeouts import server_timeouts
+from tools.v2ray_conf_test import (
+    check_result, check_v2ray_config_async, check_v2ray_configs_async, learn_from_probe, parse_vless_link
+)
+from test.fakes import FAKE_CORE, closed_port, serve_204, serve_check_host, vless_link
+
+
+def test_open_half_open_closed():
+    """Test that a key opens after `threshold` failures, lets one trial through later and closes on success"""
+    breaker = CircuitBreaker("test", threshold=3, base_seconds=0.2, max_seconds=1)
+    for _ in range(2):
+        breaker.record("a", False)
+    assert breaker.check("a") is None, "Below the threshold checks still run"
+    breaker.record("a", False)
+    assert breaker.check("a") is not None, "Three failures open the breaker"
+    assert breaker.describe("a")["state"] == "open"
+
+    time.sleep(0.25)
+    assert breaker.check("a") is None, "After the window one trial runs"
+    assert breaker.check("a") is not None, "Only one trial at a time"
+    breaker.record("a", False)
+    assert 0.2 < breaker.describe("a")["retry_in_s"] <= 0.4, "A failed trial doubles the window"
+    assert breaker.describe("a")["trips"] == 2
+
+    time.sleep(0.45)
+    assert breaker.check("a") is None
+    breaker.record("a", True)
+    assert breaker.describe("a")["state"] == "closed" and breaker.check("a") is None, "A success closes it"
+
+    off = CircuitBreaker("off", threshold=0)
+    for _ in range(5):
+        off.record("a", False)
+    assert off.check("a") is None, "Threshold 0 turns the breaker off"
+    print(f"  ✅ {breaker.stats()}")
+
+
+def test_dead_server_suspended():
+    """Test that a dead server is answered without a core after three failures, unless forced"""
+    web, url = serve_204()
+    port = closed_port()
+    link = vless_link(port)
+    server_breaker.reset()
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        failures = [asyncio.run(check_v2ray_config_async(link, test_url=url, timeout=2)) for _ in range(3)]
+        start = time.monotonic()
+        suspended = asyncio.run(check_v2ray_config_async(link, test_url=url, timeout=2))
+        elapsed = time.monotonic() - start
+        forced = asyncio.run(check_v2ray_config_async(link, test_url=url, timeout=2, force=True))
+        client = TestClient(app)
+        states = client.get("/api/breakers").json()
+        reset = client.delete("/api/breakers", params={"kind": "v2ray", "key": f"127.0.0.1:{port}"})
+        bad = client.delete("/api/breakers", params={"key": "x"})
+        after = asyncio.run(check_v2ray_config_async(link, test_url=url, timeout=2))
+    finally:
+        del os.environ["V2RAY_PATH"]
+        server_breaker.reset()
+        web.shutdown()
+
+    assert not any(f["success"] for f in failures) and not any(f.get("suspended") for f in failures), failures
+    assert suspended["suspended"] is True and suspended["retry_in_s"] > 0, suspended
+    assert elapsed < 0.5, f"A suspended check should not start a core ({elapsed:.2f}s)"
+    assert not forced.get("suspended"), forced
+    assert len(states["v2ray"]["suspended"]) == 1, states
+    assert reset.json()["reset"] == {"v2ray": 1}, reset.json()
+    assert bad.status_code == 400
+    assert not after.get("suspended"), "A reset server is tested again"
+    print(f"  ✅ {suspended['message']}")
+
+
+def test_tightened_timeouts_not_failures():
+    """Test that a timeout at a learned deadline tighter than the caller's does not count against the server"""
+    outbound = parse_vless_link(vless_link(closed_port()))
+    timeout = check_result(False, "Timeout")
+    refused = check_result(False, "Connection refused")
+    try:
+        for _ in range(3):
+            learn_from_probe(outbound, check_result(True, "OK", latency_ms=10), 5, 5)
+        verdicts = [learn_from_probe(outbound, timeout, 1, 5) for _ in range(3)]
+        full = learn_from_probe(outbound, timeout, 5, 5)
+        other = learn_from_probe(outbound, refused, 1, 5)
+    finally:
+        server_timeouts.clear()
+
+    assert verdicts == [None] * 3, f"Timeouts at a tightened deadline prove nothing: {verdicts}"
+    assert full is False, "A timeout at the caller's full timeout is a failure"
+    assert other is False, "Other errors are failures at any deadline"
+    print("  ✅ Only full-timeout timeouts count")
+
+
+def test_one_failure_per_server():
+    """Test that a batch with several links on one dead server counts one failure"""
+    web, url = serve_204()
+    port = closed_port()
+    links = [vless_link(port, uuid=f"12345678-1234-1234-1234-12345678900{i}") for i in range(3)]
+    server_breaker.reset()
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        results = asyncio.run(check_v2ray_configs_async(links, test_url=url, timeout=2))
+        state = server_breaker.describe(f"127.0.0.1:{port}")
+        preflight = asyncio.run(check_v2ray_configs_async(links, test_url=url, timeout=2, preflight=True))
+        after_preflight = server_breaker.describe(f"127.0.0.1:{port}")
+    finally:
+        del os.environ["V2RAY_PATH"]
+        server_breaker.reset()
+        web.shutdown()
+
+    assert not any(r["success"] for r in results + preflight), results + preflight
+    assert state["failures"] == 1, f"Three links on one server should count once: {state}"
+    assert after_preflight["failures"] == 2 and after_preflight["state"] == "closed", after_preflight
+    print(f"  ✅ {len(links)} links, {state['failures']} failure per batch")
+
+
+def test_down_host_suspended():
+    """Test that pings of a host no node can reach are suspended after three checks"""
+    server, url = serve_check_host(reply=[[["TIMEOUT", 3.0], ["TIMEOUT", 3.0]]])
+    pinging.CHECK_HOST_URL = url
+    host_breaker.reset()
+    try:
+        downs = [asyncio.run(pinging.ping_from_iran_async("Down.example", poll_interval=0.05)) for _ in range(3)]
+        submitted = server.submitted
+        suspended = asyncio.run(pinging.ping_from_iran_async("down.example", poll_interval=0.05))
+        forced = asyncio.run(pinging.ping_from_iran_async("down.example", poll_interval=0.05, force=True))
+        state = TestClient(app).get("/api/breakers/ping", params={"key": "DOWN.example"}).json()
+    finally:
+        pinging.CHECK_HOST_URL = "https://check-host.net"
+        host_breaker.reset()
+        server.shutdown()
+
+    assert all(pinging.host_down(d) for d in downs), downs
+    assert suspended.get("suspended") is True, suspended
+    assert server.submitted == submitted + 1, "Only the forced ping should reach check-host"
+    assert not forced.get("suspended"), forced
+    assert state["state"] == "open" and state["failures"] == 4, state
+    print(f"  ✅ {suspended['error']}")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("Open, Half-Open, Closed", test_open_half_open_closed),
+        ("Dead Server Suspended", test_dead_server_suspended),
+        ("Tightened Timeouts Not Failures", test_tightened_timeouts_not_failures),
+        ("One Failure Per Server", test_one_failure_per_server),
+        ("Down Host Suspended", test_down_host_suspended),
+    ]
+
+    print("\n" + "="*50)
+    print("Running Circuit Breaker Tests")
+    print("="*50 + "\n")
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
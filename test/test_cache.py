@@ -0,0 +1,237 @@
+"""
+Tests for the result cache.
+Run: python test/test_cache.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from main import app
+from tools import pinging
+from tools.breaker import server_breaker
+from tools.cache import ResultCache, cached_check_v2ray_config, cached_ping_from_iran, ping_cache, v2ray_cache
+from test.fakes import FAKE_CORE, closed_port, serve_204, serve_check_host, vless_link
+
+
+def test_lru_eviction():
+    """Test that the least recently used entry is evicted first"""
+    cache = ResultCache(max_entries=2, success_ttl=60, failure_ttl=60)
+    cache.put("a", 1, True)
+    cache.put("b", 2, True)
+    cache.get("a")
+    cache.put("c", 3, True)
+
+    assert cache.get("a") == 1, "Recently used entry should stay"
+    assert cache.get("b") is None, "Least recently used entry should be evicted"
+    assert cache.get("c") == 3
+    print("  ✅ LRU eviction works")
+
+
+def test_separate_ttls():
+    """Test that failures expire sooner than successes"""
+    cache = ResultCache(success_ttl=60, failure_ttl=0.05)
+    cache.put("ok", "fine", True)
+    cache.put("bad", "broken", False)
+    time.sleep(0.1)
+
+    assert cache.get("ok") == "fine", "Success should still be cached"
+    assert cache.get("bad") is None, "Failure should have expired"
+    print("  ✅ Success and failure TTLs are separate")
+
+
+def test_single_flight():
+    """Test that concurrent identical calls share one run"""
+    cache = ResultCache()
+    calls = []
+
+    async def slow_check():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(
+            *(cache.get_or_run("key", slow_check, lambda r: True) for _ in range(5))
+        )
+
+    results = asyncio.run(run())
+
+    assert results == ["result"] * 5
+    assert len(calls) == 1, f"Check should run once, ran {len(calls)} times"
+    assert cache.stats()["misses"] == 1 and cache.stats()["coalesced"] == 4
+    print(f"  ✅ Coalesced: {cache.stats()}")
+
+
+def test_max_age_bypass():
+    """Test that max_age=0 forces a fresh run"""
+    cache = ResultCache()
+    calls = []
+
+    async def check():
+        calls.append(1)
+        return len(calls)
+
+    async def run():
+        first = await cache.get_or_run("key", check, lambda r: True)
+        cached = await cache.get_or_run("key", check, lambda r: True)
+        fresh = await cache.get_or_run("key", check, lambda r: True, max_age=0)
+        return first, cached, fresh
+
+    assert asyncio.run(run()) == (1, 1, 2)
+    assert cache.stats()["hits"] == 1
+    print("  ✅ max_age bypasses the cache")
+
+
+def test_cancelled_leader():
+    """Test that cancelling the leading call does not cancel the callers coalesced onto it"""
+    cache = ResultCache()
+    calls = []
+
+    async def slow_check():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "result"
+
+    async def run():
+        leader = asyncio.create_task(cache.get_or_run("key", slow_check, lambda r: True))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(cache.get_or_run("key", slow_check, lambda r: True)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        return leader.cancelled(), results
+
+    cancelled, results = asyncio.run(run())
+
+    assert cancelled, "The leader itself is cancelled"
+    assert results == ["result"] * 3, results
+    assert len(calls) == 2, f"One follower should take over the check, ran {len(calls)} times"
+    print(f"  ✅ Followers took over: {cache.stats()}")
+
+
+def test_v2ray_key_options():
+    """Test that a V2Ray result is only reused for the same timeout and pre-flight setting"""
+    web, url = serve_204()
+    link = vless_link(web.server_port)
+    v2ray_cache.clear()
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        async def run():
+            for timeout, preflight in ((3, False), (3, False), (5, False), (5, True)):
+                await cached_check_v2ray_config(link, test_url=url, timeout=timeout, preflight=preflight)
+
+        misses = v2ray_cache.misses
+        hits = v2ray_cache.hits
+        asyncio.run(run())
+    finally:
+        del os.environ["V2RAY_PATH"]
+        v2ray_cache.clear()
+        web.shutdown()
+
+    assert v2ray_cache.hits - hits == 1, "Only the repeated check should hit"
+    assert v2ray_cache.misses - misses == 3, "Another timeout or pre-flight setting is another entry"
+    print("  ✅ timeout and preflight are part of the key")
+
+
+def test_breaker_reset_uncaches():
+    """Test that suspended results are not cached and a breaker reset drops the server's cached results"""
+    web, url = serve_204()
+    port = closed_port()
+    link = vless_link(port)
+    v2ray_cache.clear()
+    server_breaker.reset()
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        failed = asyncio.run(cached_check_v2ray_config(link, test_url=url, timeout=2))
+        cached_before = len(v2ray_cache.entries)
+        for _ in range(3):
+            server_breaker.record(f"127.0.0.1:{port}", False)
+        suspended = asyncio.run(cached_check_v2ray_config(link, test_url=url, timeout=3))
+        cached_suspended = len(v2ray_cache.entries)
+        reset = TestClient(app).delete("/api/breakers", params={"kind": "v2ray", "key": f"127.0.0.1:{port}"}).json()
+        keys = [json.loads(key) for key in v2ray_cache.entries]
+    finally:
+        del os.environ["V2RAY_PATH"]
+        v2ray_cache.clear()
+        server_breaker.reset()
+        web.shutdown()
+
+    assert not failed["success"] and not failed.get("suspended"), failed
+    assert suspended.get("suspended") is True, suspended
+    assert cached_suspended == cached_before == 1, "Only the real failure should be cached"
+    assert reset == {"reset": {"v2ray": 1}, "uncached": {"v2ray": 1}}, reset
+    assert keys == [], f"The reset server's results should be gone: {keys}"
+    print(f"  ✅ {reset}")
+
+
+def test_incomplete_ping_not_cached():
+    """Test that a ping cut short by a short deadline is not served to a caller with a longer one"""
+    server, url = serve_check_host(delays={"ir2.node.check-host.net": 0.5})
+    pinging.CHECK_HOST_URL = url
+    rate = pinging.check_host_limiter.rate
+    pinging.check_host_limiter.rate = 0
+    ping_cache.clear()
+    try:
+        short = asyncio.run(cached_ping_from_iran("slow.example", deadline=0.3))
+        full = asyncio.run(cached_ping_from_iran("slow.example", deadline=30))
+        again = asyncio.run(cached_ping_from_iran("slow.example", deadline=30))
+    finally:
+        pinging.check_host_limiter.rate = rate
+        pinging.CHECK_HOST_URL = "https://check-host.net"
+        ping_cache.clear()
+        server.shutdown()
+
+    assert short["complete"] is False, short
+    assert full["complete"] is True, f"The longer deadline should run its own check: {full}"
+    assert again == full and server.submitted == 2, "Only the complete result should be cached"
+    print(f"  ✅ {server.submitted} checks for a short, a full and a cached ping")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("LRU Eviction", test_lru_eviction),
+        ("Separate TTLs", test_separate_ttls),
+        ("Single Flight", test_single_flight),
+        ("Max Age Bypass", test_max_age_bypass),
+        ("Cancelled Leader", test_cancelled_leader),
+        ("V2Ray Key Options", test_v2ray_key_options),
+        ("Breaker Reset Uncaches", test_breaker_reset_uncaches),
+        ("Incomplete Ping Not Cached", test_incomplete_ping_not_cached),
+    ]
+    
+    print("\n" + "="*50)
+    print("Running Cache Tests")
+    print("="*50 + "\n")
+    
+    passed = 0
+    failed = 0
+    
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+    
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+    
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,197 @@
+"""
+Tests for the warm core pool, run against the fake core.
+Run: python test/test_core_pool.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+
+from tools.core_pool import CorePool
+from tools.core_process import CoreProcess
+from tools.metrics import live_cores
+from tools.v2ray_conf_test import check_v2ray_config_async, parse_vless_link, probe_config, use_warm_pool
+from test.fakes import FAKE_CORE, closed_port, serve_204, vless_link
+
+
+def test_hot_swap_outbounds():
+    """Test that one warm core serves alive and dead outbounds in turn"""
+    server, url = serve_204()
+
+    async def run():
+        pool = await CorePool(FAKE_CORE, cores=1, slots_per_core=1).start()
+        try:
+            alive = await pool.check(parse_vless_link(vless_link(server.server_port)), url, 3)
+            dead = await pool.check(parse_vless_link(vless_link(closed_port())), url, 3)
+            alive_again = await pool.check(parse_vless_link(vless_link(server.server_port)), url, 3)
+            return alive, dead, alive_again, pool.cores[0].process
+        finally:
+            await pool.close()
+
+    try:
+        alive, dead, alive_again, process = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    assert alive["success"] is True, f"Alive outbound should succeed: {alive}"
+    assert dead["success"] is False, f"Dead outbound should fail: {dead}"
+    assert alive_again["success"] is True, f"Slot should be reusable: {alive_again}"
+    assert process is not None, "Core should have stayed up between tests"
+    print(f"  ✅ Hot swap works: {alive['message']}, {dead['message']}, {alive_again['message']}")
+
+
+def test_dead_core_restarts():
+    """Test that a killed warm core is restarted on the next lease"""
+    server, url = serve_204()
+
+    async def run():
+        pool = await CorePool(FAKE_CORE, cores=1, slots_per_core=2).start()
+        try:
+            pool.cores[0].process.kill()
+            await pool.cores[0].process.wait()
+            return await pool.check(parse_vless_link(vless_link(server.server_port)), url, 3)
+        finally:
+            await pool.close()
+
+    try:
+        result = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    assert result["success"] is True, f"Check should succeed after restart: {result}"
+    print("  ✅ Dead core restarted")
+
+
+def test_stale_slot_unbind():
+    """Test that a slot from before a core restart cannot detach the restarted core's outbound"""
+    server, url = serve_204()
+    outbound = parse_vless_link(vless_link(server.server_port))
+
+    async def run():
+        pool = await CorePool(FAKE_CORE, cores=1, slots_per_core=1).start()
+        try:
+            stale = await pool._take_slot()
+            await stale.bind(outbound)
+            # The core dies mid-test; the next lease restarts it
+            pool.cores[0].process.kill()
+            await pool.cores[0].process.wait()
+            pool.free_slots.put_nowait(stale)
+            fresh = await pool._take_slot()
+            await fresh.bind(outbound)
+            before = await probe_config(fresh.port, url, 3)
+            # The old test finishes and tears down its slot of the same index
+            await stale.unbind()
+            after = await probe_config(fresh.port, url, 3)
+            return stale, fresh, before, after, pool.cores[0].alive()
+        finally:
+            await pool.close()
+
+    try:
+        stale, fresh, before, after, alive = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    assert fresh.outbound_tag == stale.outbound_tag and not stale.current(), "Same tag, earlier generation"
+    assert before["success"] is True, before
+    assert after["success"] is True, f"The fresh slot should keep its outbound: {after}"
+    assert alive, "The restarted core should not be killed by the stale unbind"
+    print(f"  ✅ {before['message']} before and {after['message']} after the stale unbind")
+
+
+def test_check_through_pool():
+    """Test that check_v2ray_config uses the warm pool when enabled"""
+    server, url = serve_204()
+    link = vless_link(server.server_port)
+
+    async def run():
+        pool = await CorePool(FAKE_CORE, cores=2, slots_per_core=2).start()
+        use_warm_pool(pool)
+        try:
+            results = await asyncio.gather(
+                *(check_v2ray_config_async(link, test_url=url, timeout=3) for _ in range(8))
+            )
+            return results, pool.free_slots.qsize()
+        finally:
+            use_warm_pool(None)
+            await pool.close()
+
+    try:
+        results, slots = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    assert all(r["success"] for r in results), f"All pooled checks should succeed: {results}"
+    print(f"  ✅ {len(results)} checks shared {slots} slots")
+
+
+def test_spawn_cancelled_during_write():
+    """Test that a spawn cancelled while writing the config kills its process"""
+    spawned = []
+
+    class TrackedCore(CoreProcess):
+        def __init__(self, process):
+            super().__init__(process)
+            spawned.append(self)
+
+    async def run():
+        before = live_cores.get()
+        # The child never reads stdin, so the write blocks on a full pipe
+        task = asyncio.create_task(TrackedCore.spawn(
+            sys.executable, "-c", "import time; time.sleep(30)", input=b"x" * (4 << 20)
+        ))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return before, live_cores.get()
+
+    before, after = asyncio.run(run())
+
+    assert len(spawned) == 1, "The process should have been started"
+    assert spawned[0].returncode is not None, "The cancelled spawn should not leave its process running"
+    assert after == before, f"live_cores should be back to {before}, got {after}"
+    print(f"  ✅ Process stopped (exit code {spawned[0].returncode})")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("Hot Swap Outbounds", test_hot_swap_outbounds),
+        ("Dead Core Restarts", test_dead_core_restarts),
+        ("Stale Slot Unbind", test_stale_slot_unbind),
+        ("Check Through Pool", test_check_through_pool),
+        ("Spawn Cancelled During Write", test_spawn_cancelled_during_write),
+    ]
+    
+    print("\n" + "="*50)
+    print("Running Core Pool Tests")
+    print("="*50 + "\n")
+    
+    passed = 0
+    failed = 0
+    
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+    
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+    
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
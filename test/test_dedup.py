@@ -0,0 +1,112 @@
+"""
+Tests for config fingerprinting and link deduplication.
+Run: python test/test_dedup.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uuid
+
+from tools.dedup import BloomFilter, SeenSet, dedupe_links, link_key
+from tools.v2ray_conf_test import check_v2ray_configs
+from test.fakes import FAKE_CORE, serve_204, vless_link
+
+
+def test_near_duplicates_share_fingerprint():
+    """Test that remarks, parameter order and UUID case don't change the fingerprint"""
+    base = "vless://12345678-1234-1234-1234-123456789abc@example.com:443?security=tls&type=tcp&sni=a.example"
+    same = [
+        base + "#remark",
+        "vless://12345678-1234-1234-1234-123456789ABC@example.com:443?sni=a.example&type=tcp&security=tls#other",
+        "vless://12345678-1234-1234-1234-123456789abc@EXAMPLE.com:443?encryption=none&security=tls&sni=a.example",
+    ]
+    different = [
+        base.replace(":443", ":8443"),
+        base.replace("sni=a.example", "sni=b.example"),
+        "vless://12345678123412341234123456789abc@example.com:443?security=tls&type=tcp&sni=a.example",
+    ]
+
+    key = link_key(base)
+    assert all(link_key(link) == key for link in same), "Near-duplicates should share the fingerprint"
+    assert all(link_key(link) != key for link in different), "Real differences should change it"
+    assert link_key("not a link") == "not a link"
+
+    groups = dedupe_links([base] + same + different)
+    assert list(groups) == [base] + different
+    assert groups[base] == [base] + same
+    print(f"  ✅ {len(same) + 1} links, one fingerprint")
+
+
+def test_bloom_filter():
+    """Test that the Bloom filter never misses a key and rarely invents one"""
+    bloom = BloomFilter(10000, error_rate=0.01)
+    keys = [uuid.uuid4().hex for _ in range(10000)]
+    repeated = [bloom.add(key) for key in keys]
+    false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+
+    assert all(key in bloom for key in keys), "No false negatives"
+    assert sum(repeated) < 200, f"New keys taken for duplicates: {sum(repeated)}"
+    assert false_positives < 200, f"False positive rate too high: {false_positives / 10000:.2%}"
+    assert len(bloom.bits) < 15000, "About 1.2 bytes per key at 1%"
+
+    seen = SeenSet(capacity=100)
+    assert [seen.add(k) for k in ["a", "b", "a"]] == [False, False, True]
+    assert seen.stats()["mode"] == "bloom" and seen.stats()["duplicates"] == 1
+    print(f"  ✅ {false_positives} false positives in 10000, {len(bloom.bits)} bytes")
+
+
+def test_batch_fans_out():
+    """Test that a batch probes each fingerprint once and copies the result to every link"""
+    server, url = serve_204()
+    link = vless_link(server.server_port)
+    links = [link + "#a", vless_link(server.server_port, uuid=str(uuid.uuid4())), link + "#b", link]
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        results = check_v2ray_configs(links, test_url=url, timeout=3)
+    finally:
+        del os.environ["V2RAY_PATH"]
+        server.shutdown()
+
+    assert all(r[0] for r in results), results
+    assert results[0] == results[2] == results[3], "Duplicates should share one probe"
+    print(f"  ✅ {len(links)} links, {len(set(results))} probes")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("Near Duplicates Share Fingerprint", test_near_duplicates_share_fingerprint),
+        ("Bloom Filter", test_bloom_filter),
+        ("Batch Fans Out", test_batch_fans_out),
+    ]
+
+    print("\n" + "="*50)
+    print("Running Dedup Tests")
+    print("="*50 + "\n")
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
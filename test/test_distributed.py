@@ -0,0 +1,179 @@
+"""
+Tests for the coordinator/worker mode.
+Run: python test/test_distributed.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+
+import httpx
+
+from main import app
+from tools import distributed
+from tools.distributed import Coordinator, run_worker, split_port_range
+from tools.v2ray_conf_test import release_ports, reserve_ports, set_port_range
+from test.fakes import FAKE_CORE, free_port_range, serve_204, vless_link
+
+
+OPTIONS = {"test_url": "", "timeout": 3, "preflight": False, "samples": 1, "throughput": None, "force": False}
+
+
+def shard_links(count):
+    return [vless_link(443 + i, host="example.com") for i in range(count)]
+
+
+async def distributed_run(links, workers, shard_size):
+    """
+    Submit links over the API, drain them with in-process workers, return (run, peak, stats).
+
+    peak is the most shards that were being tested at the same moment.
+    """
+    check = distributed.check_v2ray_configs_async
+    testing = 0
+    peak = 0
+
+    async def counted_check(*args, **kwargs):
+        nonlocal testing, peak
+        testing += 1
+        peak = max(peak, testing)
+        try:
+            return await check(*args, **kwargs)
+        finally:
+            testing -= 1
+
+    distributed.check_v2ray_configs_async = counted_check
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://coordinator") as client:
+            r = await client.post("/api/distributed", json={"config_links": links, "test_url": OPTIONS["test_url"],
+                                                             "timeout": 3, "shard_size": shard_size})
+            assert r.status_code == 202, r.text
+            await asyncio.gather(*(
+                run_worker("http://coordinator", f"w{i}", shards=1, wait=0, once=True, client=client)
+                for i in range(workers)
+            ))
+            run = (await client.get(f"/api/distributed/{r.json()['run_id']}")).json()
+            stats = (await client.get("/api/workers")).json()
+    finally:
+        distributed.check_v2ray_configs_async = check
+    return run, peak, stats
+
+
+def test_workers_drain_run():
+    """Test that workers test every shard, duplicates are fanned out, and workers test shards side by side"""
+    web, url = serve_204()
+    OPTIONS["test_url"] = url
+    links = [vless_link(web.server_port, uuid=f"12345678-1234-1234-1234-12345678900{i}") for i in range(4)]
+    links.append(links[0] + "#copy")
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    os.environ["FAKE_CORE_START_DELAY"] = "0.3"
+    try:
+        one, one_peak, _ = asyncio.run(distributed_run(links, workers=1, shard_size=1))
+        many, many_peak, stats = asyncio.run(distributed_run(links, workers=4, shard_size=1))
+    finally:
+        del os.environ["V2RAY_PATH"]
+        del os.environ["FAKE_CORE_START_DELAY"]
+        web.shutdown()
+
+    for run in (one, many):
+        assert run["status"] == "done" and run["shards"] == 4 and run["completed"] == 5, run
+        assert all(result["success"] for result in run["results"]), run["results"]
+        assert [result["config"] for result in run["results"]] == links, "Results follow input order"
+        assert run["results"][4]["duplicate_of"] == links[0], run["results"][4]
+    assert len({result["worker"] for result in many["results"]}) > 1, "Shards should spread over the workers"
+    assert {worker["worker"] for worker in stats["workers"]} >= {"w0", "w1"}, stats
+    assert one_peak == 1, f"One worker tests one shard at a time, got {one_peak}"
+    assert many_peak > 1, "Workers should test shards at the same time"
+    print(f"  ✅ 1 worker: {one_peak} shard at a time, 4 workers: up to {many_peak}")
+
+
+def test_stragglers_reassigned():
+    """Test that an expired lease is handed to another worker and idle workers get backup copies"""
+    async def scenario():
+        coordinator = Coordinator(lease_seconds=0.2, straggler_seconds=60)
+        run = coordinator.submit(shard_links(2), OPTIONS, shard_size=1)
+        first = await coordinator.lease("slow")
+        second = await coordinator.lease("fast")
+        assert coordinator.complete("fast", second["shard_id"], [{"success": True}]) is True
+        assert await coordinator.lease("fast") is None, "The slow lease is still valid"
+        retried = await coordinator.lease("fast", wait=2)
+        assert retried["shard_id"] == first["shard_id"] and run.reassigned == 1, retried
+        assert coordinator.complete("slow", first["shard_id"], [{"success": False}]) is True, "Late results still count"
+        assert coordinator.complete("fast", first["shard_id"], [{"success": True}]) is False, "Only the first copy wins"
+        assert run.status == "done" and run.results[0]["worker"] == "slow", run.to_dict()
+
+        backups = Coordinator(straggler_seconds=0)
+        run = backups.submit(shard_links(1), OPTIONS)
+        leases = [await backups.lease(worker) for worker in ("a", "b", "c")]
+        assert leases[1]["shard_id"] == leases[0]["shard_id"] and leases[2] is None, f"Up to 2 copies: {leases}"
+        assert backups.complete("b", leases[0]["shard_id"], [{"success": True}]) is True
+        assert run.copies == 1 and run.status == "done"
+        try:
+            backups.complete("a", leases[0]["shard_id"], [])
+            raise AssertionError("A wrong result count should be refused")
+        except ValueError:
+            pass
+
+    asyncio.run(scenario())
+    print("  ✅ expired lease reassigned, backup copy raced")
+
+
+def test_port_ranges():
+    """Test that ports come from the configured range and ranges split without overlap"""
+    assert split_port_range((20000, 20999), 4) == [(20000, 20249), (20250, 20499), (20500, 20749), (20750, 20999)]
+    first, last = free_port_range(4)
+    set_port_range((first, last))
+    try:
+        ports = reserve_ports(3)
+        assert all(first <= port <= last for port in ports) and len(set(ports)) == 3, ports
+        try:
+            reserve_ports(2)
+            raise AssertionError("Only one port should be left")
+        except RuntimeError:
+            pass
+        release_ports(ports)
+        assert len(reserve_ports(4)) == 4
+    finally:
+        release_ports(range(first, last + 1))
+        set_port_range(None)
+    print(f"  ✅ {ports}")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("Workers Drain Run", test_workers_drain_run),
+        ("Stragglers Reassigned", test_stragglers_reassigned),
+        ("Port Ranges", test_port_ranges),
+    ]
+
+    print("\n" + "="*50)
+    print("Running Distributed Mode Tests")
+    print("="*50 + "\n")
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
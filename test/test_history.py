@@ -0,0 +1,154 @@
+"""
+Tests for the SQLite result history.
+Run: python test/test_history.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import tempfile
+import time
+
+from fastapi.testclient import TestClient
+
+from main import app
+from tools import history, pinging
+from tools.history import FLUSH_INTERVAL, HistoryStore
+from test.fakes import FAKE_CORE, closed_port, serve_204, serve_check_host, vless_link
+
+
+def result(success, latency):
+    return {"success": success, "message": "Success (204)" if success else "Timeout", "latency_ms": latency}
+
+
+def test_best_configs():
+    """Test that best ranks by latency and skips configs whose latest check failed"""
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            store = await HistoryStore(os.path.join(tmp, "history.db")).start()
+            now = time.time()
+            store.add_v2ray("fast", "vless://fast", result(True, 50), now - 20)
+            store.add_v2ray("fast", "vless://fast", result(True, 70), now - 10)
+            store.add_v2ray("slow", "vless://slow", result(True, 300), now - 10)
+            store.add_v2ray("broken", "vless://broken", result(True, 10), now - 20)
+            store.add_v2ray("broken", "vless://broken", result(False, -1), now - 5)
+            store.add_v2ray("old", "vless://old", result(True, 5), now - 7200)
+            await store.flush()
+            best = await store.best_v2ray(now - 3600, 10)
+            series = await store.v2ray_series("fast", now - 3600)
+            stats = store.stats()
+            await store.close()
+            return best, series, stats
+
+    best, series, stats = asyncio.run(run())
+
+    assert [row["fingerprint"] for row in best] == ["fast", "slow"], best
+    assert best[0]["avg_latency_ms"] == 60 and best[0]["checks"] == 2, best[0]
+    assert [point["latency_ms"] for point in series] == [50, 70], series
+    assert stats["written"] == 6 and stats["flushes"] == 1, stats
+    print(f"  ✅ Best: {[(r['config'], r['avg_latency_ms']) for r in best]}")
+
+
+def test_failed_flush_retried():
+    """Test that a failing write keeps the rows and the writer task running"""
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            store = await HistoryStore(os.path.join(tmp, "history.db")).start()
+            store.db.execute("DROP TABLE ping_results")
+            store.add_ping("a.example", {"complete": True, "data": []})
+            await asyncio.sleep(0.2)
+            failed = store.stats()
+            store.db.executescript(history.SCHEMA)
+            await asyncio.sleep(0.2)
+            recovered = store.stats()
+            alive = not store.writer.done()
+            await store.close()
+            return failed, recovered, alive
+
+    history.FLUSH_INTERVAL = 0.05
+    try:
+        failed, recovered, alive = asyncio.run(run())
+    finally:
+        history.FLUSH_INTERVAL = FLUSH_INTERVAL
+
+    assert failed["failed_flushes"] >= 1 and failed["pending"] == 1, failed
+    assert "no such table" in failed["last_error"], failed
+    assert recovered["written"] == 1 and recovered["pending"] == 0, recovered
+    assert alive, "The writer should survive a failed flush"
+    print(f"  ✅ {failed['failed_flushes']} failed flushes, then written")
+
+
+def test_history_endpoints():
+    """Test that checks made through the API land in the history and can be queried"""
+    web, url = serve_204()
+    check_host, check_host_url = serve_check_host()
+    pinging.CHECK_HOST_URL = check_host_url
+    alive = vless_link(web.server_port)
+    dead = vless_link(closed_port())
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["HISTORY_DB"] = os.path.join(tmp.name, "history.db")
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        with TestClient(app) as client:
+            client.post("/api/v2ray/batch", json={"config_links": [alive, dead], "test_url": url, "timeout": 3})
+            client.post("/api/ping", json={"host": "History.example.com", "max_age": 0})
+            time.sleep(FLUSH_INTERVAL + 0.5)
+            latest = client.get("/api/history/v2ray/latest", params={"config_link": alive}).json()
+            series = client.get("/api/history/v2ray/series", params={"config_link": alive}).json()
+            best = client.get("/api/history/v2ray/best").json()
+            ping = client.get("/api/history/ping/latest", params={"host": "history.example.com"}).json()
+            unknown = client.get("/api/history/v2ray/latest", params={"config_link": vless_link(1)})
+    finally:
+        del os.environ["V2RAY_PATH"]
+        del os.environ["HISTORY_DB"]
+        pinging.CHECK_HOST_URL = "https://check-host.net"
+        check_host.shutdown()
+        web.shutdown()
+        tmp.cleanup()
+
+    assert latest["success"] == 1 and latest["config"] == alive, latest
+    assert len(series["points"]) == 1, series
+    assert [row["config"] for row in best["configs"]] == [alive], best
+    assert ping["complete"] == 1 and ping["ok_nodes"] > 0, ping
+    assert unknown.status_code == 404
+    print(f"  ✅ Latest: {latest['message']}, ping ok nodes {ping['ok_nodes']}")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("Best Configs", test_best_configs),
+        ("Failed Flush Retried", test_failed_flush_retried),
+        ("History Endpoints", test_history_endpoints),
+    ]
+
+    print("\n" + "="*50)
+    print("Running History Tests")
+    print("="*50 + "\n")
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,134 @@
+"""
+Tests for the pooled, retrying HTTP client.
+Run: python test/test_http_client.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+from http.server import BaseHTTPRequestHandler
+
+from tools import http_client
+from test.fakes import serve
+
+
+def flaky_server(failures, status=503):
+    """Server that answers `status` for the first `failures` requests, then 200."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            server.hits += 1
+            code = status if server.hits <= failures else 200
+            self.send_response(code)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = serve(Handler)
+    server.hits = 0
+    return server, f"http://127.0.0.1:{server.server_port}/"
+
+
+def run_with_client(coro_func):
+    async def run():
+        try:
+            return await coro_func()
+        finally:
+            await http_client.close_client()
+
+    return asyncio.run(run())
+
+
+def test_retries_server_errors():
+    """Test that 5xx and 429 responses are retried until success"""
+    for status in (503, 429):
+        server, url = flaky_server(2, status)
+        http_client.BACKOFF_BASE = 0.01
+        try:
+            response = run_with_client(lambda: http_client.get(url))
+        finally:
+            http_client.BACKOFF_BASE = 0.5
+            server.shutdown()
+        assert response.status_code == 200, f"Should recover from {status}"
+        assert server.hits == 3, f"Expected 3 attempts, got {server.hits}"
+    print("  ✅ 503 and 429 retried")
+
+
+def test_gives_up_after_retries():
+    """Test that the last error response is returned once retries run out"""
+    server, url = flaky_server(100)
+    http_client.BACKOFF_BASE = 0.01
+    try:
+        response = run_with_client(lambda: http_client.get(url, retries=1))
+    finally:
+        http_client.BACKOFF_BASE = 0.5
+        server.shutdown()
+
+    assert response.status_code == 503
+    assert server.hits == 2
+    print("  ✅ Gave up after 1 retry")
+
+
+def test_connection_reuse():
+    """Test that sequential requests share one keep-alive connection"""
+    server, url = flaky_server(0)
+    before = http_client.stats()
+
+    async def many():
+        for _ in range(5):
+            await http_client.get(url)
+
+    try:
+        run_with_client(many)
+    finally:
+        server.shutdown()
+
+    after = http_client.stats()
+    assert after["new_connections"] - before["new_connections"] == 1, after
+    assert after["reused_connections"] - before["reused_connections"] == 4, after
+    print(f"  ✅ Reuse rate {after['reuse_rate']}")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("Retries Server Errors", test_retries_server_errors),
+        ("Gives Up After Retries", test_gives_up_after_retries),
+        ("Connection Reuse", test_connection_reuse),
+    ]
+    
+    print("\n" + "="*50)
+    print("Running HTTP Client Tests")
+    print("="*50 + "\n")
+    
+    passed = 0
+    failed = 0
+    
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+    
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+    
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,212 @@
+"""
+Tests for the background job scheduler.
+Run: python test/test_jobs.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import json
+from http.server import BaseHTTPRequestHandler
+
+from fastapi.testclient import TestClient
+
+from main import app
+from tools import pinging
+from tools.cache import ResultCache
+from tools.jobs import JobScheduler, QueueFull
+from test.fakes import FAKE_CORE, serve, serve_204, serve_check_host, vless_link
+
+
+def test_job_lifecycle():
+    """Test that a job id comes back at once and results fill in later"""
+    web, url = serve_204()
+    check_host, check_host_url = serve_check_host()
+    pinging.CHECK_HOST_URL = check_host_url
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    # Run the app's startup without writing a history.db into the working directory
+    os.environ["HISTORY_DB"] = ""
+    try:
+        with TestClient(app) as client:
+            response = client.post("/api/jobs", json={
+                "config_links": [vless_link(web.server_port), "vmess://x"],
+                "hosts": ["jobs.example.com"],
+                "test_url": url,
+                "timeout": 3,
+            })
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+            job = client.get(f"/api/jobs/{job_id}", params={"wait": 10}).json()
+            missing = client.get("/api/jobs/nope")
+    finally:
+        del os.environ["V2RAY_PATH"]
+        del os.environ["HISTORY_DB"]
+        pinging.CHECK_HOST_URL = "https://check-host.net"
+        check_host.shutdown()
+        web.shutdown()
+
+    assert job["status"] == "done", job
+    assert job["completed"] == 3
+    by_type = {}
+    for result in job["results"]:
+        by_type.setdefault(result["type"], []).append(result)
+    assert len(by_type["v2ray"]) == 2 and len(by_type["ping"]) == 1
+    assert by_type["ping"][0]["success"] is True
+    assert missing.status_code == 404
+    print(f"  ✅ Job finished with {job['completed']} results")
+
+
+def test_priority_order():
+    """Test that higher priority checks run first"""
+    order = []
+
+    async def run():
+        scheduler = JobScheduler(v2ray_workers=1, ping_workers=1)
+
+        async def check(job, item):
+            order.append(item)
+            return {"item": item}
+
+        scheduler._check_v2ray = check
+        low = scheduler.submit(config_links=["low-1", "low-2"], priority=0)
+        high = scheduler.submit(config_links=["high"], priority=5)
+        await scheduler.wait(low, 5)
+        await scheduler.wait(high, 5)
+        await scheduler.stop()
+
+    asyncio.run(run())
+    assert order == ["high", "low-1", "low-2"], order
+    print(f"  ✅ Order: {order}")
+
+
+def test_cancelled_check():
+    """Test that a cancelled coalesced leader, or a cancellation escaping a check, never stalls the queue"""
+    async def run():
+        scheduler = JobScheduler(v2ray_workers=1, ping_workers=1)
+        cache = ResultCache()
+
+        async def slow(item):
+            await asyncio.sleep(0.2)
+            return {"item": item}
+
+        async def check(job, item):
+            if item == "escapes":
+                raise asyncio.CancelledError()
+            return await cache.get_or_run(item, lambda: slow(item), lambda r: True)
+
+        scheduler._check_v2ray = check
+        leader = asyncio.create_task(cache.get_or_run("shared", lambda: slow("shared"), lambda r: True))
+        await asyncio.sleep(0)
+        coalesced = scheduler.submit(config_links=["shared"])
+        escaping = scheduler.submit(config_links=["escapes"])
+        behind = scheduler.submit(config_links=["behind"])
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        for job in (coalesced, escaping, behind):
+            await scheduler.wait(job, 5)
+        await scheduler.stop()
+        return coalesced, escaping, behind
+
+    coalesced, escaping, behind = asyncio.run(run())
+    assert coalesced.status == "done" and coalesced.results == [{"item": "shared"}], coalesced.to_dict()
+    assert escaping.status == "done" and escaping.results[0]["success"] is False, escaping.to_dict()
+    assert behind.status == "done" and behind.results == [{"item": "behind"}], behind.to_dict()
+    print(f"  ✅ {escaping.results[0]['message']}, queue kept going")
+
+
+def test_queue_limit():
+    """Test that submissions beyond the queue limit are refused"""
+
+    async def run():
+        scheduler = JobScheduler(v2ray_workers=0, ping_workers=0, max_queued=3)
+        scheduler.submit(config_links=["a", "b"])
+        try:
+            scheduler.submit(config_links=["c", "d"])
+        except QueueFull:
+            return True
+        finally:
+            await scheduler.stop()
+        return False
+
+    assert asyncio.run(run()), "Second job should be refused"
+    print("  ✅ Queue limit enforced")
+
+
+def test_webhook():
+    """Test that the webhook receives the finished job"""
+    received = []
+
+    class Hook(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = serve(Hook)
+
+    async def run():
+        scheduler = JobScheduler()
+        job = scheduler.submit(
+            config_links=["vmess://x"], webhook=f"http://127.0.0.1:{server.server_port}/hook"
+        )
+        await scheduler.wait(job, 5)
+        for _ in range(50):
+            if received:
+                break
+            await asyncio.sleep(0.05)
+        await scheduler.stop()
+        return job
+
+    try:
+        job = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    assert received and received[0]["job_id"] == job.id
+    assert job.webhook_error is None
+    print("  ✅ Webhook delivered")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("Job Lifecycle", test_job_lifecycle),
+        ("Priority Order", test_priority_order),
+        ("Cancelled Check", test_cancelled_check),
+        ("Queue Limit", test_queue_limit),
+        ("Webhook", test_webhook),
+    ]
+    
+    print("\n" + "="*50)
+    print("Running Job Scheduler Tests")
+    print("="*50 + "\n")
+    
+    passed = 0
+    failed = 0
+    
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+    
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+    
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
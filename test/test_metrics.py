@@ -0,0 +1,80 @@
+"""
+Tests for the in-process Prometheus metrics.
+Run: python test/test_metrics.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+
+from tools import metrics
+
+
+def test_histogram_render():
+    """Test cumulative buckets, sum and count in the text format"""
+    histogram = metrics.Histogram("test_seconds", "Test histogram", ["phase"], buckets=(0.1, 1))
+    histogram.observe(0.05, phase="a")
+    histogram.observe(0.5, phase="a")
+    histogram.observe(5, phase="a")
+    text = histogram.render()
+
+    assert "# TYPE test_seconds histogram" in text
+    assert 'test_seconds_bucket{phase="a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{phase="a",le="1"} 2' in text
+    assert 'test_seconds_bucket{phase="a",le="+Inf"} 3' in text
+    assert 'test_seconds_sum{phase="a"} 5.55' in text
+    assert 'test_seconds_count{phase="a"} 3' in text
+    print("  ✅ Histogram rendered")
+
+
+def test_collect_timings():
+    """Test that phases add up inside collect_timings and are skipped outside it"""
+    with metrics.collect_timings() as timings:
+        for _ in range(2):
+            with metrics.phase("ping", "wait"):
+                time.sleep(0.01)
+    with metrics.phase("ping", "wait"):
+        pass
+
+    assert list(timings) == ["ping"], timings
+    assert timings["ping"]["wait_ms"] >= 20, timings
+    print(f"  ✅ {timings}")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("Histogram Render", test_histogram_render),
+        ("Collect Timings", test_collect_timings),
+    ]
+
+    print("\n" + "="*50)
+    print("Running Metrics Tests")
+    print("="*50 + "\n")
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -6,7 +6,14 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import asyncio
+import time
+
+from tools import http_client, pinging
+from tools.bulk_ping import ping_hosts
+from tools.cache import ping_cache
 from tools.pinging import ping_from_iran
+from test.fakes import serve_check_host
 
 
 def test_valid_host():
@@ -50,12 +57,112 @@ def test_return_structure():
     print("  ✅ Structure is correct")
 
 
+def test_returns_when_nodes_report():
+    """Test that polling stops as soon as every Iran node reported"""
+    server, url = serve_check_host(delays={"ir2.node.check-host.net": 0.3})
+    pinging.CHECK_HOST_URL = url
+    try:
+        start = time.monotonic()
+        result = ping_from_iran("example.com", deadline=10, poll_interval=0.1)
+        elapsed = time.monotonic() - start
+    finally:
+        pinging.CHECK_HOST_URL = "https://check-host.net"
+        server.shutdown()
+
+    assert result["success"] is True and result["complete"] is True
+    assert len(result["data"]) == 2, "Only Iran nodes should be reported"
+    assert all(n["status"] == "done" for n in result["data"])
+    assert elapsed < 2, f"Should not wait for the deadline ({elapsed:.1f}s)"
+    print(f"  ✅ Finished in {elapsed:.2f}s after {server.polls} polls")
+
+
+def test_deadline_marks_pending():
+    """Test that nodes still running at the deadline are marked pending"""
+    server, url = serve_check_host(delays={"ir2.node.check-host.net": 60})
+    pinging.CHECK_HOST_URL = url
+    try:
+        result = ping_from_iran("example.com", deadline=0.5, poll_interval=0.1)
+    finally:
+        pinging.CHECK_HOST_URL = "https://check-host.net"
+        server.shutdown()
+
+    assert result["success"] is True and result["complete"] is False
+    statuses = {n["city"]: n["status"] for n in result["data"]}
+    assert statuses == {"Tehran": "done", "Shiraz": "pending"}, statuses
+    print(f"  ✅ Partial result: {statuses}")
+
+
+def test_bulk_ping_shared_poller():
+    """Test that many hosts finish together and reuse the cached node list"""
+    server, url = serve_check_host(delays={"ir2.node.check-host.net": 0.3})
+    pinging.CHECK_HOST_URL = url
+    pinging._iran_nodes.update(nodes=None, fetched_at=0.0)
+    ping_cache.clear()
+    # Measure the poller, not the check-host rate limit
+    rate = pinging.check_host_limiter.rate
+    pinging.check_host_limiter.rate = 0
+    hosts = [f"host{i}.example.com" for i in range(40)] + ["HOST0.example.com"]
+
+    async def run():
+        try:
+            return await ping_hosts(hosts, deadline=10, poll_interval=0.1, submit_concurrency=8)
+        finally:
+            await http_client.close_client()
+
+    try:
+        start = time.monotonic()
+        results = asyncio.run(run())
+        elapsed = time.monotonic() - start
+    finally:
+        pinging.check_host_limiter.rate = rate
+        pinging.CHECK_HOST_URL = "https://check-host.net"
+        server.shutdown()
+
+    assert len(results) == 40, "Hosts should be de-duplicated"
+    assert all(r["success"] and r["complete"] for r in results.values()), results
+    assert server.submitted == 40
+    assert server.named_nodes[-1] == ["ir1.node.check-host.net", "ir2.node.check-host.net"], \
+        "Later checks should name the cached Iran nodes"
+    assert elapsed < 3, f"Sweep time should not grow with the host count ({elapsed:.1f}s)"
+    print(f"  ✅ 40 hosts in {elapsed:.2f}s with {server.polls} polls")
+
+
+def test_bulk_ping_backs_off_on_fetch_errors():
+    """Test that polls whose fetch fails back off instead of retrying in a busy loop"""
+    server, url = serve_check_host(broken_results=True)
+    pinging.CHECK_HOST_URL = url
+    ping_cache.clear()
+    rate = pinging.check_host_limiter.rate
+    pinging.check_host_limiter.rate = 0
+
+    async def run():
+        try:
+            return await ping_hosts(["broken.example.com"], deadline=2, poll_interval=0.05)
+        finally:
+            await http_client.close_client()
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        pinging.check_host_limiter.rate = rate
+        pinging.CHECK_HOST_URL = "https://check-host.net"
+        server.shutdown()
+
+    assert "error" in results["broken.example.com"], results
+    assert server.polls < 20, f"Fetch errors should back off like empty polls, saw {server.polls} polls in 2s"
+    print(f"  ✅ {server.polls} polls in 2s")
+
+
 def run_all_tests():
     """Run all tests"""
     tests = [
         ("Valid Host Test", test_valid_host),
         ("Invalid Host Test", test_invalid_host),
-        ("Structure Test", test_return_structure)
+        ("Structure Test", test_return_structure),
+        ("Returns When Nodes Report", test_returns_when_nodes_report),
+        ("Deadline Marks Pending", test_deadline_marks_pending),
+        ("Bulk Ping Shared Poller", test_bulk_ping_shared_poller),
+        ("Bulk Ping Backs Off On Fetch Errors", test_bulk_ping_backs_off_on_fetch_errors),
     ]
     
     print("\n" + "="*50)
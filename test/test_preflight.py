@@ -0,0 +1,104 @@
+"""
+Tests for the pre-flight reachability probe.
+Run: python test/test_preflight.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+from tools.preflight import preflight
+from tools.v2ray_conf_test import check_v2ray_configs_async, parse_vless_link
+from test.fakes import FAKE_CORE, closed_port, serve_204, vless_link
+
+
+def test_closed_port_fails_fast():
+    """Test that an unreachable server is rejected without starting a core"""
+    os.environ["V2RAY_PATH"] = "/nonexistent/v2ray"
+    try:
+        start = time.perf_counter()
+        results = asyncio.run(check_v2ray_configs_async([vless_link(closed_port())], timeout=5, preflight=True))
+        elapsed = time.perf_counter() - start
+    finally:
+        del os.environ["V2RAY_PATH"]
+
+    result = results[0]
+    assert result["success"] is False
+    assert result["message"].startswith("Pre-flight failed"), result["message"]
+    assert "preflight_ms" in result, "Pre-flight timing should be reported"
+    assert elapsed < 2, f"Rejection should not wait for a core: {elapsed:.2f}s"
+    print(f"  ✅ {result['message']} in {result['preflight_ms']} ms")
+
+
+def test_open_port_passes():
+    """Test that a listening server passes and the core check still runs"""
+    server, url = serve_204()
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        results = asyncio.run(check_v2ray_configs_async(
+            [vless_link(server.server_port), vless_link(closed_port())], test_url=url, timeout=3, preflight=True
+        ))
+    finally:
+        del os.environ["V2RAY_PATH"]
+        server.shutdown()
+
+    alive, dead = results
+    assert alive["success"] is True, f"Reachable config should succeed: {alive}"
+    assert alive["preflight_ms"] >= 0, "Survivors should carry their pre-flight timing"
+    assert dead["message"].startswith("Pre-flight failed"), dead
+    print(f"  ✅ {alive['message']} (pre-flight {alive['preflight_ms']} ms)")
+
+
+def test_tls_handshake_failure():
+    """Test that security=tls requires a real TLS handshake, not just a TCP connect"""
+    server, _ = serve_204()
+    link = f"vless://12345678-1234-1234-1234-123456789abc@127.0.0.1:{server.server_port}?security=tls&sni=example.com"
+    try:
+        ok, message, _ = asyncio.run(preflight(parse_vless_link(link), timeout=2))
+    finally:
+        server.shutdown()
+
+    assert ok is False, "A plain HTTP server should fail the TLS handshake"
+    assert message.startswith("Pre-flight failed"), message
+    print(f"  ✅ {message}")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("Closed Port Fails Fast", test_closed_port_fails_fast),
+        ("Open Port Passes", test_open_port_passes),
+        ("TLS Handshake Failure", test_tls_handshake_failure),
+    ]
+
+    print("\n" + "="*50)
+    print("Running Pre-flight Tests")
+    print("="*50 + "\n")
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
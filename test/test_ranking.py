@@ -0,0 +1,154 @@
+"""
+Tests for race-to-top-K ranking.
+Run: python test/test_ranking.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import tempfile
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler
+
+from tools.breaker import server_breaker
+from tools.history import HistoryStore, use_history
+from tools.metrics import live_cores
+from tools.ranking import order_candidates, race_top_k
+from tools.timeouts import server_timeouts
+from test.fakes import FAKE_CORE, closed_port, serve, serve_204, vless_link
+
+
+def test_stops_early_and_kills_cores():
+    """Test that testing stops once K configs beat the threshold and no core is left running"""
+    server, url = serve_204()
+    links = [vless_link(server.server_port, uuid=str(uuid.uuid4())) for _ in range(20)]
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        result = asyncio.run(race_top_k(links, k=3, threshold_ms=5000, concurrency=4, test_url=url, timeout=3))
+    finally:
+        del os.environ["V2RAY_PATH"]
+        server.shutdown()
+
+    assert len(result["top"]) == 3 and result["stopped_early"] is True, result
+    assert result["skipped"] > 0, f"Most candidates should never start: {result}"
+    assert result["tested"] + result["cancelled"] + result["skipped"] == 20, result
+    latencies = [r["latency_ms"] for r in result["top"]]
+    assert latencies == sorted(latencies), "Top list should be fastest first"
+    assert live_cores.get() == 0, "Cancelled checks should stop their cores"
+    print(f"  ✅ tested {result['tested']}, cancelled {result['cancelled']}, skipped {result['skipped']}")
+
+
+def test_hints_decide_order():
+    """Test that hinted candidates are tried first"""
+    server, url = serve_204()
+    dead = [vless_link(closed_port(), uuid=str(uuid.uuid4())) for _ in range(5)]
+    alive = [vless_link(server.server_port, uuid=str(uuid.uuid4())) for _ in range(2)]
+    hints = {alive[0]: 80.0, alive[1]: 120.0}
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        result = asyncio.run(race_top_k(
+            dead + alive, k=2, threshold_ms=5000, concurrency=1, test_url=url, timeout=3, hints=hints
+        ))
+    finally:
+        del os.environ["V2RAY_PATH"]
+        server.shutdown()
+
+    assert order_candidates(dead + alive, hints)[:2] == alive
+    assert result["tested"] == 2 and result["skipped"] == 5, result
+    assert {r["config"] for r in result["top"]} == set(alive)
+    print(f"  ✅ Found both hinted configs after {result['tested']} tests")
+
+
+class _SlowAfterFirstHandler(BaseHTTPRequestHandler):
+    """Answers the first request with 204 at once and later ones after a second."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests += 1
+        if self.server.requests > 1:
+            time.sleep(1)
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_cut_off_checks_not_recorded():
+    """Test that checks cut short by the K-th best bound are "Cut off" and never logged or learned from"""
+    target = serve(_SlowAfterFirstHandler)
+    target.requests = 0
+    url = f"http://127.0.0.1:{target.server_port}/generate_204"
+    fast, _ = serve_204()
+    slow, _ = serve_204()
+    links = [vless_link(fast.server_port), vless_link(slow.server_port)]
+    slow_key = f"127.0.0.1:{slow.server_port}"
+
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            store = await HistoryStore(os.path.join(tmp, "history.db")).start()
+            use_history(store)
+            try:
+                result = await race_top_k(links, k=1, concurrency=1, test_url=url, timeout=3)
+                return result, [row[1] for row in store.pending_v2ray]
+            finally:
+                use_history(None)
+                await store.close()
+
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        result, logged = asyncio.run(run())
+    finally:
+        del os.environ["V2RAY_PATH"]
+        target.shutdown()
+        fast.shutdown()
+        slow.shutdown()
+
+    assert result["tested"] == 2 and [r["config"] for r in result["top"]] == links[:1], result
+    assert logged == links[:1], f"Only the full check should reach the history: {logged}"
+    assert server_timeouts.estimate(slow_key) is None, "A cut-off check teaches the timeouts nothing"
+    assert server_breaker.describe(slow_key)["failures"] == 0, "A cut-off check is no failure"
+    print(f"  ✅ logged {len(logged)} of {result['tested']} checks")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("Stops Early", test_stops_early_and_kills_cores),
+        ("Hints Decide Order", test_hints_decide_order),
+        ("Cut Off Checks Not Recorded", test_cut_off_checks_not_recorded),
+    ]
+
+    print("\n" + "="*50)
+    print("Running Ranking Tests")
+    print("="*50 + "\n")
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
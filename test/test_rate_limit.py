@@ -0,0 +1,168 @@
+"""
+Tests for the check-host rate limiter.
+Run: python test/test_rate_limit.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+from http.server import BaseHTTPRequestHandler
+
+from tools import http_client
+from tools.rate_limit import MAX_PAUSE, TokenBucket, WaitTooLong, queue_depth
+from test.fakes import serve
+
+
+def test_callers_wait_in_order():
+    """Test that queued callers get tokens in arrival order at the configured rate"""
+    bucket = TokenBucket("test-order", rate=20, burst=1)
+    order = []
+
+    async def caller(i):
+        await bucket.acquire()
+        order.append(i)
+
+    async def run():
+        await asyncio.gather(*(caller(i) for i in range(10)))
+
+    start = time.monotonic()
+    asyncio.run(run())
+    elapsed = time.monotonic() - start
+
+    assert order == list(range(10)), f"Callers should be served in order: {order}"
+    assert 0.4 <= elapsed < 1.0, f"9 refills at 20/s should take ~0.45s, took {elapsed:.2f}s"
+    assert queue_depth.get(limiter="test-order") == 0
+    print(f"  ✅ 10 callers in {elapsed:.2f}s")
+
+
+def test_retry_after_pauses_everyone():
+    """Test that a 429 with Retry-After pauses every caller sharing the limiter"""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            server.hits += 1
+            throttled = server.hits == 1
+            self.send_response(429 if throttled else 200)
+            if throttled:
+                self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = serve(Handler)
+    server.hits = 0
+    url = f"http://127.0.0.1:{server.server_port}/"
+    bucket = TokenBucket("test-retry-after", rate=100, burst=100)
+
+    async def run():
+        try:
+            first = asyncio.ensure_future(http_client.get(url, limiter=bucket))
+            await asyncio.sleep(0.2)
+            start = time.monotonic()
+            second = await http_client.get(url, limiter=bucket)
+            waited = time.monotonic() - start
+            return (await first), second, waited
+        finally:
+            await http_client.close_client()
+
+    try:
+        first, second, waited = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert server.hits == 3, f"Expected one throttled and two good requests, got {server.hits}"
+    assert waited >= 0.6, f"The other caller should wait out the Retry-After ({waited:.2f}s)"
+    print(f"  ✅ Second caller waited {waited:.2f}s")
+
+
+def test_long_retry_after_capped():
+    """Test that a huge Retry-After is capped and a caller with a deadline gives up at once"""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            server.hits += 1
+            self.send_response(429)
+            self.send_header("Retry-After", "3600")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = serve(Handler)
+    server.hits = 0
+    url = f"http://127.0.0.1:{server.server_port}/"
+    bucket = TokenBucket("test-long-retry-after", rate=100, burst=100)
+
+    async def run():
+        try:
+            start = time.monotonic()
+            response = await http_client.get(url, limiter=bucket, deadline=time.monotonic() + 2)
+            elapsed = time.monotonic() - start
+            try:
+                await bucket.acquire(time.monotonic() + 2)
+                rejected = False
+            except WaitTooLong:
+                rejected = True
+            return response, elapsed, rejected
+        finally:
+            await http_client.close_client()
+
+    try:
+        response, elapsed, rejected = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    paused_for = bucket.paused_until - time.monotonic()
+    assert response.status_code == 429, "The throttled response should be returned"
+    assert server.hits == 1, f"Nothing should be retried past the deadline, got {server.hits} requests"
+    assert elapsed < 1, f"Should give up at once, took {elapsed:.2f}s"
+    assert 0 < paused_for <= MAX_PAUSE, f"Pause should be capped at {MAX_PAUSE}s, got {paused_for:.0f}s"
+    assert rejected, "A caller whose deadline falls inside the pause should fail fast"
+    print(f"  ✅ Pause capped at {paused_for:.0f}s, gave up after {elapsed:.2f}s")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("Callers Wait In Order", test_callers_wait_in_order),
+        ("Retry-After Pauses Everyone", test_retry_after_pauses_everyone),
+        ("Long Retry-After Capped", test_long_retry_after_capped),
+    ]
+
+    print("\n" + "="*50)
+    print("Running Rate Limit Tests")
+    print("="*50 + "\n")
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
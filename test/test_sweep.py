@@ -0,0 +1,137 @@
+"""
+Tests for the headless batch runner (python -m tools).
+Run: python test/test_sweep.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import csv
+import json
+import subprocess
+import tempfile
+import uuid
+
+from tools import v2ray_conf_test
+from tools.sweep import main
+from test.fakes import FAKE_CORE, closed_port, serve_204, serve_check_host, vless_link
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_v2ray_jsonl_resume():
+    """Test that a resumed sweep skips finished links, repairs a cut-off last line and fans out duplicates"""
+    server, url = serve_204()
+    links = [vless_link(server.server_port, uuid=str(uuid.uuid4())) for _ in range(3)]
+    dead = vless_link(closed_port())
+    # Same server as links[0]: remark and parameter order only
+    renamed = f"vless://{links[0][8:].split('@')[0].upper()}@127.0.0.1:{server.server_port}" \
+              "?type=tcp&security=none&encryption=none#copy"
+    max_cores = v2ray_conf_test.MAX_PARALLEL_CORES
+    tmp = tempfile.TemporaryDirectory()
+    input_path = os.path.join(tmp.name, "links.txt")
+    output_path = os.path.join(tmp.name, "results.jsonl")
+    args = ["v2ray", input_path, "-o", output_path, "--test-url", url, "--timeout", "3", "-q"]
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        with open(input_path, "w") as f:
+            f.write("# sweep\n" + "\n".join(links[:2] + [dead, renamed]) + "\n\n")
+        main(args)
+        with open(output_path, "a") as f:
+            f.write('{"config": "vless://cut-off')
+        with open(input_path, "a") as f:
+            f.write(links[2] + "\n")
+        main(args + ["--resume"])
+        with open(output_path) as f:
+            rows = [json.loads(line) for line in f]
+    finally:
+        v2ray_conf_test.set_max_parallel_cores(max_cores)
+        del os.environ["V2RAY_PATH"]
+        server.shutdown()
+        tmp.cleanup()
+
+    assert [row["config"] for row in rows[4:]] == [links[2]], "Resume should only check the new link"
+    assert sorted(row["config"] for row in rows) == sorted(links + [dead, renamed]), rows
+    by_link = {row["config"]: row for row in rows}
+    assert all(by_link[link]["success"] for link in links), rows
+    assert by_link[dead]["success"] is False
+    assert by_link[renamed]["duplicate_of"] == links[0], by_link[renamed]
+    assert by_link[renamed]["latency_ms"] == by_link[links[0]]["latency_ms"], "Duplicates share one check"
+    print(f"  ✅ {len(rows)} rows, resumed with 1 new link")
+
+
+def test_ping_csv_from_stdin():
+    """Test that `python -m tools ping -` reads hosts from stdin and writes CSV"""
+    check_host, check_host_url = serve_check_host()
+    tmp = tempfile.TemporaryDirectory()
+    output_path = os.path.join(tmp.name, "ping.csv")
+    env = {**os.environ, "CHECK_HOST_URL": check_host_url}
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-m", "tools", "ping", "-", "-o", output_path, "--concurrency", "2"],
+            input="a.example.com\nb.example.com\n", capture_output=True, text=True, cwd=ROOT, env=env, timeout=60
+        )
+        with open(output_path, newline="") as f:
+            rows = list(csv.DictReader(f))
+    finally:
+        check_host.shutdown()
+        tmp.cleanup()
+
+    assert proc.returncode == 0, proc.stderr
+    assert sorted(row["host"] for row in rows) == ["a.example.com", "b.example.com"], rows
+    assert all(row["success"] == "True" and row["complete"] == "True" for row in rows), rows
+    assert "2 checked" in proc.stderr, proc.stderr
+    print(f"  ✅ {len(rows)} hosts, {rows[0]['ok_nodes']}/{rows[0]['total_nodes']} pings ok")
+
+
+def test_rejects_bad_limits():
+    """Test that a concurrency or core limit below 1 is a usage error"""
+    for args in (["-c", "0"], ["--concurrency", "-2"], ["--max-cores", "0"]):
+        try:
+            main(["v2ray", "-"] + args)
+        except SystemExit as e:
+            code = e.code
+        else:
+            code = None
+        assert code == 2, f"{args} should exit with a usage error, got {code}"
+    print("  ✅ Limits below 1 rejected")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("V2Ray JSONL Resume", test_v2ray_jsonl_resume),
+        ("Ping CSV From Stdin", test_ping_csv_from_stdin),
+        ("Rejects Bad Limits", test_rejects_bad_limits),
+    ]
+
+    print("\n" + "="*50)
+    print("Running Sweep Tests")
+    print("="*50 + "\n")
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,203 @@
+"""
+Tests for the throughput mode.
+Run: python test/test_throughput.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+from fastapi.testclient import TestClient
+
+from main import app
+from tools.throughput import measure_throughput, throughput_options
+from tools.v2ray_conf_test import check_v2ray_config_async
+from test.fakes import FAKE_CORE, serve, serve_204, vless_link
+
+
+class _BytesHandler(BaseHTTPRequestHandler):
+    """GET /bytes?n=N sends N bytes, GET /slow trickles forever, POST reads the body."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        target = urlparse(self.path)
+        self.send_response(200)
+        if target.path == "/slow":
+            self.end_headers()
+            try:
+                while True:
+                    self.wfile.write(bytes(16384))
+                    time.sleep(0.05)
+            except OSError:
+                return
+        size = int(parse_qs(target.query)["n"][0])
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        block = bytes(65536)
+        while size > 0:
+            self.wfile.write(block[:size])
+            size -= len(block)
+
+    def do_POST(self):
+        remaining = int(self.headers["Content-Length"])
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(65536, remaining)))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def check(link, test_url, throughput):
+    return asyncio.run(check_v2ray_config_async(link, test_url=test_url, timeout=3, throughput=throughput))
+
+
+def test_download_and_upload():
+    """Test that the requested bytes go both ways over parallel streams"""
+    web, url = serve_204()
+    files = serve(_BytesHandler)
+    base = f"http://127.0.0.1:{files.server_port}"
+    options = throughput_options(
+        download_bytes=4_000_000, upload_bytes=2_000_000, streams=2, max_seconds=10,
+        url=f"{base}/bytes?n=2000000", upload_url=f"{base}/upload"
+    )
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        result = check(vless_link(web.server_port), url, options)
+    finally:
+        del os.environ["V2RAY_PATH"]
+        files.shutdown()
+        web.shutdown()
+
+    report = result["throughput"]
+    assert result["success"] is True, result
+    assert report["download_bytes"] == 4_000_000 and report["upload_bytes"] == 2_000_000, report
+    assert report["download_mbps"] > 0 and report["upload_mbps"] > 0, report
+    assert report["ttfb_ms"] is not None and not report["capped"] and not report["errors"], report
+    print(f"  ✅ down {report['download_mbps']} Mbps, up {report['upload_mbps']} Mbps, ttfb {report['ttfb_ms']}ms")
+
+
+def test_time_cap():
+    """Test that a slow download stops at max_seconds and still reports a rate"""
+    web, url = serve_204()
+    files = serve(_BytesHandler)
+    options = throughput_options(download_bytes=50_000_000, max_seconds=0.5,
+                                 url=f"http://127.0.0.1:{files.server_port}/slow")
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        start = time.monotonic()
+        result = check(vless_link(web.server_port), url, options)
+        elapsed = time.monotonic() - start
+    finally:
+        del os.environ["V2RAY_PATH"]
+        files.shutdown()
+        web.shutdown()
+
+    report = result["throughput"]
+    assert report["capped"] is True, report
+    assert 0 < report["download_bytes"] < 50_000_000, report
+    assert report["download_mbps"] < 10, f"About 2.6 Mbps expected: {report}"
+    assert elapsed < 3, f"The time cap should end the test ({elapsed:.1f}s)"
+    print(f"  ✅ capped after {report['download_bytes']} bytes at {report['download_mbps']} Mbps")
+
+
+def test_silent_proxy_bounded():
+    """Test that a proxy that accepts and never answers cannot hold a measurement past max_seconds"""
+    async def run():
+        held = []
+        silent = await asyncio.start_server(lambda reader, writer: held.append(writer), "127.0.0.1", 0)
+        port = silent.sockets[0].getsockname()[1]
+        try:
+            start = time.monotonic()
+            # Two measurements share one slot, so the second also waits for the first
+            reports = await asyncio.gather(*(
+                measure_throughput(port, download_bytes=1000, upload_bytes=1000, max_seconds=0.5,
+                                   url="http://example.com/", upload_url="http://example.com/")
+                for _ in range(2)
+            ))
+            return reports, time.monotonic() - start
+        finally:
+            for writer in held:
+                writer.close()
+            silent.close()
+
+    reports, elapsed = asyncio.run(run())
+
+    assert elapsed < 3, f"Both measurements should end within their caps ({elapsed:.1f}s)"
+    for report in reports:
+        assert report["download_bytes"] == report["upload_bytes"] == 0, report
+        assert report["errors"] and all("timed out" in e or "slot" in e for e in report["errors"]), report
+    print(f"  ✅ gave up after {elapsed:.1f}s: {reports[0]['errors']}")
+
+
+def test_throughput_endpoint():
+    """Test that /api/v2ray passes throughput options and rejects an empty measurement"""
+    web, url = serve_204()
+    files = serve(_BytesHandler)
+    link = vless_link(web.server_port)
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        client = TestClient(app)
+        response = client.post("/api/v2ray", json={
+            "config_link": link, "test_url": url, "timeout": 3,
+            "throughput": {"download_bytes": 100000, "url": f"http://127.0.0.1:{files.server_port}/bytes?n=100000"}
+        })
+        empty = client.post("/api/v2ray", json={
+            "config_link": link, "test_url": url, "throughput": {"download_bytes": 0}
+        })
+    finally:
+        del os.environ["V2RAY_PATH"]
+        files.shutdown()
+        web.shutdown()
+
+    assert response.status_code == 200
+    assert response.json()["throughput"]["download_bytes"] == 100000, response.json()
+    assert empty.status_code == 400
+    print(f"  ✅ {response.json()['throughput']['download_mbps']} Mbps through the API")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("Download And Upload", test_download_and_upload),
+        ("Time Cap", test_time_cap),
+        ("Silent Proxy Bounded", test_silent_proxy_bounded),
+        ("Throughput Endpoint", test_throughput_endpoint),
+    ]
+
+    print("\n" + "="*50)
+    print("Running Throughput Tests")
+    print("="*50 + "\n")
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
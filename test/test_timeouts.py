@@ -0,0 +1,133 @@
+"""
+Tests for adaptive per-server timeouts.
+Run: python test/test_timeouts.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+from http.server import BaseHTTPRequestHandler
+
+from fastapi.testclient import TestClient
+
+from main import app
+from tools.timeouts import FLOOR, AdaptiveTimeouts, server_timeouts
+from tools.v2ray_conf_test import check_v2ray_config, check_v2ray_config_async, parse_vless_link
+from test.fakes import FAKE_CORE, serve, serve_204, vless_link
+
+
+def result(latency_ms=None):
+    if latency_ms is None:
+        return {"success": False, "message": "Timeout", "latency_ms": -1.0}
+    return {"success": True, "message": "Success (204)", "latency_ms": latency_ms}
+
+
+def test_learned_deadline():
+    """Test that the deadline tightens after a few successes, backs off after a cut-short probe and resets"""
+    timeouts = AdaptiveTimeouts(enabled=True)
+    outbound = parse_vless_link(vless_link(443, host="example.com"))
+
+    assert timeouts.deadline(outbound, 10) == 10, "No estimate yet"
+    for latency in (800, 900, 850):
+        timeouts.observe(outbound, result(latency), 10, 10)
+    tight = timeouts.deadline(outbound, 10)
+    assert FLOOR <= tight < 5, tight
+    assert timeouts.deadline(outbound, 0.5) == 0.5, "The caller's timeout is the upper bound"
+
+    timeouts.observe(outbound, result(), tight, 10)
+    backed_off = timeouts.deadline(outbound, 10)
+    assert abs(backed_off - 2 * tight) < 0.01, "A cut-short probe should double the deadline"
+    timeouts.observe(outbound, result(), 10, 10)
+    assert timeouts.estimate("example.com:443")["backoff"] == 2, "A full-length timeout teaches nothing"
+    timeouts.observe(outbound, result(870), backed_off, 10)
+    assert timeouts.deadline(outbound, 10) < backed_off, "A success resets the backoff"
+
+    other = parse_vless_link(vless_link(8443, host="example.com"))
+    assert timeouts.deadline(other, 10) == 10, "Servers are keyed by address and port"
+    print(f"  ✅ 10s -> {tight}s, backoff {backed_off}s")
+
+
+class _SlowHandler(BaseHTTPRequestHandler):
+    """Answers 204 after the delay in the server's .delay."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_dead_server_fails_fast():
+    """Test that a server that went silent is given up on at the learned deadline, not the full timeout"""
+    server = serve(_SlowHandler)
+    server.delay = 0
+    url = f"http://127.0.0.1:{server.server_port}/generate_204"
+    web, _ = serve_204()
+    link = vless_link(web.server_port)
+    server_timeouts.servers.pop(f"127.0.0.1:{web.server_port}", None)
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        first = [check_v2ray_config(link, test_url=url, timeout=10)[0] for _ in range(3)]
+        server.delay = 5
+        start = time.monotonic()
+        slow = asyncio.run(check_v2ray_config_async(link, test_url=url, timeout=10))
+        elapsed = time.monotonic() - start
+        client = TestClient(app)
+        estimate = client.get("/api/timeouts", params={"server": f"127.0.0.1:{web.server_port}"}).json()
+        unknown = client.get("/api/timeouts", params={"server": "nowhere:1"})
+    finally:
+        del os.environ["V2RAY_PATH"]
+        server.shutdown()
+        web.shutdown()
+
+    assert all(first), first
+    assert slow["message"] == "Timeout" and slow["timeout_s"] < 10, slow
+    assert elapsed < 4, f"Should stop at the learned deadline ({elapsed:.1f}s)"
+    assert estimate["samples"] == 3 and estimate["backoff"] == 2, estimate
+    assert unknown.status_code == 404
+    print(f"  ✅ gave up after {elapsed:.1f}s (deadline {slow['timeout_s']}s)")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        ("Learned Deadline", test_learned_deadline),
+        ("Dead Server Fails Fast", test_dead_server_fails_fast),
+    ]
+
+    print("\n" + "="*50)
+    print("Running Adaptive Timeout Tests")
+    print("="*50 + "\n")
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"{name}...")
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"  ❌ FAILED: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"  ❌ ERROR: {e}")
+            failed += 1
+
+    print("\n" + "="*50)
+    print(f"Results: {passed} passed, {failed} failed")
+    print("="*50 + "\n")
+
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
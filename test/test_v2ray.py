@@ -4,9 +4,23 @@ Run: python test/test_v2ray.py
 """
 import sys
 import os
+import asyncio
+import json
+import tempfile
+import threading
+import time
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from tools.v2ray_conf_test import check_v2ray_config, find_v2ray_exe, parse_vless_link
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+
+from tools import v2ray_conf_test
+from tools.metrics import live_cores
+from tools.v2ray_conf_test import (
+    check_v2ray_config, check_v2ray_config_async, check_v2ray_configs, find_v2ray_exe, parse_vless_link,
+    render_core_config, reserve_ports, release_ports, summarize_latencies
+)
+from test.fakes import FAKE_CORE, closed_port, serve, serve_204, vless_link
 
 
 def test_find_v2ray_executable():
@@ -91,6 +105,205 @@ def test_working_config():
         print(f"  ⚠️  Connection failed (server may be down): {message}")
 
 
+def test_batch_single_process():
+    """Test that a batch of configs is probed through one fake core"""
+    server, url = serve_204()
+    alive = vless_link(server.server_port)
+    dead = vless_link(closed_port())
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        results = check_v2ray_configs([alive, dead, "vmess://unsupported", alive], test_url=url, timeout=3)
+    finally:
+        del os.environ["V2RAY_PATH"]
+        server.shutdown()
+
+    assert len(results) == 4, "Should return one result per link"
+    assert results[0][0] is True and results[3][0] is True, "Alive configs should succeed"
+    assert results[1][0] is False, "Dead config should fail"
+    assert "Unsupported protocol" in results[2][1], "Unsupported link should be reported"
+    print(f"  ✅ Batch results: {[r[1] for r in results]}")
+
+
+def test_concurrent_checks():
+    """Test that parallel checks don't share ports or config files and respect the core limit"""
+    server, url = serve_204()
+    link = vless_link(server.server_port)
+    max_cores = v2ray_conf_test.MAX_PARALLEL_CORES
+    baseline = live_cores.get()
+    peak = 0
+    done = threading.Event()
+
+    def watch():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, live_cores.get() - baseline)
+            time.sleep(0.002)
+
+    watcher = threading.Thread(target=watch)
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    os.environ["FAKE_CORE_START_DELAY"] = "0.1"
+    v2ray_conf_test.set_max_parallel_cores(2)
+    watcher.start()
+    try:
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            results = list(executor.map(lambda _: check_v2ray_config(link, test_url=url, timeout=3), range(6)))
+    finally:
+        done.set()
+        watcher.join()
+        v2ray_conf_test.set_max_parallel_cores(max_cores)
+        del os.environ["V2RAY_PATH"]
+        del os.environ["FAKE_CORE_START_DELAY"]
+        server.shutdown()
+
+    assert all(r[0] for r in results), f"All parallel checks should succeed: {results}"
+    assert not os.path.exists("temp_config.json"), "No config file should be left in the cwd"
+    assert 1 <= peak <= 2, f"V2RAY_MAX_CORES=2 should bound threaded callers, saw {peak} live cores"
+    print(f"  ✅ {len(results)} parallel checks succeeded, at most {peak} cores at once")
+
+
+def test_reserved_ports_are_unique():
+    """Test that reserved ports are never handed out twice"""
+    first = reserve_ports(20)
+    second = reserve_ports(20)
+    release_ports(first + second)
+
+    assert len(set(first + second)) == 40, "Reserved ports should be unique"
+    print("  ✅ Ports are unique")
+
+
+def test_chatty_core_does_not_stall():
+    """Test that a core writing lots of logs is drained and still starts"""
+    server, url = serve_204()
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    os.environ["FAKE_CORE_NOISE"] = "2000"
+    try:
+        success, message, _ = check_v2ray_config(vless_link(server.server_port), test_url=url, timeout=3)
+    finally:
+        del os.environ["V2RAY_PATH"]
+        del os.environ["FAKE_CORE_NOISE"]
+        server.shutdown()
+
+    assert success is True, f"Chatty core should still work: {message}"
+    print("  ✅ 400 KB of logs drained")
+
+
+def test_start_failure_has_log_tail():
+    """Test that a core that dies on startup reports its log tail"""
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+        f.write("#!/usr/bin/env python3\nimport sys\nprint('config error: bad outbound', file=sys.stderr)\nsys.exit(23)\n")
+    os.chmod(f.name, 0o755)
+    os.environ["V2RAY_PATH"] = f.name
+    try:
+        success, message, _ = check_v2ray_config(vless_link(closed_port()), timeout=2)
+    finally:
+        del os.environ["V2RAY_PATH"]
+        os.remove(f.name)
+
+    assert success is False
+    assert "exit code 23" in message and "config error: bad outbound" in message, message
+    print(f"  ✅ {message}")
+
+
+def test_latency_profile_reuses_connection():
+    """Test that extra samples reuse one keep-alive connection through the core"""
+    server, url = serve_204()
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        result = asyncio.run(check_v2ray_config_async(vless_link(server.server_port), test_url=url, timeout=3, samples=5))
+    finally:
+        del os.environ["V2RAY_PATH"]
+        server.shutdown()
+
+    assert result["success"] is True, result
+    profile = result["profile"]
+    assert profile["samples"] == 5 and profile["errors"] == 0, profile
+    first, rest = profile["phases"][0], profile["phases"][1:]
+    assert first["reused"] is False and first["connect_ms"] > 0, first
+    assert all(p["reused"] and p["connect_ms"] == 0 for p in rest), "Later samples should reuse the connection"
+    assert result["latency_ms"] == round(profile["p50_ms"])
+    print(f"  ✅ p50 {profile['p50_ms']} ms, p95 {profile['p95_ms']} ms, jitter {profile['jitter_ms']} ms")
+
+
+class _FlakyHandler(BaseHTTPRequestHandler):
+    """Answers 204 to the first request and 503 afterwards, on a keep-alive connection."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests += 1
+        self.send_response(204 if self.server.requests == 1 else 503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_latency_profile_failed_samples():
+    """Test that failed later samples are counted as errors without changing the success status"""
+    server = serve(_FlakyHandler)
+    server.requests = 0
+    url = f"http://127.0.0.1:{server.server_port}/generate_204"
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        result = asyncio.run(check_v2ray_config_async(vless_link(server.server_port), test_url=url, timeout=3, samples=3))
+    finally:
+        del os.environ["V2RAY_PATH"]
+        server.shutdown()
+
+    assert result["success"] is True and result["message"] == "Success (204)", result
+    assert result["profile"]["samples"] == 1 and result["profile"]["errors"] == 2, result["profile"]
+    print(f"  ✅ {result['message']} with {result['profile']['errors']} failed samples")
+
+
+def test_summarize_latencies():
+    """Test percentile and jitter math"""
+    summary = summarize_latencies([10.0, 30.0, 20.0, 40.0])
+
+    assert summary["min_ms"] == 10.0 and summary["max_ms"] == 40.0
+    assert summary["p50_ms"] == 20.0, summary
+    assert summary["p95_ms"] == 40.0, summary
+    assert summary["jitter_ms"] == 16.7, summary
+    print(f"  ✅ {summary}")
+
+
+def test_render_core_config():
+    """Test that the templated config text has one routed inbound per outbound"""
+    outbounds = [parse_vless_link(vless_link(port)) for port in (1001, 1002)]
+    outbounds[1]["settings"]["vnext"][0]["users"][0]["id"] = "$price-{0}"
+    config = json.loads(render_core_config(outbounds, [20001, 20002]))
+
+    assert [i["port"] for i in config["inbounds"]] == [20001, 20002]
+    assert [i["tag"] for i in config["inbounds"]] == ["in-0", "in-1"]
+    assert config["outbounds"][1]["tag"] == "out-1"
+    assert config["outbounds"][1]["settings"]["vnext"][0]["users"][0]["id"] == "$price-{0}"
+    assert config["routing"]["rules"][1] == {"type": "field", "inboundTag": ["in-1"], "outboundTag": "out-1"}
+    print("  ✅ Config rendered")
+
+
+def test_config_delivery_modes():
+    """Test that configs reach the core over stdin without temp files, and through a file when asked"""
+    server, url = serve_204()
+    link = vless_link(server.server_port)
+    tmp = tempfile.gettempdir()
+    before = {f for f in os.listdir(tmp) if f.startswith("v2ray-")}
+    os.environ["V2RAY_PATH"] = FAKE_CORE
+    try:
+        over_stdin = check_v2ray_config(link, test_url=url, timeout=3)
+        created = {f for f in os.listdir(tmp) if f.startswith("v2ray-")} - before
+        v2ray_conf_test.CONFIG_STDIN = False
+        over_file = check_v2ray_config(link, test_url=url, timeout=3)
+    finally:
+        v2ray_conf_test.CONFIG_STDIN = True
+        del os.environ["V2RAY_PATH"]
+        server.shutdown()
+
+    assert over_stdin[0] is True, over_stdin
+    assert over_file[0] is True, over_file
+    assert not created, f"stdin delivery should not create files: {created}"
+    print("  ✅ stdin and file delivery both work")
+
+
 def run_all_tests():
     """Run all tests"""
     tests = [
@@ -99,6 +312,16 @@ def run_all_tests():
         ("Invalid VLESS Links", test_invalid_vless_link),
         ("Connection Return Format", test_v2ray_connection_format),
         ("Working Config Test", test_working_config),
+        ("Batch In One Process", test_batch_single_process),
+        ("Concurrent Checks", test_concurrent_checks),
+        ("Unique Reserved Ports", test_reserved_ports_are_unique),
+        ("Chatty Core", test_chatty_core_does_not_stall),
+        ("Start Failure Log Tail", test_start_failure_has_log_tail),
+        ("Latency Profile", test_latency_profile_reuses_connection),
+        ("Latency Profile Failed Samples", test_latency_profile_failed_samples),
+        ("Summarize Latencies", test_summarize_latencies),
+        ("Render Core Config", test_render_core_config),
+        ("Config Delivery Modes", test_config_delivery_modes),
     ]
     
     print("\n" + "="*50)
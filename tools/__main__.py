@@ -0,0 +1,8 @@
+import sys
+
+from tools import distributed, sweep
+
+
+if sys.argv[1:2] == ["worker"]:
+    sys.exit(distributed.main(sys.argv[2:]))
+sys.exit(sweep.main())
@@ -0,0 +1,49 @@
+import asyncio
+
+
+async def map_unordered(func, items, limit):
+    """
+    Run `await func(item)` for every item with at most `limit` running at once.
+
+    Items are pulled from the (sync or async) iterable only when a slot is
+    free, and (item, result) pairs are yielded in completion order. Closing
+    the generator early cancels the running calls and waits for them to
+    clean up.
+    """
+    if hasattr(items, "__aiter__"):
+        iterator = items.__aiter__()
+
+        async def next_item():
+            return await iterator.__anext__()
+    else:
+        sync_iterator = iter(items)
+
+        async def next_item():
+            try:
+                return next(sync_iterator)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    running = {}
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(running) < limit:
+                try:
+                    item = await next_item()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                running[asyncio.ensure_future(func(item))] = item
+
+            if not running:
+                return
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = running.pop(task)
+                yield item, task.result()
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
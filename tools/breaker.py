@@ -0,0 +1,133 @@
+import os
+import time
+from collections import OrderedDict
+
+from tools.metrics import Counter
+
+
+BREAKER_THRESHOLD = int(os.environ.get("BREAKER_THRESHOLD", "3"))
+BREAKER_BASE_SECONDS = float(os.environ.get("BREAKER_BASE_SECONDS", "300"))
+BREAKER_MAX_SECONDS = float(os.environ.get("BREAKER_MAX_SECONDS", "86400"))
+MAX_KEYS = 100000
+
+short_circuits = Counter("breaker_short_circuits_total", "Checks answered by an open circuit breaker", ["breaker"])
+trips = Counter("breaker_trips_total", "Times a circuit breaker opened", ["breaker"])
+
+
+class CircuitBreaker:
+    """
+    Suspends checks of keys (servers, hosts) that keep failing.
+
+    After `threshold` failures in a row a key is open: checks are answered
+    with a "suspended" result for base_seconds. When that window ends one
+    trial check is let through (half-open); its success closes the key,
+    its failure opens it again for twice as long, up to max_seconds.
+    A threshold of 0 turns the breaker off.
+    """
+
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, base_seconds=BREAKER_BASE_SECONDS,
+                 max_seconds=BREAKER_MAX_SECONDS, max_keys=MAX_KEYS):
+        self.name = name
+        self.threshold = threshold
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.max_keys = max_keys
+        self.entries = OrderedDict()
+
+    def _state(self, entry, now):
+        if entry["open_until"] is None:
+            return "closed"
+        return "open" if now < entry["open_until"] else "half_open"
+
+    def check(self, key):
+        """
+        Whether a check of key may run.
+
+        Returns: None to go ahead, or the seconds until the next trial
+        """
+        if self.threshold <= 0:
+            return None
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        state = self._state(entry, now)
+        if state == "closed":
+            return None
+        if state == "half_open" and (entry["trial_at"] is None or now - entry["trial_at"] > self.base_seconds):
+            # Let one trial through; a lost trial is retried after another base window
+            entry["trial_at"] = now
+            return None
+        short_circuits.inc(breaker=self.name)
+        retry_at = entry["open_until"] if state == "open" else entry["trial_at"] + self.base_seconds
+        return round(max(0.0, retry_at - now), 1)
+
+    def record(self, key, success):
+        """Count the outcome of a check that ran."""
+        entry = self.entries.get(key)
+        if success:
+            if entry is not None:
+                del self.entries[key]
+            return
+        if entry is None:
+            entry = self.entries[key] = {"failures": 0, "trips": 0, "open_until": None, "trial_at": None}
+        self.entries.move_to_end(key)
+        entry["failures"] += 1
+        entry["trial_at"] = None
+        if self.threshold > 0 and entry["failures"] >= self.threshold:
+            window = min(self.base_seconds * 2 ** entry["trips"], self.max_seconds)
+            entry["trips"] += 1
+            entry["open_until"] = time.monotonic() + window
+            trips.inc(breaker=self.name)
+        while len(self.entries) > self.max_keys:
+            self.entries.popitem(last=False)
+
+    def suspended(self, key, retry_in):
+        """Message of a short-circuited check."""
+        failures = self.entries[key]["failures"] if key in self.entries else 0
+        return f"Suspended: {failures} failures in a row, next retry in {retry_in}s"
+
+    def describe(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return {"key": key, "state": "closed", "failures": 0, "trips": 0, "retry_in_s": None}
+        now = time.monotonic()
+        state = self._state(entry, now)
+        return {
+            "key": key,
+            "state": state,
+            "failures": entry["failures"],
+            "trips": entry["trips"],
+            "retry_in_s": round(entry["open_until"] - now, 1) if state == "open" else None,
+        }
+
+    def snapshot(self, limit=100):
+        """Keys that are open or half-open, most recently failed first."""
+        now = time.monotonic()
+        keys = [key for key, entry in reversed(self.entries.items()) if self._state(entry, now) != "closed"]
+        return [self.describe(key) for key in keys[:limit]]
+
+    def reset(self, key=None):
+        """Close one key, or every key. Returns how many were cleared."""
+        if key is None:
+            cleared = len(self.entries)
+            self.entries.clear()
+            return cleared
+        return 1 if self.entries.pop(key, None) is not None else 0
+
+    def stats(self):
+        now = time.monotonic()
+        states = {"closed": 0, "open": 0, "half_open": 0}
+        for entry in self.entries.values():
+            states[self._state(entry, now)] += 1
+        return {
+            "threshold": self.threshold,
+            "base_seconds": self.base_seconds,
+            "max_seconds": self.max_seconds,
+            "tracked": len(self.entries),
+            **states,
+        }
+
+
+server_breaker = CircuitBreaker("v2ray")
+host_breaker = CircuitBreaker("ping")
@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+from tools.aio import map_unordered
+from tools.cache import ping_cache, ping_complete
+from tools.metrics import in_flight, phase
+from tools.pinging import (
+    PING_DEADLINE, POLL_INTERVAL, POLL_MAX_INTERVAL, all_reported, fetch_results, finished_result, record_ping,
+    submit_ping, suspended_ping
+)
+
+
+SUBMIT_CONCURRENCY = 8
+FETCH_CONCURRENCY = 16
+
+
+async def ping_hosts(hosts, deadline=PING_DEADLINE, poll_interval=POLL_INTERVAL, max_age=None,
+                     submit_concurrency=SUBMIT_CONCURRENCY, force=False):
+    """
+    Ping many hosts from Iran nodes with one shared poller.
+
+    Hosts are submitted to check-host with at most `submit_concurrency`
+    requests in flight. A single loop then polls every outstanding check
+    (each with its own backoff and its own deadline from submission) and
+    finishes a host as soon as all its nodes reported. Fresh cached results
+    are used as they are; new results go into the ping cache. Hosts with an
+    open circuit breaker get a "suspended" error unless force=True.
+
+    Returns: {host: result} with results shaped like ping_from_iran_async()
+    """
+    unique = list(dict.fromkeys(host.strip().lower() for host in hosts if host.strip()))
+    results = {}
+    todo = []
+    for host in unique:
+        cached = None if force else ping_cache.get(host, max_age)
+        suspended = None if force or cached is not None else suspended_ping(host)
+        if cached is not None:
+            ping_cache.hits += 1
+            results[host] = cached
+        elif suspended is not None:
+            results[host] = suspended
+            record_ping(host, suspended)
+        else:
+            ping_cache.misses += 1
+            todo.append(host)
+
+    outstanding = {}
+    added = asyncio.Event()
+    fetch_slots = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+    def finish(host, result):
+        results[host] = result
+        record_ping(host, result)
+        ping_cache.put(host, result, ping_complete(result))
+
+    async def submit(host):
+        try:
+            request_id, iran_nodes = await submit_ping(host, deadline=time.monotonic() + deadline)
+        except Exception as e:
+            finish(host, {"error": str(e)})
+            return
+        now = time.monotonic()
+        outstanding[request_id] = {
+            "host": host, "nodes": iran_nodes, "give_up": now + deadline,
+            "interval": poll_interval, "next_poll": now + poll_interval,
+        }
+        added.set()
+
+    async def submit_all():
+        async for _ in map_unordered(submit, todo, submit_concurrency):
+            pass
+
+    def backoff(check):
+        check["interval"] = min(check["interval"] * 1.5, POLL_MAX_INTERVAL)
+        check["next_poll"] = min(time.monotonic() + check["interval"], check["give_up"])
+
+    async def poll(request_id, check):
+        try:
+            async with fetch_slots:
+                data = await fetch_results(request_id, deadline=check["give_up"])
+        except Exception as e:
+            if time.monotonic() >= check["give_up"]:
+                del outstanding[request_id]
+                finish(check["host"], {"error": str(e)})
+            else:
+                # A failing fetch waits like an unfinished one instead of polling again at once
+                backoff(check)
+            return
+        complete = all_reported(check["nodes"], data)
+        if complete or time.monotonic() >= check["give_up"]:
+            del outstanding[request_id]
+            finish(check["host"], finished_result(check["nodes"], data, complete))
+        else:
+            backoff(check)
+
+    with in_flight("ping", len(todo)):
+        submitter = asyncio.create_task(submit_all())
+        try:
+            while outstanding or not submitter.done():
+                # Sleep until the next check is due, waking early for new submissions
+                wakeup = asyncio.ensure_future(added.wait())
+                waiters = {wakeup} if submitter.done() else {wakeup, submitter}
+                timeout = None
+                if outstanding:
+                    timeout = max(0.0, min(c["next_poll"] for c in outstanding.values()) - time.monotonic())
+                with phase("ping", "wait"):
+                    await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                wakeup.cancel()
+                added.clear()
+
+                now = time.monotonic()
+                due = [(rid, c) for rid, c in outstanding.items() if c["next_poll"] <= now]
+                await asyncio.gather(*(poll(rid, c) for rid, c in due))
+            await submitter
+        finally:
+            submitter.cancel()
+
+    return {host: results[host] for host in unique}
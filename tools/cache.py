@@ -0,0 +1,185 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+
+from tools.pinging import PING_DEADLINE, ping_from_iran_async
+from tools.timeouts import server_key
+from tools.v2ray_conf_test import DEFAULT_TEST_URL, check_v2ray_config_async, parse_config_link
+
+
+MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "4096"))
+SUCCESS_TTL = float(os.environ.get("CACHE_SUCCESS_TTL", "60"))
+FAILURE_TTL = float(os.environ.get("CACHE_FAILURE_TTL", "15"))
+# Handed to coalesced callers when the leading call was cancelled
+_LEADER_CANCELLED = object()
+
+
+class ResultCache:
+    """
+    Bounded LRU cache with separate TTLs for successes and failures.
+
+    Concurrent misses for the same key are coalesced onto one in-flight call.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, success_ttl=SUCCESS_TTL, failure_ttl=FAILURE_TTL):
+        self.max_entries = max_entries
+        self.success_ttl = success_ttl
+        self.failure_ttl = failure_ttl
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key, max_age=None):
+        """Return the cached value for key, or None if missing, expired or older than max_age."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        stored_at, expires_at, value = entry
+        now = time.monotonic()
+        if now >= expires_at:
+            del self.entries[key]
+            return None
+        if max_age is not None and now - stored_at > max_age:
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value, success):
+        """
+        Store value for its TTL.
+
+        Suspended results (the breaker's answer, not a check's) and incomplete
+        pings (cut short by their caller's deadline) are never stored.
+        """
+        if isinstance(value, dict) and (value.get("suspended") or value.get("complete") is False):
+            return
+        now = time.monotonic()
+        ttl = self.success_ttl if success else self.failure_ttl
+        if ttl <= 0:
+            return
+        self.entries[key] = (now, now + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get_or_run(self, key, func, is_success, max_age=None):
+        """
+        Return a cached value or await func() to produce one.
+
+        max_age=0 skips cached values (an identical in-flight call is still shared).
+        If the call being shared is cancelled, the callers waiting on it look
+        again and one of them runs func() itself; the cancellation is not theirs.
+        """
+        while True:
+            value = self.get(key, max_age)
+            if value is not None:
+                self.hits += 1
+                return value
+
+            future = self.inflight.get(key)
+            if future is None or future.get_loop() is not asyncio.get_running_loop():
+                break
+            self.coalesced += 1
+            value = await asyncio.shield(future)
+            if value is not _LEADER_CANCELLED:
+                return value
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            value = await func()
+        except asyncio.CancelledError:
+            future.set_result(_LEADER_CANCELLED)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+        self.put(key, value, is_success(value))
+        future.set_result(value)
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+            "success_ttl": self.success_ttl,
+            "failure_ttl": self.failure_ttl,
+        }
+
+    def invalidate(self, match):
+        """Drop every entry whose key satisfies match(key). Returns how many were dropped."""
+        stale = [key for key in self.entries if match(key)]
+        for key in stale:
+            del self.entries[key]
+        return len(stale)
+
+    def clear(self):
+        self.entries.clear()
+
+
+ping_cache = ResultCache()
+v2ray_cache = ResultCache()
+
+
+def forget_server(server=None):
+    """Drop cached V2Ray results of one server (address:port), or all of them, e.g. when its breaker is reset."""
+    return v2ray_cache.invalidate(lambda key: server is None or server_key(json.loads(key)[0]) == server)
+
+
+def forget_host(host=None):
+    """Drop the cached ping of one host, or all of them."""
+    return ping_cache.invalidate(lambda key: host is None or key == host.strip().lower())
+
+
+def ping_complete(result):
+    """Ping results only count as successes (and get the long TTL) once every node reported."""
+    return bool(result.get("success") and result.get("complete"))
+
+
+async def cached_ping_from_iran(host, deadline=PING_DEADLINE, max_age=None, force=False):
+    """ping_from_iran_async() behind ping_cache, keyed by host. force=True implies max_age=0."""
+    key = host.strip().lower()
+    return await ping_cache.get_or_run(
+        key,
+        lambda: ping_from_iran_async(host, deadline=deadline, force=force),
+        ping_complete,
+        max_age=0 if force else max_age
+    )
+
+
+async def cached_check_v2ray_config(config_link, test_url=DEFAULT_TEST_URL, timeout=10, max_age=None, preflight=False,
+                                    samples=1, throughput=None, force=False):
+    """
+    check_v2ray_config_async() behind v2ray_cache, keyed by the parsed outbound and the check options.
+
+    force=True implies max_age=0.
+    """
+    outbound, failure = parse_config_link(config_link)
+    if failure:
+        return failure
+
+    key = json.dumps([outbound, test_url, timeout, preflight, samples, throughput], sort_keys=True)
+    return await v2ray_cache.get_or_run(
+        key,
+        lambda: check_v2ray_config_async(
+            config_link, test_url=test_url, timeout=timeout, preflight=preflight, samples=samples,
+            throughput=throughput, force=force
+        ),
+        lambda result: result["success"],
+        max_age=0 if force else max_age
+    )
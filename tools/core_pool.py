@@ -0,0 +1,229 @@
+import asyncio
+import json
+import os
+import tempfile
+
+from tools.breaker import server_breaker
+from tools.metrics import phase
+from tools.v2ray_conf_test import (
+    CONFIG_STDIN, check_result, cut_off, learn_from_probe, probe_config, release_ports, reserve_ports, spawn_core,
+    wait_for_ports
+)
+from tools.timeouts import server_key, server_timeouts
+
+
+API_TAG = "api"
+BLOCK_TAG = "blocked"
+SLOT_WAIT = 30
+
+
+def build_pool_config(api_port, slot_ports):
+    """
+    Build the config of a warm core.
+
+    Slot `slot-N` listens on slot_ports[N] and is routed to outbound `out-slot-N`,
+    which only exists while a test is bound to the slot. Unbound slots fall
+    through to a blackhole.
+    """
+    inbounds = [{
+        "tag": API_TAG,
+        "port": api_port,
+        "listen": "127.0.0.1",
+        "protocol": "dokodemo-door",
+        "settings": {"address": "127.0.0.1"}
+    }]
+    rules = [{"type": "field", "inboundTag": [API_TAG], "outboundTag": API_TAG}]
+    for i, port in enumerate(slot_ports):
+        inbounds.append({
+            "tag": f"slot-{i}",
+            "port": port,
+            "listen": "127.0.0.1",
+            "protocol": "socks",
+            "settings": {"auth": "noauth", "udp": True}
+        })
+        rules.append({"type": "field", "inboundTag": [f"slot-{i}"], "outboundTag": f"out-slot-{i}"})
+
+    return {
+        "api": {"tag": API_TAG, "services": ["HandlerService"]},
+        "inbounds": inbounds,
+        "outbounds": [{"tag": BLOCK_TAG, "protocol": "blackhole"}],
+        "routing": {"rules": rules}
+    }
+
+
+class Slot:
+    """One SOCKS inbound of a warm core that tests can borrow."""
+
+    def __init__(self, core, index, port):
+        self.core = core
+        self.generation = core.generation
+        self.port = port
+        self.outbound_tag = f"out-slot-{index}"
+
+    def current(self):
+        """False once the core restarted: the restarted core's slot of the same index belongs to someone else."""
+        return self.generation == self.core.generation
+
+    async def bind(self, outbound):
+        """Attach an outbound to this slot through the core API."""
+        config = json.dumps({"outbounds": [{**outbound, "tag": self.outbound_tag}]})
+        if CONFIG_STDIN:
+            await self.core.api("ado", "stdin:", input=config.encode())
+            return
+        fd, path = tempfile.mkstemp(prefix="v2ray-outbound-", suffix=".json")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(config)
+            await self.core.api("ado", path)
+        finally:
+            os.remove(path)
+
+    async def unbind(self):
+        """Detach the slot's outbound. A slot of an earlier generation has nothing left to detach."""
+        if not self.current():
+            return
+        await self.core.api("rmo", self.outbound_tag)
+
+
+class WarmCore:
+    """A long-lived v2ray process with an API inbound and a few slots."""
+
+    def __init__(self, v2ray_exe, slots):
+        self.v2ray_exe = v2ray_exe
+        self.slot_count = slots
+        self.process = None
+        self.config_file = None
+        self.ports = []
+        self.generation = 0
+
+    @property
+    def api_port(self):
+        return self.ports[0]
+
+    async def start(self):
+        """Start the core and wait until the API and every slot listen."""
+        self.generation += 1
+        self.ports = reserve_ports(self.slot_count + 1)
+        config = json.dumps(build_pool_config(self.ports[0], self.ports[1:]))
+        self.process, self.config_file = await spawn_core(self.v2ray_exe, config)
+        if not await self.process.wait_ready() and not await wait_for_ports(self.ports, attempts=1):
+            message = self.process.failure("Warm core failed to start")
+            await self.stop()
+            raise RuntimeError(message)
+        return [Slot(self, i, port) for i, port in enumerate(self.ports[1:])]
+
+    def alive(self):
+        return self.process is not None and self.process.alive()
+
+    async def api(self, command, *args, input=None):
+        """Run a core API command (HandlerService) against this core; `input` is sent on stdin."""
+        process = await asyncio.create_subprocess_exec(
+            self.v2ray_exe, "api", command, f"--server=127.0.0.1:{self.api_port}", *args,
+            stdin=asyncio.subprocess.PIPE if input is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(input), 5)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise RuntimeError(f"api {command} timed out")
+        if process.returncode != 0:
+            raise RuntimeError(f"api {command} failed: {(stderr or stdout).decode().strip()}")
+
+    def kill(self):
+        """Kill the process; the pool restarts it on the next lease."""
+        if self.process:
+            self.process.kill()
+
+    async def stop(self):
+        if self.process:
+            await self.process.stop()
+            self.process = None
+        release_ports(self.ports)
+        if self.config_file and os.path.exists(self.config_file):
+            os.remove(self.config_file)
+            self.config_file = None
+
+
+class CorePool:
+    """
+    Keeps a few v2ray processes warm and hot-swaps outbounds into them.
+
+    A test borrows a slot, binds its outbound through the core API, probes the
+    slot's SOCKS port and unbinds again, so it never pays for core startup.
+    """
+
+    def __init__(self, v2ray_exe, cores=2, slots_per_core=8):
+        self.v2ray_exe = v2ray_exe
+        self.cores = [WarmCore(v2ray_exe, slots_per_core) for _ in range(cores)]
+        self.free_slots = asyncio.Queue()
+        self.lock = asyncio.Lock()
+        self.loop = None
+
+    async def start(self):
+        """Start every core. The pool is bound to the calling event loop."""
+        self.loop = asyncio.get_running_loop()
+        for core in self.cores:
+            for slot in await core.start():
+                self.free_slots.put_nowait(slot)
+        return self
+
+    async def close(self):
+        for core in self.cores:
+            await core.stop()
+
+    async def _take_slot(self):
+        """Borrow a free slot, restarting its core first if it died."""
+        while True:
+            slot = await asyncio.wait_for(self.free_slots.get(), SLOT_WAIT)
+            async with self.lock:
+                if not slot.current():
+                    # Left over from before a restart
+                    continue
+                if slot.core.alive():
+                    return slot
+                await slot.core.stop()
+                for fresh in await slot.core.start():
+                    self.free_slots.put_nowait(fresh)
+
+    async def check(self, outbound, test_url, timeout, samples=1, throughput=None, bounded=False):
+        """
+        Test one outbound on a warm core.
+
+        Returns: check result dict
+        """
+        try:
+            slot = await self._take_slot()
+        except asyncio.TimeoutError:
+            return check_result(False, "No warm core available")
+        except Exception as e:
+            return check_result(False, f"Error: {e}")
+
+        try:
+            with phase("v2ray", "bind"):
+                await slot.bind(outbound)
+        except Exception as e:
+            self.free_slots.put_nowait(slot)
+            return check_result(False, f"Core API error: {e}")
+
+        try:
+            deadline = server_timeouts.deadline(outbound, timeout)
+            with phase("v2ray", "probe"):
+                result = await probe_config(slot.port, test_url, deadline, samples, throughput)
+            if bounded:
+                result = cut_off(result)
+            if slot.current() and slot.core.alive():
+                healthy = learn_from_probe(outbound, result, deadline, timeout)
+                if healthy is not None:
+                    server_breaker.record(server_key(outbound), healthy)
+            return {**result, "timeout_s": deadline}
+        finally:
+            with phase("v2ray", "teardown"):
+                try:
+                    await slot.unbind()
+                except Exception:
+                    # Never hand out a slot that may still carry an old outbound
+                    slot.core.kill()
+            self.free_slots.put_nowait(slot)
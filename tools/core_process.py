@@ -0,0 +1,116 @@
+import asyncio
+from collections import deque
+
+from tools.metrics import live_cores
+
+
+LOG_LINES = 200
+READY_TIMEOUT = 5
+STARTED_MARK = "started"
+
+
+class CoreProcess:
+    """
+    A running v2ray process.
+
+    stdout and stderr are read continuously into a bounded ring buffer, so a
+    chatty core can never block on a full pipe, and readiness is taken from
+    the core's own "... started" log line instead of polling its ports.
+    """
+
+    def __init__(self, process):
+        self.process = process
+        self.log = deque(maxlen=LOG_LINES)
+        self.started = asyncio.Event()
+        self.counted = True
+        live_cores.inc()
+        self.readers = [
+            asyncio.create_task(self._drain(process.stdout)),
+            asyncio.create_task(self._drain(process.stderr)),
+        ]
+
+    @classmethod
+    async def spawn(cls, *args, input=None):
+        """Start the process; `input` bytes are written to its stdin, which is then closed."""
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.PIPE if input is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        core = cls(process)
+        if input is not None:
+            try:
+                process.stdin.write(input)
+                await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # Exited before reading its config; wait_ready() reports why
+                pass
+            except BaseException:
+                # Cancelled mid-write: nobody else holds the process to stop it
+                await core.stop()
+                raise
+            finally:
+                process.stdin.close()
+        return core
+
+    @property
+    def returncode(self):
+        return self.process.returncode
+
+    def alive(self):
+        return self.process.returncode is None
+
+    async def _drain(self, stream):
+        while True:
+            line = await stream.readline()
+            if not line:
+                return
+            text = line.decode(errors="replace").rstrip()
+            self.log.append(text)
+            if STARTED_MARK in text.lower():
+                self.started.set()
+
+    async def wait_ready(self, timeout=READY_TIMEOUT):
+        """
+        Wait for the started line.
+
+        Returns False if the process exits first or nothing shows up in time.
+        """
+        started = asyncio.ensure_future(self.started.wait())
+        exited = asyncio.ensure_future(self.process.wait())
+        try:
+            await asyncio.wait({started, exited}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            started.cancel()
+            exited.cancel()
+        if not self.alive():
+            # Let the readers pick up the last lines for the error message
+            await asyncio.wait(self.readers, timeout=1)
+        return self.started.is_set() and self.alive()
+
+    def log_tail(self, lines=5):
+        """Last few log lines, joined for error messages."""
+        return " | ".join(list(self.log)[-lines:])
+
+    def failure(self, reason):
+        """Error message with the exit code and log tail attached."""
+        if not self.alive():
+            reason = f"{reason} (exit code {self.returncode})"
+        tail = self.log_tail()
+        return f"{reason}: {tail}" if tail else reason
+
+    def kill(self):
+        if self.alive():
+            self.process.kill()
+
+    async def wait(self):
+        return await self.process.wait()
+
+    async def stop(self):
+        self.kill()
+        if self.counted:
+            self.counted = False
+            live_cores.dec()
+        await self.process.wait()
+        await asyncio.gather(*self.readers, return_exceptions=True)
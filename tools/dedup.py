@@ -0,0 +1,102 @@
+import hashlib
+import math
+
+from tools.v2ray_conf_test import config_fingerprint, parse_config_link
+
+
+def link_key(config_link):
+    """Fingerprint of the parsed link; an unparsable link is its own key."""
+    outbound, failure = parse_config_link(config_link)
+    return config_link if failure else config_fingerprint(outbound)
+
+
+def dedupe_links(config_links):
+    """
+    Group links that parse to the same outbound.
+
+    Returns: {representative link: [every link in its group, in input order]},
+    representatives in order of first appearance
+    """
+    groups = {}
+    for link in config_links:
+        groups.setdefault(link_key(link), []).append(link)
+    return {group[0]: group for group in groups.values()}
+
+
+class BloomFilter:
+    """
+    Fixed-size probabilistic set for multi-million key inputs.
+
+    Never misses a key it was given; a key it was not given is reported as
+    present with probability about `error_rate` once `capacity` keys are in.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and error_rate between 0 and 1")
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        """Add key. Returns True if it was (probably) present already."""
+        present = True
+        for position in self._positions(key):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                present = False
+                self.bits[byte] |= 1 << bit
+        if not present:
+            self.count += 1
+        return present
+
+    def __contains__(self, key):
+        return all(self.bits[p // 8] & (1 << (p % 8)) for p in self._positions(key))
+
+
+class SeenSet:
+    """
+    Keys seen so far: an exact set, or a BloomFilter when `capacity` is given.
+
+    The Bloom filter takes about 1.8 bytes per key at a 0.1% error rate
+    instead of roughly 100 for a set of fingerprints; in exchange a few
+    unseen keys are taken for duplicates.
+    """
+
+    def __init__(self, capacity=None, error_rate=0.001):
+        self.bloom = BloomFilter(capacity, error_rate) if capacity else None
+        self.keys = None if self.bloom else set()
+        self.added = 0
+        self.duplicates = 0
+
+    def add(self, key):
+        """Add key. Returns True if it was seen before."""
+        if self.bloom is not None:
+            seen = self.bloom.add(key)
+        else:
+            seen = key in self.keys
+            self.keys.add(key)
+        if seen:
+            self.duplicates += 1
+        else:
+            self.added += 1
+        return seen
+
+    def __contains__(self, key):
+        return key in (self.bloom if self.bloom is not None else self.keys)
+
+    def stats(self):
+        return {
+            "mode": "bloom" if self.bloom is not None else "exact",
+            "unique": self.added,
+            "duplicates": self.duplicates,
+            "bytes": len(self.bloom.bits) if self.bloom is not None else None,
+        }
@@ -0,0 +1,409 @@
+"""
+Coordinator/worker mode: `python -m tools worker --coordinator URL [options]`.
+
+The API process is the coordinator. POST /api/distributed splits a batch of
+config links into shards; workers lease shards over HTTP, test each shard
+in one core on their own local port range, and post the results back as
+each shard finishes. A shard whose lease runs out goes to the next worker
+that asks. Once nothing else is left, idle workers get a backup copy of a
+shard that has been running for long, and the first copy to finish wins.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+from tools.dedup import link_key
+from tools.jobs import QueueFull
+from tools.v2ray_conf_test import check_v2ray_configs_async, parse_port_range, set_max_parallel_cores, set_port_range
+
+
+SHARD_SIZE = int(os.environ.get("DISTRIBUTED_SHARD_SIZE", "16"))
+MAX_QUEUED_LINKS = int(os.environ.get("DISTRIBUTED_MAX_QUEUED", "100000"))
+# Lease length; 0 derives it from each run's timeout, samples and throughput options
+LEASE_SECONDS = float(os.environ.get("DISTRIBUTED_LEASE_SECONDS", "0"))
+MAX_COPIES = 2
+WORKER_TTL = 60
+RUN_RETENTION = 3600
+RETRY_DELAY = 2
+
+
+class Shard:
+    """A slice of a run's unique links, tested together by one worker."""
+
+    def __init__(self, run, index, links):
+        self.id = f"{run.id}-{index}"
+        self.run = run
+        self.links = links
+        self.leases = {}
+        self.first_leased_at = None
+        self.done = False
+
+    def to_lease(self):
+        return {"shard_id": self.id, "run_id": self.run.id, "config_links": self.links, "options": self.run.options}
+
+
+class Run:
+    """A batch of config links spread over the workers."""
+
+    def __init__(self, config_links, options, shard_size):
+        self.id = uuid.uuid4().hex
+        self.config_links = config_links
+        self.options = options
+        # Links with the same config fingerprint are tested once: representative link -> input positions
+        self.groups = {}
+        representatives = {}
+        for i, link in enumerate(config_links):
+            self.groups.setdefault(representatives.setdefault(link_key(link), link), []).append(i)
+        unique = list(self.groups)
+        self.shards = [Shard(self, i, unique[start:start + shard_size])
+                       for i, start in enumerate(range(0, len(unique), shard_size))]
+        self.remaining = len(self.shards)
+        self.results = [None] * len(config_links)
+        self.completed = 0
+        self.reassigned = 0
+        self.copies = 0
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        return {
+            "run_id": self.id,
+            "status": self.status,
+            "total": len(self.config_links),
+            "completed": self.completed,
+            "shards": len(self.shards),
+            "shards_done": len(self.shards) - self.remaining,
+            "reassigned": self.reassigned,
+            "backup_copies": self.copies,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "results": [result for result in self.results if result is not None],
+        }
+
+
+def lease_seconds(options):
+    """How long a worker may hold a shard before it is handed to another."""
+    if LEASE_SECONDS > 0:
+        return LEASE_SECONDS
+    throughput = options.get("throughput") or {}
+    return options["timeout"] * options["samples"] + 2 * throughput.get("max_seconds", 0) + 30
+
+
+class Coordinator:
+    """
+    Hands out shards of distributed runs to pulling workers.
+
+    Shards are leased first come, first served. A lease not completed
+    within lease_seconds (derived from the run's options by default) is
+    dropped and its shard reassigned. When no shard is waiting, a worker
+    asking for work gets a copy of a shard that has run for
+    straggler_seconds (the run's timeout by default), up to MAX_COPIES
+    holders per shard; results of the slower copy are ignored.
+    """
+
+    def __init__(self, max_queued=MAX_QUEUED_LINKS, lease_seconds=None, straggler_seconds=None):
+        self.max_queued = max_queued
+        self.lease_seconds = lease_seconds
+        self.straggler_seconds = straggler_seconds
+        self.runs = {}
+        self.shards = {}
+        self.pending = []
+        self.running = {}
+        self.workers = {}
+        self.loop = None
+        self.changed = None
+
+    def ensure_started(self):
+        """Bind the wake-up event to the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.changed = asyncio.Event()
+
+    def queued(self):
+        return sum(len(shard.links) for shard in itertools.chain(self.pending, self.running.values()))
+
+    def submit(self, config_links, options, shard_size=SHARD_SIZE):
+        """Split links into shards and queue them. Returns the run right away."""
+        self.ensure_started()
+        self._prune()
+        run = Run(list(config_links), options, shard_size)
+        if self.queued() + len(run.groups) > self.max_queued:
+            raise QueueFull(f"Too many queued links (limit {self.max_queued})")
+        self.runs[run.id] = run
+        for shard in run.shards:
+            self.shards[shard.id] = shard
+            self.pending.append(shard)
+        if not run.shards:
+            self._finish(run)
+        self.changed.set()
+        return run
+
+    def get(self, run_id):
+        return self.runs.get(run_id)
+
+    async def wait(self, run, timeout):
+        """Long-poll: return once the run is done or timeout seconds passed."""
+        try:
+            await asyncio.wait_for(run.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return run
+
+    async def lease(self, worker, wait=0):
+        """Next shard for worker, waiting up to `wait` seconds for one. Returns the lease dict or None."""
+        self.ensure_started()
+        self._seen(worker)
+        give_up = time.monotonic() + wait
+        while True:
+            shard = self._next_shard(worker)
+            if shard is not None:
+                self.workers[worker]["leased"] += 1
+                return shard.to_lease()
+            remaining = give_up - time.monotonic()
+            if remaining <= 0:
+                return None
+            self.changed.clear()
+            try:
+                # Wake up for new runs, and at least every second for expired leases
+                await asyncio.wait_for(self.changed.wait(), min(remaining, 1))
+            except asyncio.TimeoutError:
+                pass
+
+    def complete(self, worker, shard_id, results):
+        """
+        Take a worker's results for a shard.
+
+        Returns: True if they were used, False if another copy finished first.
+        Raises KeyError for an unknown shard, ValueError for a wrong result count.
+        """
+        shard = self.shards[shard_id]
+        if len(results) != len(shard.links):
+            raise ValueError(f"Expected {len(shard.links)} results, got {len(results)}")
+        self._seen(worker)
+        shard.leases.pop(worker, None)
+        if shard.done:
+            return False
+
+        shard.done = True
+        self.running.pop(shard.id, None)
+        if shard in self.pending:
+            self.pending.remove(shard)
+        run = shard.run
+        for link, result in zip(shard.links, results):
+            first, *duplicates = run.groups[link]
+            run.results[first] = {"config": link, **result, "worker": worker}
+            for i in duplicates:
+                run.results[i] = {"config": run.config_links[i], **result, "worker": worker, "duplicate_of": link}
+            run.completed += 1 + len(duplicates)
+        self.workers[worker]["completed"] += 1
+        self.workers[worker]["results"] += len(results)
+        run.remaining -= 1
+        run.status = "running"
+        if run.remaining == 0:
+            self._finish(run)
+        return True
+
+    def stats(self):
+        now = time.time()
+        return {
+            "runs": {status: sum(run.status == status for run in self.runs.values()) for status in ("queued", "running", "done")},
+            "pending_shards": len(self.pending),
+            "running_shards": len(self.running),
+            "queued_links": self.queued(),
+            "workers": [
+                {"worker": name, **info, "last_seen_s": round(now - info["last_seen"], 1)}
+                for name, info in self.workers.items() if now - info["last_seen"] < WORKER_TTL
+            ],
+        }
+
+    def _seen(self, worker):
+        info = self.workers.setdefault(worker, {"leased": 0, "completed": 0, "results": 0})
+        info["last_seen"] = time.time()
+
+    def _lease_length(self, shard):
+        if self.lease_seconds is not None:
+            return self.lease_seconds
+        return lease_seconds(shard.run.options)
+
+    def _next_shard(self, worker):
+        now = time.monotonic()
+        for shard in list(self.running.values()):
+            for holder, expires in list(shard.leases.items()):
+                if expires <= now:
+                    del shard.leases[holder]
+            if not shard.leases:
+                # Every holder let its lease run out: back to the front of the queue
+                del self.running[shard.id]
+                self.pending.insert(0, shard)
+                shard.run.reassigned += 1
+
+        if self.pending:
+            shard = self.pending.pop(0)
+            self.running[shard.id] = shard
+            shard.first_leased_at = shard.first_leased_at or now
+            shard.run.status = "running"
+        else:
+            shard = self._straggler(worker, now)
+            if shard is None:
+                return None
+            shard.run.copies += 1
+        shard.leases[worker] = now + self._lease_length(shard)
+        return shard
+
+    def _straggler(self, worker, now):
+        """The longest-running shard worth a backup copy for worker, or None."""
+        candidates = [
+            shard for shard in self.running.values()
+            if worker not in shard.leases and len(shard.leases) < MAX_COPIES
+            and now - shard.first_leased_at >= self._straggler_after(shard)
+        ]
+        return min(candidates, key=lambda shard: shard.first_leased_at, default=None)
+
+    def _straggler_after(self, shard):
+        if self.straggler_seconds is not None:
+            return self.straggler_seconds
+        return shard.run.options["timeout"]
+
+    def _finish(self, run):
+        run.status = "done"
+        run.finished_at = time.time()
+        run.done.set()
+
+    def _prune(self):
+        """Forget finished runs older than RUN_RETENTION."""
+        cutoff = time.time() - RUN_RETENTION
+        for run in [r for r in self.runs.values() if r.finished_at and r.finished_at < cutoff]:
+            del self.runs[run.id]
+            for shard in run.shards:
+                self.shards.pop(shard.id, None)
+
+
+def worker_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+async def run_worker(coordinator_url, name=None, shards=2, wait=20, once=False, client=None):
+    """
+    Lease shards from the coordinator and test them, `shards` at a time.
+
+    Runs until cancelled; with once=True it returns as soon as the
+    coordinator has no work. Connection errors are retried after RETRY_DELAY.
+
+    Returns: number of shards tested
+    """
+    name = name or worker_name()
+    base = coordinator_url.rstrip("/")
+    own_client = client is None
+    if own_client:
+        client = httpx.AsyncClient(timeout=httpx.Timeout(10, read=wait + 10))
+    tested = 0
+
+    async def loop():
+        nonlocal tested
+        while True:
+            try:
+                r = await client.post(f"{base}/api/workers/lease", json={"worker": name, "wait": wait})
+                if r.status_code == 204:
+                    if once:
+                        return
+                    continue
+                r.raise_for_status()
+                lease = r.json()
+                results = await check_v2ray_configs_async(lease["config_links"], **lease["options"])
+                r = await client.post(f"{base}/api/workers/results",
+                                      json={"worker": name, "shard_id": lease["shard_id"], "results": results})
+                if r.status_code != 404:
+                    # 404: the run was forgotten meanwhile
+                    r.raise_for_status()
+                tested += 1
+            except httpx.HTTPError as e:
+                print(f"{name}: {e!r}, retrying in {RETRY_DELAY}s", file=sys.stderr)
+                await asyncio.sleep(RETRY_DELAY)
+
+    try:
+        await asyncio.gather(*(loop() for _ in range(shards)))
+    finally:
+        if own_client:
+            await client.aclose()
+    return tested
+
+
+def split_port_range(port_range, parts):
+    """Split (first, last) into `parts` disjoint ranges. Raises ValueError when too small."""
+    first, last = port_range
+    size = (last - first + 1) // parts
+    if size < 1:
+        raise ValueError(f"{first}-{last} is too small for {parts} workers")
+    return [(first + i * size, first + (i + 1) * size - 1) for i in range(parts)]
+
+
+def spawn_workers(args):
+    """Start args.processes worker processes, each with its share of the port range, and wait for them."""
+    ranges = split_port_range(args.ports, args.processes) if args.ports else [None] * args.processes
+    name = args.name or worker_name()
+    processes = []
+    for i, port_range in enumerate(ranges):
+        command = [
+            sys.executable, "-m", "tools", "worker", "--coordinator", args.coordinator, "--name", f"{name}-{i}",
+            "--shards", str(args.shards), "--wait", str(args.wait),
+        ]
+        if args.max_cores:
+            command += ["--max-cores", str(args.max_cores)]
+        if args.once:
+            command.append("--once")
+        if port_range:
+            command += ["--ports", f"{port_range[0]}-{port_range[1]}"]
+        processes.append(subprocess.Popen(command))
+    try:
+        return max(process.wait() for process in processes)
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        return 130
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m tools worker", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--coordinator", required=True, help="base URL of the API process, e.g. http://10.0.0.2:8000")
+    parser.add_argument("--name", help="worker name (default: hostname-pid)")
+    parser.add_argument("--shards", type=int, default=2, help="shards tested at a time, one core each")
+    parser.add_argument("--ports", type=parse_port_range, help="local inbound port range, e.g. 20000-20999")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes to start, splitting --ports")
+    parser.add_argument("--max-cores", type=int, help="v2ray processes at a time (default: --shards)")
+    parser.add_argument("--wait", type=float, default=20, help="long-poll seconds per lease request")
+    parser.add_argument("--once", action="store_true", help="exit when the coordinator has no work")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.shards < 1 or args.processes < 1:
+        print("--shards and --processes must be at least 1", file=sys.stderr)
+        return 2
+    if args.processes > 1:
+        try:
+            return spawn_workers(args)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+
+    if args.ports:
+        set_port_range(args.ports)
+    set_max_parallel_cores(args.max_cores or args.shards)
+    try:
+        tested = asyncio.run(run_worker(args.coordinator, args.name, args.shards, args.wait, args.once))
+    except KeyboardInterrupt:
+        return 130
+    print(f"{args.name or worker_name()}: tested {tested} shards", file=sys.stderr)
+    return 0
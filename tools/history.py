@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+HISTORY_DB = os.environ.get("HISTORY_DB", "history.db")
+FLUSH_INTERVAL = 1.0
+BATCH_SIZE = 500
+# Rows kept for retry while the database can't be written; the oldest go first
+MAX_PENDING = 100000
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS v2ray_results (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    config TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    latency_ms REAL NOT NULL,
+    message TEXT NOT NULL,
+    checked_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS v2ray_by_fingerprint ON v2ray_results (fingerprint, checked_at);
+CREATE INDEX IF NOT EXISTS v2ray_by_time ON v2ray_results (checked_at);
+
+CREATE TABLE IF NOT EXISTS ping_results (
+    id INTEGER PRIMARY KEY,
+    host TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    complete INTEGER NOT NULL,
+    ok_nodes INTEGER NOT NULL,
+    total_nodes INTEGER NOT NULL,
+    error TEXT,
+    checked_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ping_by_host ON ping_results (host, checked_at);
+"""
+
+_store = None
+
+
+class HistoryStore:
+    """
+    SQLite log of every V2Ray and ping result.
+
+    Results are queued in memory and written in batches by a background task
+    (every FLUSH_INTERVAL seconds, or sooner once BATCH_SIZE rows are waiting),
+    so recording a result never waits on the disk.
+    """
+
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.pending_v2ray = []
+        self.pending_ping = []
+        self.written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.last_error = None
+        self.writer = None
+        self.wakeup = None
+
+    async def start(self):
+        self.wakeup = asyncio.Event()
+        self.writer = asyncio.create_task(self._write_loop())
+        return self
+
+    async def close(self):
+        if self.writer:
+            self.writer.cancel()
+            await asyncio.gather(self.writer, return_exceptions=True)
+        try:
+            await self.flush()
+        finally:
+            self.db.close()
+
+    def add_v2ray(self, fingerprint, config, result, checked_at=None):
+        self.pending_v2ray.append((
+            fingerprint, config, int(result["success"]), result["latency_ms"], result["message"],
+            checked_at or time.time()
+        ))
+        self._maybe_wake()
+
+    def add_ping(self, host, result, checked_at=None):
+        nodes = result.get("data", [])
+        self.pending_ping.append((
+            host, int("error" not in result), int(result.get("complete", False)),
+            sum(node["ok"] for node in nodes), sum(node["total"] for node in nodes),
+            result.get("error"), checked_at or time.time()
+        ))
+        self._maybe_wake()
+
+    def _maybe_wake(self):
+        if self.wakeup and len(self.pending_v2ray) + len(self.pending_ping) >= BATCH_SIZE:
+            self.wakeup.set()
+
+    async def _write_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # Disk full, database locked...: keep the rows and try again next time
+                self.failed_flushes += 1
+                self.last_error = str(e)
+                logger.warning("History flush failed, retrying in %ss: %s", FLUSH_INTERVAL, e)
+
+    async def flush(self):
+        """Write all queued rows in one transaction. On failure the rows stay queued (up to MAX_PENDING)."""
+        v2ray, self.pending_v2ray = self.pending_v2ray, []
+        ping, self.pending_ping = self.pending_ping, []
+        if v2ray or ping:
+            try:
+                await asyncio.to_thread(self._insert, v2ray, ping)
+            except Exception:
+                self.pending_v2ray = self._requeue(v2ray, self.pending_v2ray)
+                self.pending_ping = self._requeue(ping, self.pending_ping)
+                raise
+
+    def _requeue(self, failed, newer):
+        rows = failed + newer
+        if len(rows) > MAX_PENDING:
+            self.dropped += len(rows) - MAX_PENDING
+            rows = rows[-MAX_PENDING:]
+        return rows
+
+    def _insert(self, v2ray, ping):
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT INTO v2ray_results (fingerprint, config, success, latency_ms, message, checked_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)", v2ray
+            )
+            self.db.executemany(
+                "INSERT INTO ping_results (host, success, complete, ok_nodes, total_nodes, error, checked_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)", ping
+            )
+        self.written += len(v2ray) + len(ping)
+        self.flushes += 1
+
+    async def _query(self, sql, params):
+        def run():
+            with self.lock:
+                return [dict(row) for row in self.db.execute(sql, params)]
+        return await asyncio.to_thread(run)
+
+    async def latest_v2ray(self, fingerprint):
+        rows = await self._query(
+            "SELECT * FROM v2ray_results WHERE fingerprint = ? ORDER BY checked_at DESC LIMIT 1", (fingerprint,)
+        )
+        return rows[0] if rows else None
+
+    async def latest_ping(self, host):
+        rows = await self._query(
+            "SELECT * FROM ping_results WHERE host = ? ORDER BY checked_at DESC LIMIT 1", (host,)
+        )
+        return rows[0] if rows else None
+
+    async def latest_latencies(self, fingerprints):
+        """fingerprint -> latency_ms of its most recent successful check, for those that have one."""
+        fingerprints = list(fingerprints)
+        latencies = {}
+        # Stay well below SQLite's bound parameter limit
+        for start in range(0, len(fingerprints), 500):
+            chunk = fingerprints[start:start + 500]
+            rows = await self._query(
+                "SELECT fingerprint, latency_ms, MAX(checked_at) FROM v2ray_results"
+                f" WHERE success = 1 AND fingerprint IN ({','.join('?' * len(chunk))}) GROUP BY fingerprint",
+                chunk
+            )
+            latencies.update((row["fingerprint"], row["latency_ms"]) for row in rows)
+        return latencies
+
+    async def v2ray_series(self, fingerprint, since):
+        """(checked_at, success, latency_ms) points for one config, oldest first."""
+        return await self._query(
+            "SELECT checked_at, success, latency_ms FROM v2ray_results"
+            " WHERE fingerprint = ? AND checked_at >= ? ORDER BY checked_at", (fingerprint, since)
+        )
+
+    async def best_v2ray(self, since, limit):
+        """
+        Configs whose latest result since `since` is a success, fastest first.
+
+        avg_latency_ms averages the successful checks in the window.
+        """
+        # A bare column next to MAX() is taken from the row holding the maximum
+        return await self._query(
+            "SELECT fingerprint, config, MAX(checked_at) AS last_checked, success AS last_success,"
+            " COUNT(*) AS checks, SUM(success) AS successes,"
+            " AVG(CASE WHEN success THEN latency_ms END) AS avg_latency_ms"
+            " FROM v2ray_results WHERE checked_at >= ?"
+            " GROUP BY fingerprint HAVING last_success = 1"
+            " ORDER BY avg_latency_ms LIMIT ?", (since, limit)
+        )
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "pending": len(self.pending_v2ray) + len(self.pending_ping),
+            "written": self.written,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+            "last_error": self.last_error,
+        }
+
+
+def use_history(store):
+    """Record every finished check in `store` (None turns recording off)."""
+    global _store
+    _store = store
+
+
+def get_history():
+    return _store
+
+
+def record_v2ray(fingerprint, config, result):
+    if _store is not None:
+        _store.add_v2ray(fingerprint, config, result)
+
+
+def record_ping(host, result):
+    if _store is not None:
+        _store.add_ping(host, result)
@@ -0,0 +1,130 @@
+import asyncio
+import os
+import random
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from tools.rate_limit import MAX_PAUSE
+
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "15"))
+MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "50"))
+RETRIES = int(os.environ.get("HTTP_RETRIES", "3"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# httpx clients hold connections bound to one event loop, so keep one per loop
+_clients = weakref.WeakKeyDictionary()
+_stats = {"requests": 0, "responses": 0, "new_connections": 0, "retries": 0, "failures": 0}
+
+
+def get_client():
+    """Shared keep-alive client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _clients[loop] = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            headers={"Accept": "application/json"},
+        )
+    return client
+
+
+async def close_client():
+    """Close the running loop's client (for short-lived loops such as asyncio.run)."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def _trace(event, info):
+    if event == "connection.connect_tcp.complete":
+        _stats["new_connections"] += 1
+
+
+def retry_after(response):
+    """Seconds from a Retry-After header (delta or HTTP date), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+async def request(method, url, retries=RETRIES, limiter=None, deadline=None, **kwargs):
+    """
+    Send a request on the shared client.
+
+    Retries with jittered backoff on 5xx/429 responses and on connection
+    errors or timeouts. A Retry-After header (capped at MAX_PAUSE) replaces
+    the backoff and, with a limiter (TokenBucket), pauses every caller sharing
+    it. Each attempt takes a limiter token first. With a deadline
+    (time.monotonic() value) no wait may run past it: the request gives up
+    early instead. The last response (or error) is returned (or raised).
+    """
+    client = get_client()
+    extensions = {**kwargs.pop("extensions", {}), "trace": _trace}
+    attempt = 0
+    while True:
+        if limiter:
+            await limiter.acquire(deadline)
+        _stats["requests"] += 1
+        delay = None
+        try:
+            response = await client.request(method, url, extensions=extensions, **kwargs)
+        except (httpx.TransportError, httpx.TimeoutException) as e:
+            if attempt >= retries:
+                _stats["failures"] += 1
+                raise
+            error = e
+        else:
+            _stats["responses"] += 1
+            if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                return response
+            error = None
+            delay = retry_after(response)
+        if delay is not None:
+            delay = min(delay, MAX_PAUSE)
+            if limiter:
+                # The limiter holds back this caller and everyone else until then
+                limiter.pause(delay)
+        wait = backoff_delay(attempt) if delay is None else delay
+        if deadline is not None and time.monotonic() + wait > deadline:
+            _stats["failures"] += 1
+            if error is not None:
+                raise error
+            return response
+        _stats["retries"] += 1
+        if delay is None or not limiter:
+            await asyncio.sleep(wait)
+        attempt += 1
+
+
+async def get(url, **kwargs):
+    return await request("GET", url, **kwargs)
+
+
+def stats():
+    """Request, retry and connection reuse counters."""
+    reused = max(0, _stats["responses"] - _stats["new_connections"])
+    return {
+        **_stats,
+        "reused_connections": reused,
+        "reuse_rate": round(reused / _stats["responses"], 3) if _stats["responses"] else 0.0,
+    }
@@ -0,0 +1,225 @@
+import asyncio
+import itertools
+import os
+import time
+import uuid
+
+import httpx
+
+from tools.cache import cached_check_v2ray_config, cached_ping_from_iran
+from tools.pinging import PING_DEADLINE
+from tools.v2ray_conf_test import DEFAULT_TEST_URL
+
+
+V2RAY_WORKERS = int(os.environ.get("JOB_V2RAY_WORKERS", "8"))
+PING_WORKERS = int(os.environ.get("JOB_PING_WORKERS", "16"))
+MAX_QUEUED_CHECKS = int(os.environ.get("JOB_MAX_QUEUED", "100000"))
+JOB_RETENTION = 3600
+WEBHOOK_TIMEOUT = 10
+
+
+class QueueFull(Exception):
+    """The scheduler already holds MAX_QUEUED_CHECKS pending checks."""
+
+
+class Job:
+    """A batch of v2ray and ping checks submitted together."""
+
+    def __init__(self, config_links, hosts, priority, options, webhook=None):
+        self.id = uuid.uuid4().hex
+        self.config_links = config_links
+        self.hosts = hosts
+        self.priority = priority
+        self.options = options
+        self.webhook = webhook
+        self.webhook_error = None
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.results = []
+        self.done = asyncio.Event()
+
+    @property
+    def total(self):
+        return len(self.config_links) + len(self.hosts)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "total": self.total,
+            "completed": len(self.results),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "results": self.results,
+            "webhook_error": self.webhook_error,
+        }
+
+
+class JobScheduler:
+    """
+    In-process scheduler for jobs.
+
+    V2Ray and ping checks wait in separate priority queues (higher priority
+    first, then submission order) and are drained by separate bounded worker
+    pools, so slow pings never hold back config tests and vice versa.
+    """
+
+    def __init__(self, v2ray_workers=V2RAY_WORKERS, ping_workers=PING_WORKERS, max_queued=MAX_QUEUED_CHECKS):
+        self.v2ray_workers = v2ray_workers
+        self.ping_workers = ping_workers
+        self.max_queued = max_queued
+        self.jobs = {}
+        self.sequence = itertools.count()
+        self.loop = None
+        self.tasks = []
+        self.v2ray_queue = None
+        self.ping_queue = None
+        self.notifications = set()
+
+    def ensure_started(self):
+        """Start the worker pools on the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self.loop is loop:
+            return
+        self.loop = loop
+        self.v2ray_queue = asyncio.PriorityQueue()
+        self.ping_queue = asyncio.PriorityQueue()
+        self.tasks = [
+            asyncio.create_task(self._worker(self.v2ray_queue, self._check_v2ray))
+            for _ in range(self.v2ray_workers)
+        ] + [
+            asyncio.create_task(self._worker(self.ping_queue, self._check_ping))
+            for _ in range(self.ping_workers)
+        ]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.loop = None
+
+    def queued(self):
+        if self.loop is None:
+            return 0
+        return self.v2ray_queue.qsize() + self.ping_queue.qsize()
+
+    def submit(self, config_links=(), hosts=(), priority=0, options=None, webhook=None):
+        """Queue a job and return it right away."""
+        self.ensure_started()
+        self._prune()
+        job = Job(list(config_links), list(hosts), priority, options or {}, webhook)
+        if self.queued() + job.total > self.max_queued:
+            raise QueueFull(f"Too many queued checks (limit {self.max_queued})")
+
+        self.jobs[job.id] = job
+        if job.total == 0:
+            self._finish(job)
+            return job
+        for link in job.config_links:
+            self.v2ray_queue.put_nowait((-priority, next(self.sequence), job, link))
+        for host in job.hosts:
+            self.ping_queue.put_nowait((-priority, next(self.sequence), job, host))
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def wait(self, job, timeout):
+        """Long-poll: return once the job is done or timeout seconds passed."""
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    def stats(self):
+        statuses = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "jobs": statuses,
+            "queued_v2ray": self.v2ray_queue.qsize() if self.loop else 0,
+            "queued_ping": self.ping_queue.qsize() if self.loop else 0,
+            "v2ray_workers": self.v2ray_workers,
+            "ping_workers": self.ping_workers,
+        }
+
+    async def _worker(self, queue, check):
+        kind = "v2ray" if queue is self.v2ray_queue else "ping"
+        while True:
+            _, _, job, item = await queue.get()
+            try:
+                job.status = "running"
+                result = await check(job, item)
+            except Exception as e:
+                result = {"type": kind, "item": item, "success": False, "message": f"Error: {e}"}
+            except BaseException as e:
+                # Only stop() (or the process going down) may end a worker; a
+                # cancellation leaking out of one check fails just that check
+                if not isinstance(e, asyncio.CancelledError) or asyncio.current_task().cancelling():
+                    raise
+                result = {"type": kind, "item": item, "success": False, "message": "Error: check was cancelled"}
+            job.results.append(result)
+            if len(job.results) == job.total:
+                self._finish(job)
+
+    @staticmethod
+    async def _check_v2ray(job, link):
+        options = job.options
+        result = await cached_check_v2ray_config(
+            link,
+            test_url=options.get("test_url", DEFAULT_TEST_URL),
+            timeout=options.get("timeout", 10),
+            max_age=options.get("max_age"),
+            preflight=options.get("preflight", False),
+            samples=options.get("samples", 1),
+            throughput=options.get("throughput"),
+            force=options.get("force", False)
+        )
+        return {"type": "v2ray", "config": link, **result}
+
+    @staticmethod
+    async def _check_ping(job, host):
+        options = job.options
+        result = await cached_ping_from_iran(
+            host,
+            deadline=options.get("ping_deadline", PING_DEADLINE),
+            max_age=options.get("max_age"),
+            force=options.get("force", False)
+        )
+        return {
+            "type": "ping",
+            "host": host,
+            "success": "error" not in result,
+            "complete": result.get("complete", False),
+            "nodes": result.get("data", []),
+            "error": result.get("error"),
+        }
+
+    def _finish(self, job):
+        job.status = "done"
+        job.finished_at = time.time()
+        job.done.set()
+        if job.webhook:
+            task = asyncio.create_task(self._notify(job))
+            self.notifications.add(task)
+            task.add_done_callback(self.notifications.discard)
+
+    @staticmethod
+    async def _notify(job):
+        try:
+            async with httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT) as client:
+                r = await client.post(job.webhook, json=job.to_dict())
+                if r.status_code >= 400:
+                    job.webhook_error = f"HTTP {r.status_code}"
+        except Exception as e:
+            job.webhook_error = str(e)
+
+    def _prune(self):
+        """Forget finished jobs older than JOB_RETENTION."""
+        cutoff = time.time() - JOB_RETENTION
+        for job_id in [j.id for j in self.jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self.jobs[job_id]
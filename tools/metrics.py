@@ -0,0 +1,151 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+
+# Seconds; spans a local 204 through to a slow check-host poll
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+_timings = contextvars.ContextVar("timings", default=None)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric:
+    """Base for metrics with a fixed set of label names."""
+
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labels)
+        self.values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield self.name, _labels(self.labelnames, key), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {value}" for name, labels, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, labels)
+        if not self.labelnames:
+            self.values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry["counts"][i] += 1
+        entry["sum"] += value
+        entry["count"] += 1
+
+    def samples(self):
+        for key, entry in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, entry["counts"]):
+                yield f"{self.name}_bucket", _labels(self.labelnames + ("le",), key + (bound,)), count
+            yield f"{self.name}_bucket", _labels(self.labelnames + ("le",), key + ("+Inf",)), entry["count"]
+            yield f"{self.name}_sum", _labels(self.labelnames, key), round(entry["sum"], 6)
+            yield f"{self.name}_count", _labels(self.labelnames, key), entry["count"]
+
+
+def render():
+    """All registered metrics in the Prometheus text format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+PHASES = {
+    "v2ray": Histogram("v2ray_check_phase_seconds", "Time spent in each phase of a V2Ray config check", ["phase"]),
+    "ping": Histogram("ping_phase_seconds", "Time spent in each phase of a check-host ping", ["phase"]),
+}
+check_results = Counter("check_results_total", "Finished checks by kind and outcome", ["kind", "outcome"])
+checks_in_flight = Gauge("checks_in_flight", "Checks currently running", ["kind"])
+live_cores = Gauge("v2ray_core_processes", "Running v2ray processes")
+
+
+@contextmanager
+def collect_timings():
+    """
+    Collect the phases timed inside this block into a dict.
+
+    Yields: {"v2ray": {"<phase>_ms": ...}, "ping": {...}}; phases that run
+    more than once add up.
+    """
+    timings = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+@contextmanager
+def phase(scope, name):
+    """Time a block into the scope's phase histogram and the current timings, if any."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        PHASES[scope].observe(elapsed, phase=name)
+        timings = _timings.get()
+        if timings is not None:
+            scoped = timings.setdefault(scope, {})
+            scoped[f"{name}_ms"] = round(scoped.get(f"{name}_ms", 0) + elapsed * 1000, 1)
+
+
+@contextmanager
+def in_flight(kind, count=1):
+    """Count checks of `kind` as running for the duration of the block."""
+    checks_in_flight.inc(count, kind=kind)
+    try:
+        yield
+    finally:
+        checks_in_flight.dec(count, kind=kind)
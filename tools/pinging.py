@@ -1,57 +1,201 @@
-import requests
+import asyncio
+import os
 import time
 
+from tools import history, http_client
+from tools.breaker import host_breaker
+from tools.metrics import check_results, in_flight, phase
+from tools.rate_limit import TokenBucket
 
-def ping_from_iran(host):
-    """Check host from Iran nodes."""
+
+CHECK_HOST_URL = os.environ.get("CHECK_HOST_URL", "https://check-host.net")
+PING_DEADLINE = 40
+POLL_INTERVAL = 1.0
+POLL_MAX_INTERVAL = 5.0
+NODE_CACHE_TTL = 3600
+CHECK_HOST_RATE = float(os.environ.get("CHECK_HOST_RATE", "5"))
+CHECK_HOST_BURST = int(os.environ.get("CHECK_HOST_BURST", "10"))
+
+# Every check-host request, from any caller, takes a token from this bucket
+check_host_limiter = TokenBucket("check-host", CHECK_HOST_RATE, CHECK_HOST_BURST)
+
+_iran_nodes = {"nodes": None, "fetched_at": 0.0}
+
+
+def parse_ping_results(iran_nodes, results):
+    """Turn check-result data into per-node output. Unfinished nodes are marked pending."""
+    output = []
+    for node_id, info in iran_nodes.items():
+        pings = results.get(node_id)
+        if pings is None:
+            output.append({
+                "city": info[2],
+                "country": info[1],
+                "status": "pending",
+                "ok": 0,
+                "total": 0,
+                "target_ip": None,
+            })
+            continue
+        if not pings or pings == [[None]]:
+            continue
+
+        # Get latencies
+        lats = [p[1] * 1000 for p in pings[0] if p[0] == "OK"]
+
+        if lats:
+            output.append({
+                "city": info[2],
+                "country": info[1],
+                "status": "done",
+                "ok": len(lats),
+                "total": len(pings[0]),
+                "target_ip": pings[0][0][2] if len(pings[0][0]) > 2 else None,
+            })
+    return output
+
+
+class PingError(Exception):
+    """check-host refused a check or returned no usable nodes."""
+
+
+def cached_iran_nodes():
+    """Iran nodes from a recent check-ping response, or None once NODE_CACHE_TTL has passed."""
+    if _iran_nodes["nodes"] and time.monotonic() - _iran_nodes["fetched_at"] < NODE_CACHE_TTL:
+        return _iran_nodes["nodes"]
+    return None
+
+
+async def submit_ping(host, deadline=None):
+    """
+    Start a check-ping for host on the Iran nodes.
+
+    The node list of the first response is cached and later checks name
+    those nodes directly. deadline (time.monotonic()) bounds retries and
+    rate-limit waits.
+
+    Returns: (request_id, iran_nodes)
+    """
+    known = cached_iran_nodes()
+    if known:
+        params = [("host", host)] + [("node", node_id) for node_id in known]
+    else:
+        params = {"host": host, "max_nodes": 40, "nodes": "ir"}
+    with phase("ping", "submit"):
+        r = await http_client.get(f"{CHECK_HOST_URL}/check-ping", params=params, limiter=check_host_limiter,
+                                  deadline=deadline)
+
+    if r.status_code != 200:
+        raise PingError(f"API error: {r.status_code}")
+
+    data = r.json()
+    iran_nodes = {k: v for k, v in data["nodes"].items() if v[0] == "ir"}
+    if not iran_nodes:
+        raise PingError("No Iran nodes")
+    _iran_nodes.update(nodes=iran_nodes, fetched_at=time.monotonic())
+    return data["request_id"], iran_nodes
+
+
+async def fetch_results(request_id, deadline=None):
+    """Current check-result data of a submitted check. deadline (time.monotonic()) bounds retries and waits."""
+    with phase("ping", "fetch"):
+        r = await http_client.get(f"{CHECK_HOST_URL}/check-result/{request_id}", limiter=check_host_limiter,
+                                  deadline=deadline)
+        return r.json() or {}
+
+
+def all_reported(iran_nodes, results):
+    return all(results.get(node_id) is not None for node_id in iran_nodes)
+
+
+def finished_result(iran_nodes, results, complete):
+    with phase("ping", "parse"):
+        data = parse_ping_results(iran_nodes, results)
+    return {"success": True, "complete": complete, "data": data}
+
+
+def host_down(result):
+    """
+    Whether a ping shows the host itself failing: every node reported and none got a reply.
+
+    API errors and unfinished checks say nothing about the host.
+    """
+    return "error" not in result and result["complete"] and not result["data"]
+
+
+def record_ping(host, result):
+    """Count a finished ping by outcome, log it to the history store and feed the host's circuit breaker."""
+    if result.get("suspended"):
+        check_results.inc(kind="ping", outcome="suspended")
+        return
+    if "error" in result:
+        outcome = "error"
+    else:
+        outcome = "complete" if result["complete"] else "partial"
+    check_results.inc(kind="ping", outcome=outcome)
+    key = host.strip().lower()
+    history.record_ping(key, result)
+    if host_down(result):
+        host_breaker.record(key, False)
+    elif "error" not in result and result["data"]:
+        host_breaker.record(key, True)
+
+
+def suspended_ping(host):
+    """A fast "suspended" result while the host's circuit breaker is open, else None."""
+    key = host.strip().lower()
+    retry_in = host_breaker.check(key)
+    if retry_in is None:
+        return None
+    return {"error": host_breaker.suspended(key, retry_in), "suspended": True, "retry_in_s": retry_in}
+
+
+async def ping_from_iran_async(host, deadline=PING_DEADLINE, poll_interval=POLL_INTERVAL, force=False):
+    """
+    Check host from Iran nodes.
+
+    Polls check-result with backoff and returns as soon as every Iran node has
+    reported, or when `deadline` seconds have passed since the check was submitted.
+    A host whose circuit breaker is open gets a "suspended" error right away
+    unless force=True.
+    """
+    result = None if force else suspended_ping(host)
+    if result is None:
+        with in_flight("ping"):
+            result = await _ping(host, deadline, poll_interval)
+    record_ping(host, result)
+    return result
+
+
+async def _ping(host, deadline, poll_interval):
     try:
-        # Request ping check
-        r = requests.get(
-            "https://check-host.net/check-ping",
-            headers={"Accept": "application/json"},
-            params={"host": host, "max_nodes": 40, "nodes": "ir"}
-        )
-        
-        if r.status_code != 200:
-            return {"error": f"API error: {r.status_code}"}
-
-        data = r.json()
-        request_id = data["request_id"]
-        
-        # Get Iran nodes only
-        iran_nodes = {k: v for k, v in data["nodes"].items() if v[0] == "ir"}
-        
-        if not iran_nodes:
-            return {"error": "No Iran nodes"}
-        
-        # Wait and get results
-        time.sleep(40)
-        r = requests.get(
-            f"https://check-host.net/check-result/{request_id}",
-            headers={"Accept": "application/json"}
-        )
-        results = r.json()
-        # Parse results
-        output = []
-        for node_id, info in iran_nodes.items():
-            pings = results.get(node_id)
-            if not pings or pings == [[None]]:
-                continue
-            
-            # Get latencies
-            lats = [p[1] * 1000 for p in pings[0] if p[0] == "OK"]
-
-            if lats:
-                output.append({
-                    "city": info[2],
-                    "country": info[1],
-                    "ok": len(lats),
-                    "total": len(pings[0]),
-                    "target_ip": pings[0][0][2] if len(pings[0][0]) > 2 else None,
-                })
-        return {"success": True, "data": output}
-        
+        request_id, iran_nodes = await submit_ping(host, deadline=time.monotonic() + deadline)
+
+        # Poll until every node reported or the deadline passes
+        give_up = time.monotonic() + deadline
+        interval = poll_interval
+        results = {}
+        while True:
+            with phase("ping", "wait"):
+                await asyncio.sleep(max(0.0, min(interval, give_up - time.monotonic())))
+            results = await fetch_results(request_id, deadline=give_up)
+            complete = all_reported(iran_nodes, results)
+            if complete or time.monotonic() >= give_up:
+                break
+            interval = min(interval * 1.5, POLL_MAX_INTERVAL)
+
+        return finished_result(iran_nodes, results, complete)
+
     except Exception as e:
         return {"error": str(e)}
 
 
+def ping_from_iran(host, deadline=PING_DEADLINE, poll_interval=POLL_INTERVAL):
+    """Check host from Iran nodes. Blocking wrapper around ping_from_iran_async()."""
+    async def run():
+        try:
+            return await ping_from_iran_async(host, deadline=deadline, poll_interval=poll_interval)
+        finally:
+            await http_client.close_client()
+
+    return asyncio.run(run())
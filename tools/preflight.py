@@ -0,0 +1,53 @@
+import asyncio
+import ssl
+import time
+
+
+PREFLIGHT_TIMEOUT = 2.0
+
+
+def _tls_context():
+    # Only reachability matters here; proxy servers often use self-signed certs
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+async def preflight(outbound, timeout=PREFLIGHT_TIMEOUT):
+    """
+    Cheap reachability check of an outbound's server, without starting a core.
+
+    Opens a TCP connection to the vnext address and port and, for
+    security=tls, completes a TLS handshake using the configured server name.
+
+    Returns: (ok: bool, message: str, elapsed_ms: float)
+    """
+    server = outbound["settings"]["vnext"][0]
+    stream = outbound.get("streamSettings", {})
+    use_tls = stream.get("security") == "tls"
+    server_name = stream.get("tlsSettings", {}).get("serverName") or server["address"]
+
+    start = time.perf_counter()
+    writer = None
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                server["address"],
+                server["port"],
+                ssl=_tls_context() if use_tls else None,
+                server_hostname=server_name if use_tls else None
+            ),
+            timeout
+        )
+        return True, "TLS handshake OK" if use_tls else "TCP connect OK", round((time.perf_counter() - start) * 1000)
+    except asyncio.TimeoutError:
+        reason = "timeout"
+    except ssl.SSLError as e:
+        reason = f"TLS handshake failed: {e.reason or e}"
+    except OSError as e:
+        reason = e.strerror or str(e)
+    finally:
+        if writer:
+            writer.close()
+    return False, f"Pre-flight failed: {reason}", round((time.perf_counter() - start) * 1000)
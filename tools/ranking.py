@@ -0,0 +1,93 @@
+import heapq
+import time
+from contextlib import aclosing
+
+from tools.aio import map_unordered
+from tools.dedup import dedupe_links
+from tools.history import get_history
+from tools.v2ray_conf_test import DEFAULT_TEST_URL, check_v2ray_config_async, config_fingerprint, parse_config_link
+
+
+async def history_hints(config_links):
+    """link -> latency of its last successful check in the history store."""
+    store = get_history()
+    if store is None:
+        return {}
+    fingerprints = {}
+    for link in config_links:
+        outbound, failure = parse_config_link(link)
+        if not failure:
+            fingerprints[link] = config_fingerprint(outbound)
+    latencies = await store.latest_latencies(set(fingerprints.values()))
+    return {link: latencies[fp] for link, fp in fingerprints.items() if fp in latencies}
+
+
+def order_candidates(config_links, hints):
+    """Links with a hint first, lowest hint first; the rest keep their given order."""
+    return sorted(config_links, key=lambda link: (link not in hints, hints.get(link, 0)))
+
+
+async def race_top_k(config_links, k=5, threshold_ms=None, concurrency=8, test_url=DEFAULT_TEST_URL,
+                     timeout=10, hints=None):
+    """
+    Test configs concurrently until the K fastest are known well enough.
+
+    Candidates go in `hints` order (e.g. previous latency). Testing stops, and
+    running checks are cancelled (their cores killed), as soon as K configs
+    came in under threshold_ms. Once K configs have succeeded, later checks
+    get the current K-th best latency as their timeout, so configs that can
+    no longer make the top K are cut short. Links with the same fingerprint
+    are tested once; the others are listed under `duplicates` of the result.
+
+    Returns: {"top", "tested", "cancelled", "skipped", "duplicates", "stopped_early", "elapsed_ms"}
+    """
+    start = time.perf_counter()
+    groups = dedupe_links(config_links)
+    hints = hints or {}
+    # A group takes the best hint of any of its links
+    group_hints = {}
+    for link, group in groups.items():
+        known = [hints[member] for member in group if member in hints]
+        if known:
+            group_hints[link] = min(known)
+    candidates = order_candidates(list(groups), group_hints)
+    top = []  # max-heap of (-latency, index, result) holding the K best
+    started = 0
+    tested = 0
+    stopped_early = False
+
+    def kth_best():
+        return -top[0][0] if len(top) >= k else None
+
+    async def check(link):
+        nonlocal started
+        started += 1
+        bound = kth_best()
+        bounded = bound is not None and bound / 1000 < timeout
+        limit = max(bound / 1000, 0.001) if bounded else timeout
+        # A check cut short by the bound is "Cut off": kept out of history, the breaker and the timeouts
+        return await check_v2ray_config_async(link, test_url=test_url, timeout=limit, bounded=bounded)
+
+    async with aclosing(map_unordered(check, candidates, concurrency)) as results:
+        async for link, result in results:
+            tested += 1
+            if not result["success"]:
+                continue
+            entry = (-result["latency_ms"], tested, {**result, "config": link, "duplicates": groups[link][1:]})
+            if len(top) < k:
+                heapq.heappush(top, entry)
+            elif entry[0] > top[0][0]:
+                heapq.heapreplace(top, entry)
+            if threshold_ms is not None and len(top) >= k and kth_best() <= threshold_ms:
+                stopped_early = True
+                break
+
+    return {
+        "top": [result for _, _, result in sorted(top, reverse=True)],
+        "tested": tested,
+        "cancelled": started - tested,
+        "skipped": len(candidates) - started,
+        "duplicates": len(config_links) - len(candidates),
+        "stopped_early": stopped_early,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000),
+    }
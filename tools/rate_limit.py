@@ -0,0 +1,105 @@
+import asyncio
+import os
+import time
+import weakref
+
+from tools.metrics import Counter, Gauge, Histogram
+
+
+# Longest Retry-After pause honoured; a server asking for more gets this
+MAX_PAUSE = float(os.environ.get("RATE_LIMIT_MAX_PAUSE", "60"))
+
+queue_depth = Gauge("rate_limit_queue_depth", "Callers waiting for a rate limiter token", ["limiter"])
+wait_seconds = Histogram("rate_limit_wait_seconds", "Time callers waited for a rate limiter token", ["limiter"])
+pauses = Counter("rate_limit_pauses_total", "Retry-After pauses applied to a rate limiter", ["limiter"])
+
+
+class WaitTooLong(TimeoutError):
+    """A token would only come after the caller's deadline."""
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every caller of one upstream API.
+
+    Callers wait in arrival order for a token instead of failing. pause()
+    stops handing out tokens until a server-given Retry-After has passed,
+    for at most max_pause seconds. A rate of 0 turns the limiter off.
+    """
+
+    def __init__(self, name, rate, burst, max_pause=MAX_PAUSE):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_pause = max_pause
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting = 0
+        self.granted = 0
+        # asyncio.Lock queues waiters FIFO but is bound to one event loop
+        self._locks = weakref.WeakKeyDictionary()
+
+    def _lock(self):
+        loop = asyncio.get_running_loop()
+        lock = self._locks.get(loop)
+        if lock is None:
+            lock = self._locks[loop] = asyncio.Lock()
+        return lock
+
+    def _refill(self, now):
+        if now <= self.updated:
+            return
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, deadline=None):
+        """
+        Wait for a token.
+
+        deadline is a time.monotonic() value; WaitTooLong is raised at once
+        when the token would only come after it.
+        """
+        if self.rate <= 0:
+            return
+        start = time.monotonic()
+        if deadline is not None and self.paused_until > deadline:
+            raise WaitTooLong(f"{self.name} rate limit paused for {self.paused_until - start:.1f}s")
+        self.waiting += 1
+        queue_depth.inc(limiter=self.name)
+        try:
+            async with self._lock():
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self.tokens >= 1 and now >= self.paused_until:
+                        self.tokens -= 1
+                        break
+                    wait = self.paused_until - now if now < self.paused_until else (1 - self.tokens) / self.rate
+                    if deadline is not None and now + wait > deadline:
+                        raise WaitTooLong(f"{self.name} rate limit: next token in {wait:.1f}s")
+                    await asyncio.sleep(wait)
+        finally:
+            self.waiting -= 1
+            queue_depth.dec(limiter=self.name)
+        self.granted += 1
+        wait_seconds.observe(time.monotonic() - start, limiter=self.name)
+
+    def pause(self, seconds):
+        """Hand out no tokens for `seconds` (e.g. from a Retry-After header), at most max_pause."""
+        seconds = min(seconds, self.max_pause)
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        # Tokens start refilling only once the pause is over
+        self.tokens = 0.0
+        self.updated = self.paused_until
+        pauses.inc(limiter=self.name)
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tokens": round(self.tokens, 2),
+            "waiting": self.waiting,
+            "granted": self.granted,
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 2),
+        }
@@ -0,0 +1,279 @@
+import asyncio
+import ipaddress
+import ssl
+import struct
+import time
+from urllib.parse import urlparse
+
+
+class ProxyError(Exception):
+    """The local SOCKS inbound refused or dropped the request."""
+
+
+async def open_socks_connection(proxy_port, host, port):
+    """
+    Open a TCP stream to host:port through the SOCKS5 inbound on proxy_port.
+
+    Hostnames are resolved by the proxy (like socks5h).
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+    try:
+        writer.write(b"\x05\x01\x00")
+        version, method = await reader.readexactly(2)
+        if version != 5 or method != 0:
+            raise ProxyError("SOCKS handshake rejected")
+
+        try:
+            ip = ipaddress.ip_address(host)
+            address = (b"\x01" if ip.version == 4 else b"\x04") + ip.packed
+        except ValueError:
+            encoded = host.encode("idna")
+            address = b"\x03" + bytes([len(encoded)]) + encoded
+        writer.write(b"\x05\x01\x00" + address + struct.pack("!H", port))
+
+        _, reply, _, atyp = await reader.readexactly(4)
+        if reply != 0:
+            raise ProxyError(f"SOCKS connect failed (code {reply})")
+        if atyp == 1:
+            await reader.readexactly(4 + 2)
+        elif atyp == 3:
+            await reader.readexactly((await reader.readexactly(1))[0] + 2)
+        else:
+            await reader.readexactly(16 + 2)
+        return reader, writer
+    except BaseException:
+        writer.close()
+        raise
+
+
+def _request_line(target, keep_alive, method="GET", content_length=None):
+    path = target.path or "/"
+    if target.query:
+        path += "?" + target.query
+    body_header = f"Content-Length: {content_length}\r\n" if content_length is not None else ""
+    return (
+        f"{method} {path} HTTP/1.1\r\n"
+        f"Host: {target.netloc}\r\n"
+        "User-Agent: Mozilla/5.0\r\n"
+        "Accept: */*\r\n"
+        f"{body_header}"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    ).encode()
+
+
+async def _read_head(reader):
+    """Read a response head. Returns (status, headers with lower-case names)."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ProxyError("Connection closed by proxy")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return int(status_line.split()[1]), headers
+
+
+async def _read_body(reader, status, headers):
+    """
+    Consume the response body so the connection can carry the next request.
+
+    Returns False when the body runs until the server closes the connection.
+    """
+    if status in (204, 304) or 100 <= status < 200:
+        return True
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                return True
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+        return True
+    await reader.read()
+    return False
+
+
+async def _open_url(proxy_port, target):
+    """Connect to the host of a parsed URL through the SOCKS inbound, with TLS for https."""
+    secure = target.scheme == "https"
+    port = target.port or (443 if secure else 80)
+    reader, writer = await open_socks_connection(proxy_port, target.hostname, port)
+    if secure:
+        try:
+            await writer.start_tls(ssl.create_default_context(), server_hostname=target.hostname)
+        except BaseException:
+            writer.close()
+            raise
+    return reader, writer
+
+
+async def _open_url_before(proxy_port, target, deadline):
+    """_open_url() that gives up once time.perf_counter() passes `deadline`."""
+    try:
+        return await asyncio.wait_for(_open_url(proxy_port, target), max(0.0, deadline - time.perf_counter()))
+    except asyncio.TimeoutError:
+        raise TimeoutError("Connect timed out") from None
+
+
+async def http_get(proxy_port, url):
+    """
+    GET url through the SOCKS inbound and read the response head.
+
+    Returns: HTTP status code
+    """
+    target = urlparse(url)
+    reader, writer = await _open_url(proxy_port, target)
+    try:
+        writer.write(_request_line(target, keep_alive=False))
+        await writer.drain()
+        status, _ = await _read_head(reader)
+        return status
+    finally:
+        writer.close()
+
+
+async def http_download(proxy_port, url, max_bytes, deadline):
+    """
+    GET url through the SOCKS inbound and read up to max_bytes of the response.
+
+    Reading stops at max_bytes, at the end of the response, or once
+    time.perf_counter() passes `deadline`, whichever comes first. Connecting
+    and waiting for the response head raise TimeoutError past the deadline.
+
+    Returns: {"status", "bytes", "sent_at", "head_at", "first_byte_at", "finished_at"}
+    (perf_counter times; first_byte_at is None when no body arrived)
+    """
+    target = urlparse(url)
+    reader, writer = await _open_url_before(proxy_port, target, deadline)
+    try:
+        sent_at = time.perf_counter()
+        writer.write(_request_line(target, keep_alive=False))
+        await asyncio.wait_for(writer.drain(), max(0.0, deadline - sent_at))
+        status, _ = await asyncio.wait_for(_read_head(reader), max(0.0, deadline - time.perf_counter()))
+        head_at = time.perf_counter()
+        received = 0
+        first_byte_at = None
+        while received < max_bytes:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(reader.read(min(65536, max_bytes - received)), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            if first_byte_at is None:
+                first_byte_at = time.perf_counter()
+            received += len(chunk)
+        return {
+            "status": status, "bytes": received, "sent_at": sent_at, "head_at": head_at,
+            "first_byte_at": first_byte_at, "finished_at": time.perf_counter(),
+        }
+    finally:
+        writer.close()
+
+
+async def http_upload(proxy_port, url, size, deadline):
+    """
+    POST `size` zero bytes to url through the SOCKS inbound.
+
+    Sending stops once time.perf_counter() passes `deadline`; the response
+    head is only awaited when the whole body went out. Connecting raises
+    TimeoutError past the deadline.
+
+    Returns: {"status", "bytes", "started_at", "finished_at"} (status None when cut short)
+    """
+    target = urlparse(url)
+    reader, writer = await _open_url_before(proxy_port, target, deadline)
+    block = bytes(65536)
+    try:
+        started_at = time.perf_counter()
+        writer.write(_request_line(target, keep_alive=False, method="POST", content_length=size))
+        sent = 0
+        status = None
+        try:
+            while sent < size:
+                part = min(len(block), size - sent)
+                writer.write(block[:part])
+                await asyncio.wait_for(writer.drain(), max(0.0, deadline - time.perf_counter()))
+                sent += part
+            # The server has the whole body once it answers
+            status, _ = await asyncio.wait_for(_read_head(reader), max(0.0, deadline - time.perf_counter()))
+        except asyncio.TimeoutError:
+            pass
+        return {"status": status, "bytes": sent, "started_at": started_at, "finished_at": time.perf_counter()}
+    finally:
+        writer.close()
+
+
+def _ms(start, end):
+    return round((end - start) * 1000, 1)
+
+
+class ProxySession:
+    """
+    Keep-alive HTTP connection to one URL through the SOCKS inbound.
+
+    The first request pays for the SOCKS connect and the TLS handshake; later
+    requests reuse the connection and only measure time to first byte. The
+    session reconnects by itself when the server closes the connection.
+    """
+
+    def __init__(self, proxy_port, url):
+        self.proxy_port = proxy_port
+        self.target = urlparse(url)
+        self.secure = self.target.scheme == "https"
+        self.port = self.target.port or (443 if self.secure else 80)
+        self.reader = None
+        self.writer = None
+
+    async def _connect(self):
+        start = time.perf_counter()
+        self.reader, self.writer = await open_socks_connection(self.proxy_port, self.target.hostname, self.port)
+        connected = time.perf_counter()
+        if self.secure:
+            await self.writer.start_tls(ssl.create_default_context(), server_hostname=self.target.hostname)
+        return {"connect_ms": _ms(start, connected), "handshake_ms": _ms(connected, time.perf_counter())}
+
+    async def get(self):
+        """
+        Send one GET and read the whole response.
+
+        Returns: (status, phases) where phases holds connect_ms, handshake_ms,
+        ttfb_ms, total_ms and whether the connection was reused
+        """
+        reused = self.writer is not None
+        try:
+            return await self._get(reused)
+        except (ProxyError, ConnectionError, asyncio.IncompleteReadError):
+            if not reused:
+                raise
+            # The server dropped the idle connection; retry once on a new one
+            self.close()
+            return await self._get(False)
+
+    async def _get(self, reused):
+        start = time.perf_counter()
+        phases = {"connect_ms": 0.0, "handshake_ms": 0.0}
+        if not reused:
+            phases.update(await self._connect())
+        sent = time.perf_counter()
+        self.writer.write(_request_line(self.target, keep_alive=True))
+        await self.writer.drain()
+        status, headers = await _read_head(self.reader)
+        first_byte = time.perf_counter()
+        keep_alive = await _read_body(self.reader, status, headers)
+        if not keep_alive or headers.get("connection", "").lower() == "close":
+            self.close()
+        phases.update(ttfb_ms=_ms(sent, first_byte), total_ms=_ms(start, time.perf_counter()), reused=reused)
+        return status, phases
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
@@ -0,0 +1,168 @@
+import asyncio
+import base64
+import binascii
+import os
+
+import httpx
+
+
+CHUNK_SIZE = 64 * 1024
+FETCH_TIMEOUT = 30
+# Directory that "path" sources are read from; empty turns file sources off
+SUBSCRIPTION_DIR = os.environ.get("SUBSCRIPTION_DIR", "")
+
+
+class SubscriptionDecoder:
+    """
+    Incremental decoder for subscription bodies.
+
+    Accepts plain text (one link per line) or a base64 blob of the same, fed
+    in arbitrary chunks, and hands back complete config links as they appear.
+    The format is decided from the first non-blank bytes.
+    """
+
+    def __init__(self):
+        self.encoded = None
+        self.pending = b""
+        self.text = b""
+
+    def feed(self, chunk):
+        """Add raw bytes. Returns the links completed by this chunk."""
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        if self.encoded is None:
+            self.pending += chunk
+            head = self.pending.lstrip()
+            if len(head) < 16 and b"\n" not in head:
+                return []
+            self.encoded = b"://" not in head[:256]
+            chunk, self.pending = self.pending, b""
+
+        if not self.encoded:
+            return self._lines(chunk)
+
+        # Decode whole 4-character groups only, keep the remainder for later
+        self.pending += b"".join(chunk.split())
+        usable = len(self.pending) - len(self.pending) % 4
+        data, self.pending = self.pending[:usable], self.pending[usable:]
+        return self._lines(self._b64decode(data))
+
+    def close(self):
+        """Flush whatever is left at the end of the body."""
+        if self.encoded is None:
+            head = self.pending.lstrip()
+            self.encoded = bool(head) and b"://" not in head
+            if not self.encoded:
+                self.text, self.pending = self.pending, b""
+        if self.encoded and self.pending:
+            self.pending = b"".join(self.pending.split())
+            padded = self.pending + b"=" * (-len(self.pending) % 4)
+            self.pending = b""
+            self._lines(self._b64decode(padded))
+        rest, self.text = self.text, b""
+        return self._split(rest)
+
+    @staticmethod
+    def _b64decode(data):
+        try:
+            return base64.b64decode(data.replace(b"-", b"+").replace(b"_", b"/"))
+        except binascii.Error as e:
+            raise ValueError(f"Invalid base64 subscription: {e}")
+
+    def _lines(self, data):
+        self.text += data
+        complete, sep, self.text = self.text.rpartition(b"\n")
+        return self._split(complete) if sep else []
+
+    @staticmethod
+    def _split(data):
+        links = []
+        for line in data.decode(errors="replace").splitlines():
+            line = line.strip()
+            if "://" in line:
+                links.append(line)
+        return links
+
+
+def iter_links(chunks):
+    """Yield config links from an iterable of subscription body chunks."""
+    decoder = SubscriptionDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.close()
+
+
+async def aiter_links(chunks):
+    """Yield config links from an async iterable of subscription body chunks."""
+    decoder = SubscriptionDecoder()
+    async for chunk in chunks:
+        for link in decoder.feed(chunk):
+            yield link
+    for link in decoder.close():
+        yield link
+
+
+def subscription_file(path, root=None):
+    """
+    Resolve `path` inside the subscription directory (SUBSCRIPTION_DIR).
+
+    Raises ValueError when file sources are off, the path leads outside the
+    directory (via "..", an absolute path or a symlink) or no such file exists.
+    """
+    root = SUBSCRIPTION_DIR if root is None else root
+    if not root:
+        raise ValueError("Subscription files are disabled (SUBSCRIPTION_DIR is not set)")
+    root = os.path.realpath(root)
+    full = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full]) != root:
+        raise ValueError("Subscription path is outside SUBSCRIPTION_DIR")
+    if not os.path.isfile(full):
+        raise ValueError("Subscription file not found")
+    return full
+
+
+async def read_file_chunks(path, chunk_size=CHUNK_SIZE):
+    """Read a local subscription file in chunks, off the event loop."""
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        while chunk := await asyncio.to_thread(f.read, chunk_size):
+            yield chunk
+    finally:
+        f.close()
+
+
+def iter_text_chunks(text, chunk_size=CHUNK_SIZE):
+    """Split an in-memory subscription body into chunks."""
+    for i in range(0, len(text), chunk_size):
+        yield text[i:i + chunk_size]
+
+
+async def fetch_url_chunks(url):
+    """Stream a subscription body from a URL."""
+    async with httpx.AsyncClient(timeout=FETCH_TIMEOUT, follow_redirects=True) as client:
+        async with client.stream("GET", url) as r:
+            if r.status_code != 200:
+                raise ValueError(f"Subscription fetch failed: HTTP {r.status_code}")
+            async for chunk in r.aiter_bytes(CHUNK_SIZE):
+                yield chunk
+
+
+async def _as_async(items):
+    for item in items:
+        yield item
+
+
+def subscription_links(url=None, content=None, path=None):
+    """
+    Async generator of config links from exactly one subscription source.
+
+    path is relative to SUBSCRIPTION_DIR (see subscription_file()); a bad
+    source raises ValueError here, before anything is streamed.
+    """
+    if sum(source is not None for source in (url, content, path)) != 1:
+        raise ValueError("Give exactly one of url, content or path")
+    if url is not None:
+        return aiter_links(fetch_url_chunks(url))
+    if path is not None:
+        return aiter_links(read_file_chunks(subscription_file(path)))
+    return aiter_links(_as_async(iter_text_chunks(content)))
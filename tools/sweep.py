@@ -0,0 +1,285 @@
+"""
+Headless batch runner: `python -m tools v2ray|ping INPUT [options]`.
+
+Reads one config link or host per line from a file (or stdin with `-`),
+checks them concurrently without the web server, and writes one result per
+input line to JSONL or CSV as checks finish. Links with the same config
+fingerprint are checked once. With --resume, items already in the output
+file are skipped and new results are appended.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+
+from tools import http_client
+from tools.aio import map_unordered
+from tools.dedup import SeenSet, link_key
+from tools.pinging import PING_DEADLINE, ping_from_iran_async
+from tools.throughput import DEFAULT_DOWNLOAD_URL, DEFAULT_UPLOAD_URL, throughput_options
+from tools.v2ray_conf_test import DEFAULT_TEST_URL, MAX_SAMPLES, check_v2ray_config_async, set_max_parallel_cores
+
+
+FIELDS = {
+    "v2ray": ["config", "success", "message", "latency_ms", "download_mbps", "upload_mbps", "ttfb_ms", "fingerprint",
+              "duplicate_of"],
+    "ping": ["host", "success", "complete", "ok_nodes", "total_nodes", "error", "duplicate_of"],
+}
+DEFAULT_CONCURRENCY = {"v2ray": os.cpu_count() or 8, "ping": 16}
+
+
+def read_items(lines):
+    """Non-empty, non-comment lines, stripped."""
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def ping_row(host, result):
+    nodes = result.get("data", [])
+    return {
+        "host": host,
+        "success": "error" not in result,
+        "complete": result.get("complete", False),
+        "ok_nodes": sum(node["ok"] for node in nodes),
+        "total_nodes": sum(node["total"] for node in nodes),
+        "error": result.get("error"),
+        **({"data": nodes} if nodes else {}),
+    }
+
+
+def output_format(path, requested):
+    if requested:
+        return requested
+    return "csv" if path and path.endswith(".csv") else "jsonl"
+
+
+def load_done(path, fmt, key):
+    """
+    Items already written to a partial output file.
+
+    A line cut off by a crash is dropped from the file so appended
+    results start on a fresh line.
+    """
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, "rb") as f:
+        data = f.read()
+    complete = data[:data.rfind(b"\n") + 1]
+    if len(complete) < len(data):
+        with open(path, "r+b") as f:
+            f.truncate(len(complete))
+    lines = complete.decode("utf-8").splitlines()
+
+    done = set()
+    if fmt == "csv":
+        for row in csv.DictReader(lines):
+            if row.get(key):
+                done.add(row[key])
+        return done
+    for line in lines:
+        try:
+            done.add(json.loads(line)[key])
+        except (ValueError, KeyError, TypeError):
+            continue
+    return done
+
+
+class ResultWriter:
+    """Writes and flushes one row per result, so a killed run loses nothing already checked."""
+
+    def __init__(self, stream, fmt, fields, header):
+        self.stream = stream
+        self.fmt = fmt
+        self.csv = None
+        if fmt == "csv":
+            self.csv = csv.DictWriter(stream, fields, extrasaction="ignore")
+            if header:
+                self.csv.writeheader()
+
+    def write(self, row):
+        if self.csv:
+            # A throughput report becomes columns of its own
+            self.csv.writerow({**row, **row.get("throughput", {})})
+        else:
+            self.stream.write(json.dumps(row) + "\n")
+        self.stream.flush()
+
+
+async def run_sweep(mode, items, writer, concurrency, timeout=10, test_url=DEFAULT_TEST_URL, samples=1,
+                    deadline=PING_DEADLINE, done=(), progress=None, seen=None, throughput=None):
+    """
+    Check every item not in `done` with at most `concurrency` checks running.
+
+    Items with the same key (config fingerprint, lowercased host) are checked
+    once and every one of them gets a row, with `duplicate_of` naming the
+    item that was checked. `seen` is the SeenSet of keys; with a Bloom
+    filter, finished results are not kept, so a duplicate that arrives after
+    its check finished gets a row with only its key. Rows go to `writer` in
+    completion order.
+
+    Returns: {"checked", "succeeded", "duplicates", "skipped", "elapsed_s"}
+    """
+    done = set(done)
+    seen = seen if seen is not None else SeenSet()
+    keep_results = seen.bloom is None
+    key_field = FIELDS[mode][0]
+    finished = {}  # key -> row, for duplicates arriving after their check
+    waiting = {}  # key -> duplicates of a check still running
+    keys = {}
+    stats = {"checked": 0, "succeeded": 0, "duplicates": 0, "skipped": 0}
+
+    if mode == "v2ray":
+        key_of = link_key
+
+        async def check(link):
+            result = await check_v2ray_config_async(
+                link, test_url=test_url, timeout=timeout, samples=samples, throughput=throughput
+            )
+            # Unparsable links are keyed by the link itself and have no fingerprint
+            fingerprint = keys[link] if keys[link] != link else None
+            return {"config": link, "fingerprint": fingerprint, **result}
+    else:
+        def key_of(host):
+            return host.lower()
+
+        async def check(host):
+            return ping_row(host, await ping_from_iran_async(host, deadline=deadline))
+
+    def copy_row(row, item):
+        return {**row, key_field: item, "duplicate_of": row[key_field]}
+
+    def duplicate(item, key):
+        stats["duplicates"] += 1
+        if key in waiting:
+            waiting[key].append(item)
+        elif key in finished:
+            writer.write(copy_row(finished[key], item))
+        else:
+            row = {key_field: item, "success": None, "duplicate_of": None}
+            if mode == "v2ray":
+                row["fingerprint"] = key
+            writer.write(row)
+
+    def pending():
+        for item in items:
+            if item in done:
+                stats["skipped"] += 1
+                continue
+            key = key_of(item)
+            if seen.add(key):
+                duplicate(item, key)
+                continue
+            keys[item] = key
+            waiting[key] = []
+            yield item
+
+    start = time.perf_counter()
+    async for item, row in map_unordered(check, pending(), concurrency):
+        key = keys.pop(item)
+        writer.write(row)
+        for other in waiting.pop(key):
+            writer.write(copy_row(row, other))
+        if keep_results:
+            finished[key] = row
+        stats["checked"] += 1
+        stats["succeeded"] += bool(row["success"])
+        if progress:
+            progress(stats)
+    stats["elapsed_s"] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m tools", description="Check config links or hosts in bulk")
+    parser.add_argument("mode", choices=["v2ray", "ping"])
+    parser.add_argument("input", help="file with one link or host per line, - for stdin")
+    parser.add_argument("-o", "--output", help="result file (default stdout)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="default: from the output extension, else jsonl")
+    parser.add_argument("--resume", action="store_true", help="skip items already in the output file and append")
+    parser.add_argument("-c", "--concurrency", type=int, help="checks in flight (default: CPU count for v2ray, 16 for ping)")
+    parser.add_argument("--max-cores", type=int, help="v2ray processes alive at once (default: CPU count)")
+    parser.add_argument("--timeout", type=float, default=10, help="v2ray probe timeout in seconds")
+    parser.add_argument("--test-url", default=DEFAULT_TEST_URL)
+    parser.add_argument("--samples", type=int, default=1, help=f"v2ray probes per config (max {MAX_SAMPLES})")
+    parser.add_argument("--throughput-bytes", type=int, default=0, metavar="N",
+                        help="also download N bytes through each working config (0: off)")
+    parser.add_argument("--upload-bytes", type=int, default=0, metavar="N", help="and upload N bytes")
+    parser.add_argument("--streams", type=int, default=1, help="parallel throughput streams")
+    parser.add_argument("--throughput-seconds", type=float, default=10, help="time cap per direction")
+    parser.add_argument("--throughput-url", default=DEFAULT_DOWNLOAD_URL)
+    parser.add_argument("--upload-url", default=DEFAULT_UPLOAD_URL)
+    parser.add_argument("--deadline", type=float, default=PING_DEADLINE, help="ping deadline in seconds")
+    parser.add_argument("--bloom", type=int, metavar="N",
+                        help="dedupe with a Bloom filter sized for N items instead of an exact set")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no progress on stderr")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.resume and not args.output:
+        build_parser().error("--resume needs --output")
+    if not 1 <= args.samples <= MAX_SAMPLES:
+        build_parser().error(f"--samples must be between 1 and {MAX_SAMPLES}")
+    if args.concurrency is not None and args.concurrency < 1:
+        build_parser().error("--concurrency must be at least 1")
+    if args.max_cores is not None and args.max_cores < 1:
+        build_parser().error("--max-cores must be at least 1")
+
+    throughput = None
+    if args.throughput_bytes or args.upload_bytes:
+        try:
+            throughput = throughput_options(
+                args.throughput_bytes, args.upload_bytes, args.streams, args.throughput_seconds,
+                args.throughput_url, args.upload_url
+            )
+        except ValueError as e:
+            build_parser().error(str(e))
+
+    fmt = output_format(args.output, args.format)
+    fields = FIELDS[args.mode]
+    done = load_done(args.output, fmt, fields[0]) if args.resume else set()
+    concurrency = args.concurrency or DEFAULT_CONCURRENCY[args.mode]
+    if args.mode == "v2ray":
+        set_max_parallel_cores(args.max_cores or os.cpu_count() or 8)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    if args.output:
+        header = not (args.resume and os.path.exists(args.output) and os.path.getsize(args.output))
+        sink = open(args.output, "a" if args.resume else "w", encoding="utf-8", newline="")
+    else:
+        header = True
+        sink = sys.stdout
+
+    def progress(stats):
+        print(f"\r{stats['checked']} checked, {stats['succeeded']} ok", end="", file=sys.stderr, flush=True)
+
+    async def run():
+        try:
+            return await run_sweep(
+                args.mode, read_items(source), ResultWriter(sink, fmt, fields, header), concurrency,
+                timeout=args.timeout, test_url=args.test_url, samples=args.samples, deadline=args.deadline,
+                done=done, progress=None if args.quiet else progress, seen=SeenSet(args.bloom),
+                throughput=throughput
+            )
+        finally:
+            await http_client.close_client()
+
+    try:
+        stats = asyncio.run(run())
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+    if not args.quiet:
+        print(f"\r{stats['checked']} checked, {stats['succeeded']} ok, {stats['duplicates']} duplicates,"
+              f" {stats['skipped']} skipped"
+              f" in {stats['elapsed_s']}s", file=sys.stderr)
+    return 0
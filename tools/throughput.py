@@ -0,0 +1,117 @@
+import asyncio
+import math
+import os
+import time
+import weakref
+
+from tools.socks_probe import http_download, http_upload
+
+
+DEFAULT_DOWNLOAD_URL = "https://speed.cloudflare.com/__down?bytes=25000000"
+DEFAULT_UPLOAD_URL = "https://speed.cloudflare.com/__up"
+MAX_BYTES = 100 * 1024 * 1024
+MAX_STREAMS = 8
+MAX_SECONDS = 30
+# Concurrent measurements share the uplink and would measure each other
+MAX_PARALLEL_TESTS = int(os.environ.get("THROUGHPUT_PARALLEL", "1"))
+
+_test_slots = weakref.WeakKeyDictionary()
+
+
+def throughput_options(download_bytes=10_000_000, upload_bytes=0, streams=1, max_seconds=10,
+                       url=DEFAULT_DOWNLOAD_URL, upload_url=DEFAULT_UPLOAD_URL):
+    """Checked keyword arguments for measure_throughput(). Raises ValueError when out of range."""
+    if not 0 <= download_bytes <= MAX_BYTES or not 0 <= upload_bytes <= MAX_BYTES:
+        raise ValueError(f"download_bytes and upload_bytes must be between 0 and {MAX_BYTES}")
+    if download_bytes == upload_bytes == 0:
+        raise ValueError("nothing to transfer")
+    if not 1 <= streams <= MAX_STREAMS:
+        raise ValueError(f"streams must be between 1 and {MAX_STREAMS}")
+    if not 0 < max_seconds <= MAX_SECONDS:
+        raise ValueError(f"max_seconds must be between 0 and {MAX_SECONDS}")
+    return {
+        "download_bytes": download_bytes, "upload_bytes": upload_bytes, "streams": streams,
+        "max_seconds": max_seconds, "url": url, "upload_url": upload_url,
+    }
+
+
+def _slots():
+    loop = asyncio.get_running_loop()
+    slots = _test_slots.get(loop)
+    if slots is None:
+        slots = _test_slots[loop] = asyncio.Semaphore(MAX_PARALLEL_TESTS)
+    return slots
+
+
+def _mbps(size, seconds):
+    return round(size * 8 / 1e6 / seconds, 2) if size and seconds > 0 else 0.0
+
+
+async def _streams(transfer, streams, total, deadline):
+    """Run `streams` transfers of an equal share of `total` bytes. Returns (results, errors)."""
+    share = math.ceil(total / streams)
+    outcomes = await asyncio.gather(*(transfer(share, deadline) for _ in range(streams)), return_exceptions=True)
+    results = [o for o in outcomes if isinstance(o, dict)]
+    errors = [f"Error: {o}" for o in outcomes if not isinstance(o, dict)]
+    return results, errors
+
+
+async def measure_throughput(proxy_port, download_bytes=10_000_000, upload_bytes=0, streams=1, max_seconds=10,
+                             url=DEFAULT_DOWNLOAD_URL, upload_url=DEFAULT_UPLOAD_URL):
+    """
+    Download (and optionally upload) through the SOCKS inbound over parallel streams.
+
+    Each direction moves at most its byte count, split evenly over the
+    streams, and stops after max_seconds. Download Mbps is sustained: it
+    counts from the first body byte, so connect and TTFB are left out.
+    Only MAX_PARALLEL_TESTS measurements run at once per event loop; a
+    measurement that waits longer than max_seconds for its turn gives up.
+
+    Returns: {"download_mbps", "download_bytes", "ttfb_ms", "upload_mbps", "upload_bytes",
+    "streams", "capped", "errors"}
+    """
+    report = {
+        "download_mbps": 0.0, "download_bytes": 0, "ttfb_ms": None,
+        "upload_mbps": 0.0, "upload_bytes": 0, "streams": streams, "capped": False, "errors": [],
+    }
+    slots = _slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), max_seconds)
+    except asyncio.TimeoutError:
+        return {**report, "capped": True, "errors": [f"Error: no measurement slot free within {max_seconds}s"]}
+    try:
+        if download_bytes:
+            deadline = time.perf_counter() + max_seconds
+
+            async def download(share, deadline):
+                return await http_download(proxy_port, url, share, deadline)
+
+            results, errors = await _streams(download, streams, download_bytes, deadline)
+            report["errors"] += errors + [f"HTTP {r['status']}" for r in results if not 200 <= r["status"] < 300]
+            results = [r for r in results if 200 <= r["status"] < 300]
+            started = [r for r in results if r["first_byte_at"] is not None]
+            if results:
+                report["ttfb_ms"] = round(min(r["head_at"] - r["sent_at"] for r in results) * 1000, 1)
+            if started:
+                received = sum(r["bytes"] for r in started)
+                elapsed = max(r["finished_at"] for r in started) - min(r["first_byte_at"] for r in started)
+                report.update(download_bytes=received, download_mbps=_mbps(received, elapsed))
+            report["capped"] = time.perf_counter() >= deadline
+
+        if upload_bytes:
+            deadline = time.perf_counter() + max_seconds
+
+            async def upload(share, deadline):
+                return await http_upload(proxy_port, upload_url, share, deadline)
+
+            results, errors = await _streams(upload, streams, upload_bytes, deadline)
+            report["errors"] += errors
+            if results:
+                sent = sum(r["bytes"] for r in results)
+                elapsed = max(r["finished_at"] for r in results) - min(r["started_at"] for r in results)
+                report.update(upload_bytes=sent, upload_mbps=_mbps(sent, elapsed))
+            report["capped"] = report["capped"] or time.perf_counter() >= deadline
+
+        return report
+    finally:
+        slots.release()
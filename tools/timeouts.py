@@ -0,0 +1,99 @@
+import os
+from collections import OrderedDict
+
+
+ADAPTIVE_TIMEOUTS = os.environ.get("ADAPTIVE_TIMEOUTS", "1") != "0"
+MIN_SAMPLES = 3
+FLOOR = 1.0
+MARGIN = 0.5
+DEVIATIONS = 4
+MAX_SERVERS = 10000
+
+
+def server_key(outbound):
+    """address:port of an outbound's server."""
+    server = outbound["settings"]["vnext"][0]
+    return f"{server['address']}:{server['port']}"
+
+
+class AdaptiveTimeouts:
+    """
+    Per-server probe deadlines learned from past latencies.
+
+    Each server keeps an EWMA of its latency and of the deviation from it,
+    like TCP's retransmission timer (RFC 6298). Once a server has
+    MIN_SAMPLES successes, its deadline is mean + DEVIATIONS * deviation +
+    MARGIN, at least FLOOR and never above the caller's timeout. A probe
+    cut short by a learned deadline doubles that server's backoff, so a
+    server that got slower is given more time on the next test instead of
+    being dropped; a success resets it.
+    """
+
+    def __init__(self, alpha=0.125, beta=0.25, enabled=ADAPTIVE_TIMEOUTS, max_servers=MAX_SERVERS):
+        self.alpha = alpha
+        self.beta = beta
+        self.enabled = enabled
+        self.max_servers = max_servers
+        self.servers = OrderedDict()
+        self.tightened = 0
+        self.cut_short = 0
+
+    def deadline(self, outbound, timeout):
+        """Probe timeout in seconds for this outbound's server, at most `timeout`."""
+        entry = self.servers.get(server_key(outbound))
+        if not self.enabled or entry is None or entry["samples"] < MIN_SAMPLES:
+            return timeout
+        learned = (entry["mean"] + DEVIATIONS * entry["deviation"] + MARGIN) * entry["backoff"]
+        deadline = round(min(timeout, max(FLOOR, learned)), 3)
+        if deadline < timeout:
+            self.tightened += 1
+        return deadline
+
+    def observe(self, outbound, result, deadline, timeout):
+        """Learn from one probe result that ran with `deadline` (out of the caller's `timeout`)."""
+        key = server_key(outbound)
+        entry = self.servers.get(key)
+        if result["success"]:
+            latency = result["latency_ms"] / 1000
+            if entry is None:
+                entry = {"mean": latency, "deviation": latency / 2, "samples": 0, "backoff": 1}
+            else:
+                entry["deviation"] += self.beta * (abs(latency - entry["mean"]) - entry["deviation"])
+                entry["mean"] += self.alpha * (latency - entry["mean"])
+            entry["samples"] += 1
+            entry["backoff"] = 1
+        elif entry is not None and result["message"] == "Timeout" and deadline < timeout:
+            self.cut_short += 1
+            entry["backoff"] = min(entry["backoff"] * 2, 64)
+        else:
+            return
+        self.servers[key] = entry
+        self.servers.move_to_end(key)
+        while len(self.servers) > self.max_servers:
+            self.servers.popitem(last=False)
+
+    def estimate(self, key):
+        """Current estimate of one server (address:port), or None."""
+        entry = self.servers.get(key)
+        if entry is None:
+            return None
+        return {
+            "mean_ms": round(entry["mean"] * 1000, 1),
+            "deviation_ms": round(entry["deviation"] * 1000, 1),
+            "samples": entry["samples"],
+            "backoff": entry["backoff"],
+        }
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "servers": len(self.servers),
+            "tightened": self.tightened,
+            "cut_short": self.cut_short,
+        }
+
+    def clear(self):
+        self.servers.clear()
+
+
+server_timeouts = AdaptiveTimeouts()
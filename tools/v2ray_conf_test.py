@@ -1,10 +1,182 @@
-import subprocess
+import asyncio
+import hashlib
 import json
 import os
 import time
 import socket
+import tempfile
+import threading
+import uuid
+import weakref
+from string import Template
 from urllib.parse import urlparse, parse_qs
-import requests
+
+from tools import history
+from tools.core_process import CoreProcess
+from tools.metrics import check_results, in_flight, phase
+from tools.preflight import preflight as run_preflight
+from tools.socks_probe import ProxySession, http_get
+from tools.throughput import measure_throughput
+from tools.breaker import server_breaker
+from tools.timeouts import server_key, server_timeouts
+
+
+MAX_BATCH_PROBES = 64
+MAX_SAMPLES = 20
+MAX_PARALLEL_CORES = int(os.environ.get("V2RAY_MAX_CORES", "8"))
+DEFAULT_TEST_URL = "http://www.google.com/generate_204"
+# Pipe configs to the core (`run -c stdin:`); set V2RAY_CONFIG_STDIN=0 for cores that need a file
+CONFIG_STDIN = os.environ.get("V2RAY_CONFIG_STDIN", "1") != "0"
+# Local inbound ports, e.g. "20000-20999"; empty uses free ephemeral ports
+PORT_RANGE = os.environ.get("V2RAY_PORT_RANGE", "")
+
+# One semaphore per event loop: asyncio primitives can't be shared across loops
+_core_slots = weakref.WeakKeyDictionary()
+# The sync wrappers start a loop per call, so threaded callers are bounded here instead
+_sync_core_slots = threading.BoundedSemaphore(MAX_PARALLEL_CORES)
+_warm_pool = None
+_ports_lock = threading.Lock()
+_ports_in_use = set()
+_port_range = None
+_port_cursor = 0
+
+
+def set_max_parallel_cores(max_cores):
+    """Change how many v2ray processes may run at the same time."""
+    global MAX_PARALLEL_CORES, _sync_core_slots
+    if max_cores < 1:
+        raise ValueError("max_cores must be at least 1")
+    MAX_PARALLEL_CORES = max_cores
+    _core_slots.clear()
+    _sync_core_slots = threading.BoundedSemaphore(max_cores)
+
+
+def core_slots():
+    """Semaphore bounding live cores on the running event loop."""
+    loop = asyncio.get_running_loop()
+    slots = _core_slots.get(loop)
+    if slots is None:
+        slots = _core_slots[loop] = asyncio.Semaphore(MAX_PARALLEL_CORES)
+    return slots
+
+
+def use_warm_pool(pool):
+    """Route single-config checks through a warm core pool (None to stop)."""
+    global _warm_pool
+    _warm_pool = pool
+
+
+def parse_port_range(text):
+    """"first-last" -> (first, last). Raises ValueError."""
+    try:
+        first, last = (int(part) for part in text.split("-"))
+    except ValueError:
+        raise ValueError(f"Port range must look like 20000-20999, not {text!r}")
+    if not 1024 <= first <= last <= 65535:
+        raise ValueError(f"Bad port range {text!r}")
+    return first, last
+
+
+def set_port_range(port_range):
+    """Take local ports only from (first, last), so processes on one box never collide (None: ephemeral ports)."""
+    global _port_range, _port_cursor
+    with _ports_lock:
+        _port_range = port_range
+        _port_cursor = 0
+
+
+def _port_free(port):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        try:
+            s.bind(("127.0.0.1", port))
+        except OSError:
+            return False
+    return True
+
+
+def _ports_from_range(count):
+    global _port_cursor
+    first, last = _port_range
+    size = last - first + 1
+    ports = []
+    for step in range(size):
+        port = first + (_port_cursor + step) % size
+        if port not in _ports_in_use and _port_free(port):
+            ports.append(port)
+            if len(ports) == count:
+                # Start after the last handed-out port, so released ports cool down before reuse
+                _port_cursor = (port - first + 1) % size
+                return ports
+    raise RuntimeError(f"No {count} free ports in {first}-{last}")
+
+
+def reserve_ports(count):
+    """Reserve free local ports (from the port range, if set). Give them back with release_ports()."""
+    ports = []
+    with _ports_lock:
+        if _port_range:
+            ports = _ports_from_range(count)
+            _ports_in_use.update(ports)
+            return ports
+        while len(ports) < count:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                s.bind(("127.0.0.1", 0))
+                port = s.getsockname()[1]
+            if port not in _ports_in_use:
+                _ports_in_use.add(port)
+                ports.append(port)
+    return ports
+
+
+def release_ports(ports):
+    """Return ports taken with reserve_ports()."""
+    with _ports_lock:
+        _ports_in_use.difference_update(ports)
+
+
+if PORT_RANGE:
+    set_port_range(parse_port_range(PORT_RANGE))
+
+
+def compile_template(obj, *fields):
+    """
+    Serialize obj to compact JSON once, as a string.Template.
+
+    String values "$name" for the given fields become placeholders that are
+    substituted with raw JSON, so only the per-use fields are serialized later.
+    """
+    text = json.dumps(obj, separators=(",", ":")).replace("$", "$$")
+    for field in fields:
+        text = text.replace(f'"$${field}"', f"${field}")
+    return Template(text)
+
+
+# Static parts of the configs, built once
+HTTP_HEADERS = {
+    "User-Agent": ["Mozilla/5.0"],
+    "Accept-Encoding": ["gzip, deflate"],
+    "Connection": ["keep-alive"],
+    "Pragma": "no-cache"
+}
+SOCKS_INBOUND = compile_template({
+    "tag": "$tag",
+    "port": "$port",
+    "listen": "127.0.0.1",
+    "protocol": "socks",
+    "settings": {"auth": "noauth", "udp": True}
+}, "tag", "port")
+ROUTE_RULE = compile_template({"type": "field", "inboundTag": ["$inbound"], "outboundTag": "$outbound"},
+                              "inbound", "outbound")
+
+
+def canonical_id(user_id):
+    """Lowercase a hyphenated UUID; other ids are hashed by the core as-is, so they stay untouched."""
+    if len(user_id) != 36:
+        return user_id
+    try:
+        return str(uuid.UUID(user_id))
+    except ValueError:
+        return user_id
 
 
 def parse_vless_link(link):
@@ -23,6 +195,10 @@ def parse_vless_link(link):
         "security": params.get("security", ["none"])[0]
     }
     
+    # Server name for TLS
+    if stream_settings["security"] == "tls":
+        stream_settings["tlsSettings"] = {"serverName": params.get("sni", [parsed.hostname])[0]}
+    
     # Add TCP settings if using http header
     if network == "tcp" and header_type == "http":
         host = params.get("host", [""])[0]
@@ -34,13 +210,7 @@ def parse_vless_link(link):
                     "version": "1.1",
                     "method": "GET",
                     "path": [path],
-                    "headers": {
-                        "Host": [host] if host else [],
-                        "User-Agent": ["Mozilla/5.0"],
-                        "Accept-Encoding": ["gzip, deflate"],
-                        "Connection": ["keep-alive"],
-                        "Pragma": "no-cache"
-                    }
+                    "headers": {"Host": [host] if host else [], **HTTP_HEADERS}
                 }
             }
         }
@@ -51,7 +221,7 @@ def parse_vless_link(link):
             "vnext": [{
                 "address": parsed.hostname,
                 "port": parsed.port,
-                "users": [{"id": parsed.username, "encryption": params.get("encryption", ["none"])[0]}]
+                "users": [{"id": canonical_id(parsed.username), "encryption": params.get("encryption", ["none"])[0]}]
             }]
         },
         "streamSettings": stream_settings
@@ -59,7 +229,11 @@ def parse_vless_link(link):
 
 
 def find_v2ray_exe():
-    """Find v2ray.exe in project folder."""
+    """Find v2ray.exe in project folder (or the binary named by V2RAY_PATH)."""
+    override = os.environ.get("V2RAY_PATH")
+    if override:
+        return override if os.path.exists(override) else None
+
     script_dir = os.path.dirname(os.path.abspath(__file__))
     project_root = os.path.abspath(os.path.join(script_dir, os.pardir))
     v2ray_path = os.path.join(project_root, "v2ray-windows-64", "v2ray.exe")
@@ -69,87 +243,468 @@ def find_v2ray_exe():
     return None
 
 
-def check_v2ray_config(config_link, test_url="http://www.google.com/generate_204", timeout=10):
+def check_result(success, message, latency_ms=-1.0, **details):
+    """Result of one config test: success, message, latency_ms plus optional details."""
+    return {"success": success, "message": message, "latency_ms": latency_ms, **details}
+
+
+def as_tuple(result):
+    """(success, message, latency_ms) view of a check result."""
+    return result["success"], result["message"], result["latency_ms"]
+
+
+def parse_config_link(config_link):
     """
-    Test V2Ray config link by running v2ray and checking connection.
-    
-    Returns: (success: bool, message: str, latency_ms: float)
+    Parse a config link into an outbound.
+
+    Returns: (outbound, None) or (None, failure result)
     """
-    # Parse link
     try:
         parsed = urlparse(config_link)
         if parsed.scheme == "vless":
-            outbound = parse_vless_link(config_link)
-        else:
-            return False, f"Unsupported protocol: {parsed.scheme}", -1.0
+            return parse_vless_link(config_link), None
+        return None, check_result(False, f"Unsupported protocol: {parsed.scheme}")
     except Exception as e:
-        return False, f"Parse error: {e}", -1.0
-    
-    # Find v2ray
-    v2ray_exe = find_v2ray_exe()
-    if not v2ray_exe:
-        return False, "v2ray.exe not found", -1.0
-    
-    # Create config
-    local_port = 10809
-    config = {
-        "inbounds": [{
-            "port": local_port,
-            "listen": "127.0.0.1",
-            "protocol": "socks",
-            "settings": {"auth": "noauth", "udp": True}
-        }],
-        "outbounds": [outbound]
-    }
-    
-    config_file = "temp_config.json"
-    process = None
-    
+        return None, check_result(False, f"Parse error: {e}")
+
+
+def config_fingerprint(outbound):
+    """
+    Stable id of a parsed outbound: links that parse the same share it.
+
+    parse_vless_link() drops the #remark and reads parameters by name, so
+    links differing only in those get the same fingerprint.
+    """
+    return hashlib.sha256(json.dumps(outbound, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def render_core_config(outbounds, ports):
+    """
+    Core config JSON with one SOCKS inbound per outbound.
+
+    Inbound `in-N` listens on ports[N] and is routed by tag to outbound `out-N`.
+    Inbounds and rules come from precompiled templates; only the outbounds
+    themselves are serialized per call.
+    """
+    compact = (",", ":")
+    inbounds = []
+    tagged = []
+    rules = []
+    for i, (outbound, port) in enumerate(zip(outbounds, ports)):
+        inbound_tag = json.dumps(f"in-{i}")
+        outbound_tag = json.dumps(f"out-{i}")
+        inbounds.append(SOCKS_INBOUND.substitute(tag=inbound_tag, port=int(port)))
+        tagged.append(json.dumps({**outbound, "tag": f"out-{i}"}, separators=compact))
+        rules.append(ROUTE_RULE.substitute(inbound=inbound_tag, outbound=outbound_tag))
+
+    return (
+        f'{{"inbounds":[{",".join(inbounds)}],"outbounds":[{",".join(tagged)}],'
+        f'"routing":{{"rules":[{",".join(rules)}]}}}}'
+    )
+
+
+async def spawn_core(v2ray_exe, config_text):
+    """
+    Start `v2ray run` on a config.
+
+    The config is piped over stdin, so nothing touches the disk; with
+    CONFIG_STDIN off it goes through a temp file instead.
+
+    Returns: (CoreProcess, temp file path or None)
+    """
+    if CONFIG_STDIN:
+        process = await CoreProcess.spawn(v2ray_exe, "run", "-c", "stdin:", input=config_text.encode())
+        return process, None
+
+    fd, config_file = tempfile.mkstemp(prefix="v2ray-", suffix=".json")
+    with os.fdopen(fd, 'w') as f:
+        f.write(config_text)
     try:
-        # Write config
-        with open(config_file, 'w') as f:
-            json.dump(config, f)
-        
-        # Start v2ray
-        process = subprocess.Popen(
-            [v2ray_exe, "run", "-c", config_file],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        
-        # Wait for proxy to be ready
-        for _ in range(20):
+        return await CoreProcess.spawn(v2ray_exe, "run", "-c", config_file), config_file
+    except BaseException:
+        os.remove(config_file)
+        raise
+
+
+async def wait_for_ports(ports, attempts=20):
+    """Wait until every local port accepts connections."""
+    pending = list(ports)
+    for _ in range(attempts):
+        still_pending = []
+        for port in pending:
             try:
-                socket.create_connection(("127.0.0.1", local_port), timeout=0.1).close()
-                break
-            except (socket.timeout, ConnectionRefusedError):
-                time.sleep(0.1)
-        else:
-            return False, "V2Ray failed to start", -1.0
-        
-        # Test connection
-        proxies = {
-            'http': f'socks5h://127.0.0.1:{local_port}',
-            'https': f'socks5h://127.0.0.1:{local_port}'
-        }
-        
-        start = time.time()
-        response = requests.get(test_url, proxies=proxies, timeout=timeout)
-        latency = (time.time() - start) * 1000
+                _, writer = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), 0.1)
+                writer.close()
+            except (asyncio.TimeoutError, OSError):
+                still_pending.append(port)
+        pending = still_pending
+        if not pending:
+            return True
+        await asyncio.sleep(0.1)
+    return False
+
+
+async def probe_proxy(local_port, test_url, timeout, samples=1):
+    """Fetch test_url through the local SOCKS inbound. Returns a check result."""
+    if samples > 1:
+        return await profile_proxy(local_port, test_url, timeout, samples)
+    try:
+        start = time.perf_counter()
+        status = await asyncio.wait_for(http_get(local_port, test_url), timeout)
+        latency = (time.perf_counter() - start) * 1000
         
-        if 200 <= response.status_code < 300:
-            return True, f"Success ({response.status_code})", round(latency)
+        if 200 <= status < 300:
+            return check_result(True, f"Success ({status})", round(latency))
         else:
-            return False, f"HTTP {response.status_code}", -1.0
-            
-    except requests.exceptions.Timeout:
-        return False, "Timeout", -1.0
+            return check_result(False, f"HTTP {status}")
+    except asyncio.TimeoutError:
+        return check_result(False, "Timeout")
     except Exception as e:
-        return False, f"Error: {e}", -1.0
+        return check_result(False, f"Error: {e}")
+
+
+def summarize_latencies(latencies):
+    """min/p50/p95/max and jitter (mean change between consecutive samples) in ms."""
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+    changes = [abs(b - a) for a, b in zip(latencies, latencies[1:])]
+    return {
+        "samples": len(latencies),
+        "min_ms": ordered[0],
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "max_ms": ordered[-1],
+        "jitter_ms": round(sum(changes) / len(changes), 1) if changes else 0.0,
+    }
+
+
+async def profile_proxy(local_port, test_url, timeout, samples):
+    """
+    Fetch test_url `samples` times over one keep-alive session.
+
+    Each sample is split into connect, handshake and time-to-first-byte
+    phases. latency_ms is the median of the successful samples; a config
+    whose first sample fails is not sampled any further.
+    """
+    session = ProxySession(local_port, test_url)
+    phases = []
+    errors = []
+    ok_status = None
+    try:
+        for _ in range(min(samples, MAX_SAMPLES)):
+            try:
+                status, sample = await asyncio.wait_for(session.get(), timeout)
+            except asyncio.TimeoutError:
+                errors.append("Timeout")
+                session.close()
+            except Exception as e:
+                errors.append(f"Error: {e}")
+                session.close()
+            else:
+                if 200 <= status < 300:
+                    ok_status = status
+                    phases.append(sample)
+                else:
+                    errors.append(f"HTTP {status}")
+            if not phases:
+                break
     finally:
-        # Cleanup
-        if process:
-            process.kill()
-            process.wait()
-        if os.path.exists(config_file):
-            os.remove(config_file)
+        session.close()
+
+    if not phases:
+        return check_result(False, errors[0])
+    profile = summarize_latencies([sample["total_ms"] for sample in phases])
+    profile.update(errors=len(errors), phases=phases)
+    return check_result(True, f"Success ({ok_status})", round(profile["p50_ms"]), profile=profile)
+
+
+async def probe_config(local_port, test_url, timeout, samples=1, throughput=None):
+    """probe_proxy(), then a throughput measurement for configs that passed when `throughput` options are given."""
+    result = await probe_proxy(local_port, test_url, timeout, samples)
+    if throughput and result["success"]:
+        with phase("v2ray", "throughput"):
+            result["throughput"] = await measure_throughput(local_port, **throughput)
+    return result
+
+
+async def check_v2ray_config_async(config_link, test_url=DEFAULT_TEST_URL, timeout=10, preflight=False, samples=1,
+                                   throughput=None, force=False, bounded=False):
+    """
+    Test V2Ray config link by running v2ray and checking connection.
+
+    With preflight=True the server is first checked with a direct TCP (and TLS)
+    connection and unreachable servers are rejected before any core starts.
+    With samples > 1 test_url is fetched that many times over one keep-alive
+    connection and a latency "profile" is attached. With throughput options
+    (see throughput_options()) a working config also gets a "throughput" report.
+    The probe deadline is learned per server (tools.timeouts) with `timeout`
+    as its upper bound; "timeout_s" reports the deadline that was used.
+    Servers that keep failing get a fast "suspended" result until their
+    circuit breaker lets a retry through (tools.breaker); force=True tests anyway.
+    bounded=True says `timeout` is only a bound on useful latencies (see
+    race_top_k): a probe that hits it is "Cut off", not failed, and is
+    neither logged to history nor learned from.
+
+    Returns: {"success", "message", "latency_ms"} plus "timeout_s", and "preflight_ms" when pre-flight ran
+    """
+    pool = _warm_pool
+    if pool is None or pool.loop is not asyncio.get_running_loop():
+        return (await check_v2ray_configs_async(
+            [config_link], test_url=test_url, timeout=timeout, preflight=preflight, samples=samples,
+            throughput=throughput, force=force, bounded=bounded
+        ))[0]
+
+    with in_flight("v2ray"):
+        result = await _check_pooled(pool, config_link, test_url, timeout, preflight, samples, throughput, force,
+                                     bounded)
+    record_outcomes([config_link], [result])
+    return result
+
+
+async def _check_pooled(pool, config_link, test_url, timeout, preflight, samples, throughput, force, bounded):
+    with phase("v2ray", "parse"):
+        outbound, failure = parse_config_link(config_link)
+    if failure:
+        return failure
+    suspended = None if force else breaker_result(outbound)
+    if suspended:
+        return suspended
+    details = {}
+    if preflight:
+        with phase("v2ray", "preflight"):
+            ok, message, elapsed = await run_preflight(outbound)
+        if not ok:
+            server_breaker.record(server_key(outbound), False)
+            return check_result(False, message, preflight_ms=elapsed)
+        details["preflight_ms"] = elapsed
+    result = await pool.check(outbound, test_url, timeout, samples=samples, throughput=throughput, bounded=bounded)
+    return {**result, **details}
+
+
+def breaker_result(outbound):
+    """A fast "suspended" result while the server's circuit breaker is open, else None."""
+    key = server_key(outbound)
+    retry_in = server_breaker.check(key)
+    if retry_in is None:
+        return None
+    return check_result(False, server_breaker.suspended(key, retry_in), suspended=True, retry_in_s=retry_in)
+
+
+def cut_off(result):
+    """A bounded probe's timeout: the server was only slower than the bound, which says nothing about its health."""
+    if result["success"] or result["message"] != "Timeout":
+        return result
+    return {**result, "message": "Cut off", "cut_off": True}
+
+
+def learn_from_probe(outbound, result, deadline, timeout):
+    """
+    Feed a probe that really ran (on a core that stayed up) to the adaptive timeouts.
+
+    Returns its verdict on the server for the breaker: True, False, or None
+    when it proves nothing (cut off, or a timeout at a learned deadline
+    tighter than the caller's `timeout`).
+    """
+    if result.get("cut_off"):
+        return None
+    server_timeouts.observe(outbound, result, deadline, timeout)
+    if not result["success"] and result["message"] == "Timeout" and deadline < timeout:
+        return None
+    return result["success"]
+
+
+def note_health(health, outbound, ok):
+    """Merge one verdict into `health` (server key -> ok); any success on a server wins."""
+    if ok is not None:
+        key = server_key(outbound)
+        health[key] = health.get(key, False) or ok
+
+
+def record_health(health):
+    """Feed `health` to the breaker: one outcome per server, however many links of a batch point at it."""
+    for key, ok in health.items():
+        server_breaker.record(key, ok)
+
+
+def record_outcomes(config_links, results):
+    """Count outcomes and log the results of parsable links to the history store."""
+    keep_history = history.get_history() is not None
+    for link, result in zip(config_links, results):
+        if result.get("suspended") or result.get("cut_off"):
+            # Not a new observation of the server
+            check_results.inc(kind="v2ray", outcome="suspended" if result.get("suspended") else "cut_off")
+            continue
+        check_results.inc(kind="v2ray", outcome="success" if result["success"] else "failure")
+        if keep_history:
+            outbound, failure = parse_config_link(link)
+            if not failure:
+                history.record_v2ray(config_fingerprint(outbound), link, result)
+
+
+async def check_v2ray_configs_async(config_links, test_url=DEFAULT_TEST_URL, timeout=10, preflight=False, samples=1,
+                                    throughput=None, force=False, bounded=False):
+    """
+    Test many config links inside a single v2ray process.
+
+    Every parsable link gets its own SOCKS inbound routed to its own outbound,
+    and all probes run at the same time against that one process.
+
+    Returns: list of check results, in the order of config_links
+    """
+    with in_flight("v2ray", len(config_links)):
+        results = await _check_batch(config_links, test_url, timeout, preflight, samples, throughput, force, bounded)
+    record_outcomes(config_links, results)
+    return results
+
+
+async def _check_batch(config_links, test_url, timeout, preflight, samples, throughput, force, bounded):
+    results = [None] * len(config_links)
+    outbounds = []
+    positions = {}
+    first = {}
+    with phase("v2ray", "parse"):
+        for i, link in enumerate(config_links):
+            outbound, failure = parse_config_link(link)
+            if failure:
+                results[i] = failure
+                continue
+            # Links with the same fingerprint share one inbound and one probe
+            fingerprint = config_fingerprint(outbound)
+            if fingerprint not in first:
+                first[fingerprint] = len(outbounds)
+                outbounds.append(outbound)
+            positions[i] = first[fingerprint]
+
+    if outbounds:
+        checked = await _check_outbounds(outbounds, test_url, timeout, preflight, samples, throughput, force, bounded)
+        for i, position in positions.items():
+            results[i] = checked[position]
+    return results
+
+
+async def _check_outbounds(outbounds, test_url, timeout, preflight, samples, throughput, force, bounded):
+    results = [None] * len(outbounds)
+    indexes = list(range(len(outbounds)))
+    if not force:
+        for i, outbound in enumerate(outbounds):
+            results[i] = breaker_result(outbound)
+        indexes = [i for i in indexes if results[i] is None]
+        outbounds = [outbounds[i] for i in indexes]
+
+    details = {}
+    health = {}
+    if preflight and outbounds:
+        with phase("v2ray", "preflight"):
+            checks = await asyncio.gather(*(run_preflight(outbound) for outbound in outbounds))
+        reachable = []
+        for i, outbound, (ok, message, elapsed) in zip(indexes, outbounds, checks):
+            if ok:
+                reachable.append((i, outbound))
+                details[i] = {"preflight_ms": elapsed}
+            else:
+                note_health(health, outbound, False)
+                results[i] = check_result(False, message, preflight_ms=elapsed)
+        indexes = [i for i, _ in reachable]
+        outbounds = [outbound for _, outbound in reachable]
+
+    if not outbounds:
+        record_health(health)
+        return results
+
+    v2ray_exe = find_v2ray_exe()
+    if not v2ray_exe:
+        record_health(health)
+        for i in indexes:
+            results[i] = check_result(False, "v2ray.exe not found", **details.get(i, {}))
+        return results
+
+    deadlines = [server_timeouts.deadline(outbound, timeout) for outbound in outbounds]
+    for i, deadline in zip(indexes, deadlines):
+        details[i] = {**details.get(i, {}), "timeout_s": deadline}
+
+    # Each run owns its ports (and config file, if any), so concurrent runs never collide
+    async with core_slots():
+        ports = []
+        config_file = None
+        process = None
+
+        try:
+            ports = reserve_ports(len(outbounds))
+            with phase("v2ray", "config_write"):
+                config_text = render_core_config(outbounds, ports)
+
+            with phase("v2ray", "spawn"):
+                process, config_file = await spawn_core(v2ray_exe, config_text)
+
+            # Fall back to a port check for cores that don't log the started line
+            with phase("v2ray", "ready"):
+                ready = await process.wait_ready() or (process.alive() and await wait_for_ports(ports, attempts=1))
+            if not ready:
+                probes = [check_result(False, process.failure("V2Ray failed to start"))] * len(ports)
+            else:
+                probe_slots = asyncio.Semaphore(MAX_BATCH_PROBES)
+
+                async def probe(port, deadline):
+                    async with probe_slots:
+                        return await probe_config(port, test_url, deadline, samples, throughput)
+
+                with phase("v2ray", "probe"):
+                    probes = await asyncio.gather(*(probe(port, d) for port, d in zip(ports, deadlines)))
+                if bounded:
+                    probes = [cut_off(result) for result in probes]
+                if not process.alive():
+                    message = process.failure("V2Ray exited during the test")
+                    probes = [r if r["success"] else check_result(False, message) for r in probes]
+                else:
+                    for outbound, deadline, result in zip(outbounds, deadlines, probes):
+                        note_health(health, outbound, learn_from_probe(outbound, result, deadline, timeout))
+
+            for i, result in zip(indexes, probes):
+                results[i] = {**result, **details.get(i, {})}
+
+        except Exception as e:
+            for i in indexes:
+                if results[i] is None:
+                    results[i] = check_result(False, f"Error: {e}", **details.get(i, {}))
+        finally:
+            with phase("v2ray", "teardown"):
+                if process:
+                    await process.stop()
+                release_ports(ports)
+                if config_file and os.path.exists(config_file):
+                    os.remove(config_file)
+
+    record_health(health)
+    return results
+
+
+def _run_sync(coro_func, *args, **kwargs):
+    """asyncio.run() for the sync wrappers, holding one of the process-wide core slots."""
+    with _sync_core_slots:
+        return asyncio.run(coro_func(*args, **kwargs))
+
+
+def check_v2ray_config(config_link, test_url=DEFAULT_TEST_URL, timeout=10, samples=1):
+    """
+    Test V2Ray config link by running v2ray and checking connection.
+
+    Safe to call from many threads: at most MAX_PARALLEL_CORES cores run at once.
+
+    Returns: (success: bool, message: str, latency_ms: float)
+    """
+    return as_tuple(_run_sync(
+        check_v2ray_config_async, config_link, test_url=test_url, timeout=timeout, samples=samples
+    ))
+
+
+def check_v2ray_configs(config_links, test_url=DEFAULT_TEST_URL, timeout=10, samples=1):
+    """
+    Test many config links inside a single v2ray process.
+
+    Returns: list of (success, message, latency_ms), in the order of config_links
+    """
+    results = _run_sync(check_v2ray_configs_async, config_links, test_url=test_url, timeout=timeout, samples=samples)
+    return [as_tuple(result) for result in results]